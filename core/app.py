@@ -17,7 +17,9 @@ sys.path.insert(0, project_root)
 import pandas as pd
 import numpy as np
 import json
+import math
 import datetime
+import threading
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -42,19 +44,24 @@ from core.config_loader import get_config
 from core.logger import setup_logger, get_logger
 from core.data_fetcher import MarketDataFetcher
 from core.model_cache import get_model_cache
+from core.batch_scheduler import BatchScheduler
+from core.model_registry import ModelRegistry
+from core.preloader import ModelPreloader
+from core.job_queue import JobQueue, QueueFull
 
 # 导入模型
 try:
-    from core.model import Kronos, KronosTokenizer, KronosPredictor
+    from core.model import FORECAST_QUANTILES, to_datetime64
     MODEL_AVAILABLE = True
 except ImportError as e:
     MODEL_AVAILABLE = False
     print(f"Warning: Kronos model not available: {e}")
 
 # Flask
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
 
 # Custom JSON provider for numpy types (Flask 3.x)
 class NumpyJSONProvider(DefaultJSONProvider):
@@ -100,11 +107,122 @@ CORS(app)
 fetcher = None
 predictor = None
 model_config = None
+# 切换当前模型（/api/load-model 与启动预加载）时持有，保证检查与替换是原子的
+model_lock = threading.Lock()
 model_cache = get_model_cache()
+# 多进程服务（core/serve.py）的工作进程池，单进程运行时为 None
+worker_pool = None
+# 本进程已切换到的共享模型选择代数，落后于 worker_pool 中的记录时在下次使用前切换
+model_generation = 0
+
+# 跨请求批处理：并发的 quick-predict 请求在短时间窗内合并为一次批量生成
+scheduler = BatchScheduler(
+    max_wait_ms=config.get('prediction.batching.max_wait_ms', 20),
+    max_batch_size=config.get('prediction.batching.max_batch_size', 16)
+) if config.get('prediction.batching.enabled', True) else None
+
+# 异步预测任务：长时间的预测提交后立即返回任务 ID，由有界线程池执行
+job_queue = JobQueue(
+    max_workers=config.get('prediction.jobs.max_workers', 1),
+    max_queued=config.get('prediction.jobs.max_queued', 100),
+    result_ttl=config.get('prediction.jobs.result_ttl', 600)
+)
 
 # Available models from config
 AVAILABLE_MODELS = config.get_all_models()
 
+# 常驻模型注册表：在内存预算内保留多个已加载模型，按最近最少使用淘汰
+registry = ModelRegistry(
+    AVAILABLE_MODELS,
+    cache_dir=os.path.join(project_root, 'cache', 'models'),
+    onnx_root=os.path.join(project_root, 'cache', 'onnx'),
+    memory_budget_mb=config.get('models.resident_memory_mb'),
+    predictor_options={
+        'memory_budget_mb': config.get('prediction.memory_budget_mb'),
+        'max_workers': config.get('prediction.max_workers', 1),
+        'warmup_batch_sizes': config.get('prediction.warmup_batch_sizes', [1]),
+        'draft_tokens': config.get('prediction.draft_tokens', 4),
+        # 按 (数据源, 代码, 周期) 缓存 tokenizer 编码状态，刷新时只编码新增K线
+        'encode_cache_size': config.get('prediction.encode_cache.max_symbols', 0),
+        'encode_cache_tolerance': config.get('prediction.encode_cache.tolerance', 0.05)
+    }
+)
+
+
+
+def preload_specs():
+    """启动时预加载的模型及其加载参数，默认为 models.default_model"""
+    keys = config.get('models.preload.models') or [config.get('models.default_model', 'kronos-small')]
+    return [
+        {
+            'model_key': key,
+            'device': AVAILABLE_MODELS[key].get('default_device', 'cpu'),
+            'precision': config.get('prediction.precision', 'float32'),
+            'compile_model': bool(config.get('prediction.compile', False)),
+            'speculative': bool(config.get('prediction.speculative', False))
+        }
+        for key in keys if key in AVAILABLE_MODELS
+    ]
+
+
+def adopt_preloaded(spec, loaded_predictor, loaded_config):
+    """预加载的默认模型成为当前模型，除非预加载期间已手动加载了模型"""
+    global predictor, model_config
+    with model_lock:
+        if predictor is None:
+            predictor, model_config = registry.get(**spec, pin=True)
+
+
+def follow_selected_model():
+    """
+    多进程部署时切换到其他工作进程通过 /api/load-model 选中的模型
+
+    Raises:
+        RuntimeError: 本进程加载选中的模型失败，下次请求时重试
+    """
+    global predictor, model_config, model_generation
+    if worker_pool is None:
+        return
+    generation, spec = worker_pool.selected_model()
+    if generation == model_generation:
+        return
+    with model_lock:
+        if generation == model_generation:
+            return
+        try:
+            predictor, model_config = registry.get(**spec, pin=True)
+        except Exception as e:
+            raise RuntimeError(f'Failed to load the selected model {spec["model_key"]}: {e}') from e
+        model_generation = generation
+
+
+def multiprocess_unsupported(state, hint):
+    """
+    任务队列保存在各工作进程内，多进程部署时后续请求可能落到其他进程，相关接口因此停用
+
+    Returns:
+        多个工作进程时为 409 响应，否则为 None
+    """
+    if worker_pool is None or worker_pool.workers <= 1:
+        return None
+    return jsonify({
+        'error': f'Not available with {worker_pool.workers} worker processes, which do not share {state}. '
+                 f'{hint} Set serve.workers to 1 to enable it.'
+    }), 409
+
+
+# 启动预加载：后台加载默认模型并以典型参数预热，完成前 /api/ready 返回 503
+preloader = ModelPreloader(
+    registry,
+    preload_specs() if MODEL_AVAILABLE and config.get('models.preload.enabled', True) else [],
+    warmup={
+        'lookback': config.get('prediction.default_lookback', 400),
+        'pred_len': config.get('prediction.default_pred_len', 120),
+        'sample_count': config.get('prediction.default_sample_count', 1)
+    } if config.get('models.preload.warmup', True) else None,
+    on_loaded=adopt_preloaded
+)
+
 # Popular symbols
 POPULAR_SYMBOLS = {
     'crypto': [
@@ -153,19 +271,48 @@ def status():
     # Get cache info
     cache_info = model_cache.get_cache_info()
 
+    try:
+        follow_selected_model()
+    except RuntimeError as e:
+        logger.error(str(e))
+
     return jsonify({
         'model_available': MODEL_AVAILABLE,
         'model_loaded': predictor is not None,
         'model_info': {
             'name': model_config['name'] if model_config else None,
-            'params': model_config['params'] if model_config else None
+            'params': model_config['params'] if model_config else None,
+            'precision': model_config.get('precision', 'float32'),
+            'backend': model_config.get('backend', 'torch')
         } if model_config else None,
         'cache_info': cache_info,
+        'scheduler': scheduler.get_stats() if scheduler else None,
+        'registry': registry.get_stats(),
+        'preload': preloader.get_status(),
+        'jobs': job_queue.get_stats(),
+        'worker': {'index': worker_pool.index, 'pid': os.getpid()} if worker_pool else None,
+        'encode_cache': dict(predictor.encode_cache.stats) if predictor is not None and predictor.encode_cache else None,
         'cuda_available': cuda_available,
         'version': config.get('app.version', '2.0.0')
     })
 
 
+@app.route('/api/ready')
+def ready():
+    """Readiness probe: 200 once the preloaded models are loaded and warmed up"""
+    status = preloader.get_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/api/workers')
+def workers():
+    """Per-worker health of the multi-process server; 503 when a worker is starting or unresponsive"""
+    if worker_pool is None:
+        return jsonify({'mode': 'single', 'current': None, 'healthy': True, 'workers': [{'index': 0, 'pid': os.getpid(), 'state': 'healthy'}]})
+    status = worker_pool.get_status()
+    return jsonify(status), 200 if status['healthy'] else 503
+
+
 @app.route('/api/models')
 def get_models():
     """Get available models"""
@@ -183,6 +330,8 @@ def get_models():
         model_info['cached'] = model_cached and tokenizer_cached
         model_info['model_cached'] = model_cached
         model_info['tokenizer_cached'] = tokenizer_cached
+        # 是否已常驻内存，切换到常驻模型无需重新加载
+        model_info['resident'] = registry.is_resident(key)
 
         models_info.append(model_info)
 
@@ -204,7 +353,7 @@ def get_models():
 @app.route('/api/load-model', methods=['POST'])
 def load_model():
     """Load Kronos model"""
-    global predictor, model_config
+    global predictor, model_config, model_generation
 
     if not MODEL_AVAILABLE:
         return jsonify({'error': 'Kronos model not available'}), 400
@@ -213,75 +362,41 @@ def load_model():
         data = request.get_json()
         model_key = data.get('model_key', 'kronos-small')
         device = data.get('device', 'cpu')
-        force_download = data.get('force_download', False)
-
-        if model_key not in AVAILABLE_MODELS:
-            return jsonify({'error': f'Unknown model: {model_key}'}), 400
-
-        model_cfg = AVAILABLE_MODELS[model_key]
+        precision = data.get('precision') or config.get('prediction.precision', 'float32')
+        compile_model = bool(data.get('compile', config.get('prediction.compile', False)))
+        speculative = bool(data.get('speculative', config.get('prediction.speculative', False)))
 
-        # Validate device availability
-        import torch
-        cuda_available = torch.cuda.is_available()
-        mps_available = hasattr(torch.backends, 'mps') and torch.backends.mps.is_available()
-
-        # Auto-downgrade to CPU if requested device is not available
-        if device.startswith('cuda') and not cuda_available:
-            logger.warning(f"CUDA requested but not available, downgrading to CPU")
-            device = 'cpu'
-        elif device == 'mps' and not mps_available:
-            logger.warning(f"MPS requested but not available, downgrading to CPU")
-            device = 'cpu'
-
-        logger.info(f"加载模型: {model_cfg['name']} on {device}")
+        spec = {'model_key': model_key, 'device': device, 'precision': precision,
+                'compile_model': compile_model, 'speculative': speculative}
 
-        # Get cache directory
-        cache_dir = os.path.join(project_root, 'cache', 'models')
-
-        # Load tokenizer separately
-        try:
-            logger.info(f"加载 tokenizer: {model_cfg['tokenizer_id']}")
-            tokenizer = KronosTokenizer.from_pretrained(
-                model_cfg['tokenizer_id'],
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-        except Exception as e:
-            logger.exception(f"Tokenizer 加载失败: {e}")
-            return jsonify({'error': f'Failed to load tokenizer: {str(e)}'}), 500
-
-        # Load model
-        try:
-            logger.info(f"加载模型: {model_cfg['model_id']}")
-            model = Kronos.from_pretrained(
-                model_cfg['model_id'],
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-        except Exception as e:
-            logger.exception(f"Model 加载失败: {e}")
-            return jsonify({'error': f'Failed to load model: {str(e)}'}), 500
-
-        # Create predictor
-        predictor = KronosPredictor(
-            model, tokenizer,
-            device=device,
-            max_context=model_cfg['context_length']
-        )
-        model_config = model_cfg
-
-        logger.info(f"模型加载成功: {model_cfg['name']}")
+        # 已常驻的模型直接复用，否则加载并在超出内存预算时淘汰最久未用的模型
+        with model_lock:
+            loaded_predictor, loaded_config = registry.get(**spec, pin=True)
+            predictor, model_config = loaded_predictor, loaded_config
+            # 多进程部署时记录选择，其余工作进程在各自的下一个请求前加载同一模型
+            if worker_pool is not None:
+                model_generation = worker_pool.select_model(spec)
 
         return jsonify({
             'success': True,
-            'message': f'Loaded {model_cfg["name"]} ({model_cfg["params"]}) on {device}',
+            'message': f'Loaded {loaded_config["name"]} ({loaded_config["params"]}) on {loaded_config["device"]} ({precision})',
             'model': {
-                'name': model_cfg['name'],
-                'params': model_cfg['params'],
-                'context_length': model_cfg['context_length']
-            }
+                'name': loaded_config['name'],
+                'params': loaded_config['params'],
+                'context_length': loaded_config['context_length'],
+                'precision': precision,
+                'compiled': compile_model,
+                'backend': loaded_config['backend'],
+                'speculative': speculative
+            },
+            'precision_report': loaded_predictor.precision_report
         })
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        logger.exception(f"模型加载失败: {e}")
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         logger.exception(f"模型加载失败: {e}")
         return jsonify({'error': f'Failed to load model: {str(e)}'}), 500
@@ -389,127 +504,387 @@ def fetch_data():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/quick-predict', methods=['POST'])
-def quick_predict():
-    """One-click fetch and predict"""
-    global predictor, fetcher
+def resolve_request_model(data):
+    """
+    请求使用的模型：可通过 model 字段指定（常驻或按需加载），不改变当前选中的模型
+
+    Returns:
+        (predictor, model_config)，未加载任何模型时 predictor 为 None
+    """
+    model_key = data.get('model')
+    if model_key:
+        return registry.resolve(model_key)
+    follow_selected_model()
+    return predictor, model_config
+
+
+def parse_quantiles(levels):
+    """
+    解析分位数水平：列表，或查询字符串中以逗号分隔的字符串
+
+    Raises:
+        BadRequest: 水平不是 [0, 1] 内的有限数
+    """
+    if isinstance(levels, str):
+        levels = [q for q in levels.split(',') if q.strip()]
+    if not isinstance(levels, (list, tuple)):
+        raise BadRequest('quantiles must be a list of levels in [0, 1]')
+    parsed = []
+    for q in levels:
+        try:
+            level = float(q)
+        except (TypeError, ValueError):
+            raise BadRequest(f'Invalid quantile level: {q!r}')
+        if not math.isfinite(level) or not 0 <= level <= 1:
+            raise BadRequest(f'Quantile level must be in [0, 1], got {q!r}')
+        parsed.append(level)
+    return parsed
 
-    if predictor is None:
-        return jsonify({'error': 'Model not loaded. Please load a model first.'}), 400
 
-    if fetcher is None:
-        fetcher = MarketDataFetcher()
+def prepare_quick_predict(data):
+    """
+    解析 quick-predict 请求参数并获取数据
 
-    try:
-        data = request.get_json()
-        source = data.get('source', 'binance')
-        symbol = data.get('symbol', 'BTCUSDT')
-        interval = data.get('interval', '1h')
-        lookback = int(data.get('lookback', 400))
-        pred_len = int(data.get('pred_len', 120))
-        temperature = float(data.get('temperature', 1.0))
-        top_p = float(data.get('top_p', 0.9))
-        sample_count = int(data.get('sample_count', 1))
+    Returns:
+        dict: 请求参数以及历史数据 df/history/values、模型输入 x/x_timestamp 与预测时间戳 y_timestamp
 
-        logger.info(f"开始预测: {symbol} ({source}), lookback={lookback}, pred_len={pred_len}")
+    Raises:
+        BadRequest: 请求参数或数据不满足预测要求
+    """
+    global fetcher
+    if fetcher is None:
+        fetcher = MarketDataFetcher()
 
-        # Fetch data (use fallback for A-stocks)
-        if source in ['akshare', 'baostock', 'tushare']:
-            df = fetcher.fetch_a_stock_with_fallback(symbol)
-        elif source == 'binance':
-            df = fetcher.fetch_binance(symbol, interval, limit=max(lookback + pred_len + 50, 600))
-        elif source == 'yahoo':
-            df = fetcher.fetch_yahoo(symbol, period='3mo', interval=interval)
-        else:
-            return jsonify({'error': f'Unknown source: {source}'}), 400
+    source = data.get('source', 'binance')
+    symbol = data.get('symbol', 'BTCUSDT')
+    interval = data.get('interval', '1h')
+    lookback = int(data.get('lookback', 400))
+    pred_len = int(data.get('pred_len', 120))
+    temperature = float(data.get('temperature', 1.0))
+    top_p = float(data.get('top_p', 0.9))
+    sample_count = int(data.get('sample_count', 1))
+    # Forecast bands only carry information with more than one sample
+    quantiles = parse_quantiles(data.get('quantiles', FORECAST_QUANTILES if sample_count > 1 else []))
+    return_samples = bool(data.get('return_samples', False))
+
+    logger.info(f"开始预测: {symbol} ({source}), lookback={lookback}, pred_len={pred_len}")
+
+    # Fetch data (use fallback for A-stocks)
+    if source in ['akshare', 'baostock', 'tushare']:
+        df = fetcher.fetch_a_stock_with_fallback(symbol)
+    elif source == 'binance':
+        df = fetcher.fetch_binance(symbol, interval, limit=max(lookback + pred_len + 50, 600))
+    elif source == 'yahoo':
+        df = fetcher.fetch_yahoo(symbol, period='3mo', interval=interval)
+    else:
+        raise BadRequest(f'Unknown source: {source}')
+
+    # Prepare inputs
+    if len(df) < lookback:
+        raise BadRequest(f'Insufficient data: got {len(df)} points, need {lookback}')
+
+    history = df.iloc[-lookback:]
+    values = history[['open', 'high', 'low', 'close', 'volume', 'amount']].to_numpy(np.float64)
+
+    # Calculate future timestamps
+    last_timestamp = df['timestamps'].iloc[-1]
+    time_diffs = df['timestamps'].diff().dropna()
+    time_diff = time_diffs.mode()[0] if len(time_diffs) > 0 else pd.Timedelta(hours=1)
+
+    y_timestamp = pd.date_range(
+        start=last_timestamp + time_diff,
+        periods=pred_len,
+        freq=time_diff
+    )
+
+    return {
+        'source': source,
+        'symbol': symbol,
+        'interval': interval,
+        'lookback': lookback,
+        'pred_len': pred_len,
+        'temperature': temperature,
+        'top_p': top_p,
+        'sample_count': sample_count,
+        'quantiles': quantiles,
+        'return_samples': return_samples,
+        'df': df,
+        'history': history,
+        'values': values,
+        'x': values.astype(np.float32),
+        'x_timestamp': to_datetime64(history['timestamps']),
+        'y_timestamp': y_timestamp,
+        'pred_times': [ts.isoformat() for ts in y_timestamp]
+    }
+
+
+def chart_points(timestamps, values):
+    # values: (n, 6) 数组，按列一次性转换为 Python 数值
+    return [
+        {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for ts, o, h, l, c, v in zip(timestamps, *values[:, :5].T.tolist())
+    ]
+
+
+def prediction_metadata(inputs, req_config):
+    return {
+        'symbol': inputs['symbol'],
+        'source': inputs['source'],
+        'interval': inputs['interval'],
+        'lookback': inputs['lookback'],
+        'pred_len': inputs['pred_len'],
+        'fetch_time': datetime.datetime.now().isoformat(),
+        'model': req_config['name']
+    }
+
+
+def prediction_stats(inputs, pred_closes):
+    """Calculate prediction statistics"""
+    last_close = float(inputs['df']['close'].iloc[-1])
+    pred_change = ((pred_closes[-1] - last_close) / last_close) * 100
+
+    logger.info(f"预测完成: {inputs['symbol']}, 预测涨跌: {pred_change:.2f}%")
+
+    return {
+        'last_price': last_close,
+        'pred_start': float(pred_closes[0]),
+        'pred_end': float(pred_closes[-1]),
+        'change_percent': pred_change,
+        'direction': 'up' if pred_change > 0 else 'down'
+    }
+
+
+def run_quick_predict(data, req_predictor, req_config, step_callback=None):
+    """
+    获取数据并预测，返回 quick-predict 的响应内容
+
+    Args:
+        step_callback: 生成进度回调，见 KronosPredictor.predict_arrays；指定时不经过批处理调度器
+
+    Raises:
+        BadRequest: 请求参数或数据不满足预测要求
+    """
+    inputs = prepare_quick_predict(data)
+    pred_len = inputs['pred_len']
+    return_samples = inputs['return_samples']
+    cache_key = (inputs['source'], inputs['symbol'], inputs['interval'])
+
+    # Make prediction
+    if scheduler is not None and step_callback is None:
+        # 与其他并发请求合并为同一批次生成
+        forecast = scheduler.predict(
+            req_predictor, inputs['x'], inputs['x_timestamp'], to_datetime64(inputs['y_timestamp']), pred_len,
+            T=inputs['temperature'],
+            top_p=inputs['top_p'],
+            sample_count=inputs['sample_count'],
+            quantiles=inputs['quantiles'],
+            return_samples=return_samples,
+            cache_key=cache_key
+        )
+    else:
+        forecast = req_predictor.predict_arrays(
+            inputs['x'],
+            inputs['x_timestamp'],
+            to_datetime64(inputs['y_timestamp']),
+            pred_len=pred_len,
+            T=inputs['temperature'],
+            top_p=inputs['top_p'],
+            sample_count=inputs['sample_count'],
+            quantiles=inputs['quantiles'],
+            return_samples=return_samples,
+            cache_key=cache_key,
+            step_callback=step_callback
+        )
+    pred = forecast['mean']
+
+    history_times = [ts.isoformat() if pd.notna(ts) else None for ts in pd.DatetimeIndex(inputs['history']['timestamps'])]
+    pred_times = inputs['pred_times']
+
+    # Build response
+    chart_data = {
+        'historical': chart_points(history_times, inputs['values']),
+        'prediction': chart_points(pred_times, pred),
+        # Quantile bands keyed by percentile, e.g. 'p5' .. 'p95'
+        'bands': {
+            f'p{round(q * 100)}': chart_points(pred_times, band)
+            for q, band in forecast['quantiles'].items()
+        }
+    }
+    if return_samples:
+        # Close price of every sampled trajectory
+        chart_data['trajectories'] = forecast['samples'][:, :, 3].tolist()
 
-        # Prepare inputs
-        if len(df) < lookback:
-            return jsonify({'error': f'Insufficient data: got {len(df)} points, need {lookback}'}), 400
+    return {
+        'success': True,
+        'chart_data': chart_data,
+        'metadata': prediction_metadata(inputs, req_config),
+        'prediction_stats': prediction_stats(inputs, pred[:, 3])
+    }
 
-        x_df = df.iloc[-lookback:][['open', 'high', 'low', 'close', 'volume', 'amount']]
-        x_timestamp = df.iloc[-lookback:]['timestamps']
 
-        # Calculate future timestamps
-        last_timestamp = df['timestamps'].iloc[-1]
-        time_diffs = df['timestamps'].diff().dropna()
-        time_diff = time_diffs.mode()[0] if len(time_diffs) > 0 else pd.Timedelta(hours=1)
+@app.route('/api/quick-predict', methods=['POST'])
+def quick_predict():
+    """One-click fetch and predict"""
+    data = request.get_json()
+    try:
+        req_predictor, req_config = resolve_request_model(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        logger.exception(f"模型加载失败: {e}")
+        return jsonify({'error': str(e)}), 500
+    if req_predictor is None:
+        return jsonify({'error': 'Model not loaded. Please load a model first.'}), 400
 
-        y_timestamp = pd.date_range(
-            start=last_timestamp + time_diff,
-            periods=pred_len,
-            freq=time_diff
-        )
+    try:
+        return jsonify(run_quick_predict(data, req_predictor, req_config))
+    except BadRequest as e:
+        return jsonify({'error': e.description}), 400
+    except Exception as e:
+        logger.exception(f"预测失败: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        # Make prediction
-        pred_df = predictor.predict(
-            df=x_df,
-            x_timestamp=x_timestamp,
-            y_timestamp=y_timestamp,
-            pred_len=pred_len,
-            T=temperature,
-            top_p=top_p,
-            sample_count=sample_count
-        )
 
-        # Build response
-        chart_data = {
-            'historical': [
-                {
-                    'timestamp': row['timestamps'].isoformat() if pd.notna(row['timestamps']) else None,
-                    'open': float(row['open']),
-                    'high': float(row['high']),
-                    'low': float(row['low']),
-                    'close': float(row['close']),
-                    'volume': float(row.get('volume', 0))
-                }
-                for _, row in df.iloc[-lookback:].iterrows()
-            ],
-            'prediction': [
-                {
-                    'timestamp': idx.isoformat() if hasattr(idx, 'isoformat') else str(idx),
-                    'open': float(row['open']),
-                    'high': float(row['high']),
-                    'low': float(row['low']),
-                    'close': float(row['close']),
-                    'volume': float(row.get('volume', 0))
-                }
-                for idx, row in pred_df.iterrows()
-            ]
-        }
+def sse_event(event, data):
+    """Server-Sent Events 格式的一条消息"""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
 
-        # Calculate prediction statistics
-        last_close = float(df['close'].iloc[-1])
-        pred_closes = pred_df['close'].values
-        pred_change = ((pred_closes[-1] - last_close) / last_close) * 100
 
-        logger.info(f"预测完成: {symbol}, 预测涨跌: {pred_change:.2f}%")
+@app.route('/api/quick-predict/stream', methods=['GET', 'POST'])
+def quick_predict_stream():
+    """
+    Fetch and predict, streaming the forecast as Server-Sent Events while it is generated.
 
-        return jsonify({
-            'success': True,
-            'chart_data': chart_data,
-            'metadata': {
-                'symbol': symbol,
-                'source': source,
-                'interval': interval,
-                'lookback': lookback,
-                'pred_len': pred_len,
-                'fetch_time': datetime.datetime.now().isoformat(),
-                'model': model_config['name'] if model_config else None
-            },
-            'prediction_stats': {
-                'last_price': last_close,
-                'pred_start': float(pred_closes[0]),
-                'pred_end': float(pred_closes[-1]),
-                'change_percent': pred_change,
-                'direction': 'up' if pred_change > 0 else 'down'
-            }
-        })
+    Takes the quick-predict parameters as a JSON body or query string, plus chunk_size (steps per chunk).
+    Events: 'meta' (metadata and historical chart data), 'chunk' (start, prediction and bands of the next
+    chunk_size steps), then 'done' (prediction_stats) or 'error'.
+    """
+    data = request.get_json(silent=True) or request.args.to_dict()
+    try:
+        req_predictor, req_config = resolve_request_model(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        logger.exception(f"模型加载失败: {e}")
+        return jsonify({'error': str(e)}), 500
+    if req_predictor is None:
+        return jsonify({'error': 'Model not loaded. Please load a model first.'}), 400
 
+    try:
+        inputs = prepare_quick_predict(data)
+        chunk_size = int(data.get('chunk_size', config.get('prediction.stream_chunk_size', 10)))
+    except BadRequest as e:
+        return jsonify({'error': e.description}), 400
     except Exception as e:
         logger.exception(f"预测失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+    def generate():
+        history_times = [ts.isoformat() if pd.notna(ts) else None for ts in pd.DatetimeIndex(inputs['history']['timestamps'])]
+        yield sse_event('meta', {
+            'metadata': prediction_metadata(inputs, req_config),
+            'historical': chart_points(history_times, inputs['values'])
+        })
+        pred_times = inputs['pred_times']
+        closes = []
+        # 客户端断开时生成器被关闭，预测随之在下一步停止
+        chunks = req_predictor.predict_stream(
+            inputs['x'],
+            inputs['x_timestamp'],
+            to_datetime64(inputs['y_timestamp']),
+            pred_len=inputs['pred_len'],
+            T=inputs['temperature'],
+            top_p=inputs['top_p'],
+            sample_count=inputs['sample_count'],
+            quantiles=inputs['quantiles'],
+            chunk_size=chunk_size,
+            cache_key=(inputs['source'], inputs['symbol'], inputs['interval'])
+        )
+        try:
+            for chunk in chunks:
+                times = pred_times[chunk['start']:chunk['start'] + len(chunk['mean'])]
+                closes.extend(chunk['mean'][:, 3].tolist())
+                yield sse_event('chunk', {
+                    'start': chunk['start'],
+                    'prediction': chart_points(times, chunk['mean']),
+                    'bands': {
+                        f'p{round(q * 100)}': chart_points(times, band)
+                        for q, band in chunk['quantiles'].items()
+                    }
+                })
+            yield sse_event('done', {'prediction_stats': prediction_stats(inputs, closes)})
+        except Exception as e:
+            logger.exception(f"预测失败: {e}")
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            chunks.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Submit a quick-predict request as an asynchronous job; returns its id right away"""
+    unsupported = multiprocess_unsupported('the job queue', 'Use /api/quick-predict/stream for progress instead.')
+    if unsupported:
+        return unsupported
+    data = request.get_json()
+    model_key = data.get('model')
+    if model_key and model_key not in AVAILABLE_MODELS:
+        return jsonify({'error': f'Unknown model: {model_key}'}), 400
+    if not model_key and predictor is None:
+        return jsonify({'error': 'Model not loaded. Please load a model first.'}), 400
+    try:
+        pred_len = int(data.get('pred_len', 120))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'pred_len must be an integer'}), 400
+    try:
+        parse_quantiles(data.get('quantiles', []))
+    except BadRequest as e:
+        return jsonify({'error': e.description}), 400
+
+    def run(job):
+        # 模型在工作线程中解析，按需加载不占用请求线程
+        req_predictor, req_config = resolve_request_model(data)
+        if req_predictor is None:
+            raise RuntimeError('Model not loaded. Please load a model first.')
+        try:
+            return run_quick_predict(data, req_predictor, req_config, step_callback=job.report)
+        except BadRequest as e:
+            raise ValueError(e.description)
+
+    try:
+        job = job_queue.submit(run, pred_len, meta={'symbol': data.get('symbol', 'BTCUSDT'), 'source': data.get('source', 'binance')})
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    logger.info(f"预测任务已提交: {job.id}")
+    return jsonify(job.to_dict()), 202
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Job status and progress; includes the quick-predict result once done"""
+    unsupported = multiprocess_unsupported('the job queue', 'Use /api/quick-predict/stream for progress instead.')
+    if unsupported:
+        return unsupported
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or stop a running one at its next generation step"""
+    unsupported = multiprocess_unsupported('the job queue', 'Use /api/quick-predict/stream for progress instead.')
+    if unsupported:
+        return unsupported
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict(include_result=False))
+
 
 @app.route('/api/export-prediction', methods=['POST'])
 def export_prediction():
@@ -586,6 +961,10 @@ def main():
     print(f"Open browser: http://localhost:{port}")
     print("=" * 60)
 
+    # 调试模式下重载器的父进程不处理请求，只在实际服务的进程中预加载
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        preloader.start()
+
     app.run(debug=debug, host=host, port=port)
 
 
@@ -0,0 +1,179 @@
+"""
+跨请求批处理调度模块
+将并发的预测请求合并为一次 predict_batch_arrays 调用，提升负载下的吞吐
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+try:
+    from .logger import get_logger
+    logger = get_logger()
+except:
+    logger = None
+
+
+def log_info(msg: str):
+    if logger:
+        logger.info(msg)
+    else:
+        print(f"[INFO] {msg}")
+
+
+class PredictJob:
+    """一次待处理的预测请求"""
+
+    def __init__(self, predictor, x, x_timestamp, y_timestamp, pred_len: int, T: float, top_k: int, top_p: float,
+                 sample_count: int, quantiles: List[float], return_samples: bool, cache_key=None):
+        self.predictor = predictor
+        self.x = x
+        self.x_timestamp = x_timestamp
+        self.y_timestamp = y_timestamp
+        self.pred_len = pred_len
+        self.T = T
+        self.top_k = top_k
+        self.top_p = top_p
+        self.sample_count = sample_count
+        self.quantiles = list(quantiles or [])
+        self.return_samples = return_samples
+        self.cache_key = cache_key
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+    @property
+    def batch_key(self):
+        """同一批次内的请求必须共享模型、预测长度与采样参数"""
+        return (id(self.predictor), self.pred_len, self.T, self.top_k, self.top_p, self.sample_count)
+
+
+class BatchScheduler:
+    """
+    跨请求批处理调度器
+
+    请求线程提交任务后阻塞等待结果；后台线程从第一个待处理任务到达起最多等待 max_wait_ms，
+    将期间到达的任务按 (模型, pred_len, 采样参数) 分组，每组合并为一次 predict_batch_arrays 调用，
+    历史长度不同的序列由 predict_batch_arrays 左填充后同批生成。一个批次生成期间到达的任务会在其结束后
+    立即组成下一批，因此满负载时调度线程不会空等。
+    """
+
+    def __init__(self, max_wait_ms: float = 20, max_batch_size: int = 16):
+        """
+        初始化调度器
+
+        Args:
+            max_wait_ms: 收集同批任务的最长等待时间（毫秒）
+            max_batch_size: 单批最多合并的序列数
+        """
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self._pending: List[PredictJob] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'batches': 0, 'jobs': 0, 'max_batch': 0}
+
+    def submit(self, predictor, x, x_timestamp, y_timestamp, pred_len: int, T: float = 1.0, top_k: int = 0,
+               top_p: float = 0.9, sample_count: int = 1, quantiles: Optional[List[float]] = None,
+               return_samples: bool = False, cache_key=None) -> Future:
+        """
+        提交预测任务
+
+        Args:
+            x: 历史数据数组 (lookback, 6)，列为 open/high/low/close/volume/amount
+            x_timestamp, y_timestamp: 历史与预测时间戳（datetime64 数组）
+            cache_key: 序列标识（如 (数据源, 代码, 周期)），用于复用该序列上次的 tokenizer 编码状态
+
+        Returns:
+            Future，结果与 predictor.predict_arrays(..., quantiles=quantiles) 的返回值相同：
+            包含 'mean'、'quantiles' 以及可选 'samples' 的数组字典
+        """
+        job = PredictJob(predictor, x, x_timestamp, y_timestamp, pred_len, T, top_k, top_p, sample_count,
+                         quantiles, return_samples, cache_key)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='BatchScheduler', daemon=True)
+                self._thread.start()
+            self._pending.append(job)
+            self._cond.notify()
+        return job.future
+
+    def predict(self, predictor, x, x_timestamp, y_timestamp, pred_len: int, **kwargs) -> Dict[str, Any]:
+        """提交任务并阻塞等待结果"""
+        return self.submit(predictor, x, x_timestamp, y_timestamp, pred_len, **kwargs).result()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计信息"""
+        with self._cond:
+            stats = dict(self._stats, pending=len(self._pending))
+        stats['avg_batch'] = round(stats['jobs'] / stats['batches'], 2) if stats['batches'] else 0
+        return stats
+
+    def _collect(self) -> List[PredictJob]:
+        """等待并取出下一批任务"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0].submitted_at + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            jobs, self._pending = self._pending, []
+        return jobs
+
+    def _loop(self):
+        while True:
+            jobs = self._collect()
+            groups: Dict[tuple, List[PredictJob]] = {}
+            for job in jobs:
+                groups.setdefault(job.batch_key, []).append(job)
+            for group in groups.values():
+                for start in range(0, len(group), self.max_batch_size):
+                    self._run(group[start:start + self.max_batch_size])
+
+    def _run(self, jobs: List[PredictJob]):
+        """以一次 predict_batch_arrays 执行同组任务，并把结果分发给各自的调用方"""
+        first = jobs[0]
+        quantiles = sorted({q for job in jobs for q in job.quantiles})
+        return_samples = any(job.return_samples for job in jobs)
+        try:
+            forecasts = first.predictor.predict_batch_arrays(
+                [job.x for job in jobs],
+                [job.x_timestamp for job in jobs],
+                [job.y_timestamp for job in jobs],
+                pred_len=first.pred_len,
+                T=first.T,
+                top_k=first.top_k,
+                top_p=first.top_p,
+                sample_count=first.sample_count,
+                verbose=False,
+                quantiles=quantiles,
+                return_samples=return_samples,
+                cache_keys=[job.cache_key for job in jobs]
+            )
+        except Exception as e:
+            if len(jobs) == 1:
+                first.future.set_exception(e)
+                return
+            # 逐个重试，使输入有误的请求只影响自身
+            for job in jobs:
+                self._run([job])
+            return
+
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['jobs'] += len(jobs)
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(jobs))
+        if len(jobs) > 1:
+            log_info(f"批处理完成: {len(jobs)} 个请求合并为一批")
+
+        for job, forecast in zip(jobs, forecasts):
+            result = {
+                'mean': forecast['mean'],
+                'quantiles': {q: forecast['quantiles'][q] for q in job.quantiles}
+            }
+            if job.return_samples:
+                result['samples'] = forecast['samples']
+            job.future.set_result(result)
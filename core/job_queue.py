@@ -0,0 +1,213 @@
+"""
+异步预测任务队列模块
+提交后立即返回任务 ID，由有界线程池执行，客户端轮询进度与结果或中途取消
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from .logger import get_logger
+    logger = get_logger()
+except:
+    logger = None
+
+
+def log_info(msg: str):
+    if logger:
+        logger.info(msg)
+    else:
+        print(f"[INFO] {msg}")
+
+
+def log_error(msg: str):
+    if logger:
+        logger.error(msg)
+    else:
+        print(f"[ERROR] {msg}")
+
+
+class JobCancelled(Exception):
+    """任务已被取消，由进度回调抛出以中止生成"""
+
+
+class QueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    """一个异步预测任务"""
+
+    def __init__(self, func: Callable, total_steps: int, meta: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.meta = meta or {}
+        self.status = 'queued'
+        self.steps = 0
+        self.total_steps = total_steps
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def report(self, steps: int):
+        """进度回调：记录已完成步数，任务被取消时抛出 JobCancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.steps = steps
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """任务状态，完成后包含结果"""
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'cancel_requested': self._cancel.is_set(),
+            'progress': {
+                'steps': self.steps,
+                'total': self.total_steps,
+                'percent': round(100 * self.steps / self.total_steps, 1) if self.total_steps else 0
+            },
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            **self.meta
+        }
+        if self.error is not None:
+            data['error'] = self.error
+        if include_result and self.status == 'done':
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    异步任务队列
+
+    任务由最多 max_workers 个工作线程执行，超出的任务排队。单个任务的生成已使用进程的全部 torch 线程，
+    多个任务并行只会争用同一批核心，因此默认逐个执行；排队与运行中的任务总数超过 max_queued 时拒绝提交。
+    任务函数接收 Job，并应将 job.report 作为生成的进度回调传入，使进度可查询、取消可在下一步生效。
+    已结束的任务保留 result_ttl 秒后清除。
+    """
+
+    def __init__(self, max_workers: Optional[int] = 1, max_queued: int = 100, result_ttl: float = 600):
+        """
+        初始化任务队列
+
+        Args:
+            max_workers: 同时执行的任务数，None 视为 1
+            max_queued: 未结束任务数上限
+            result_ttl: 已结束任务的保留时间（秒）
+        """
+        self.max_workers = max(1, int(max_workers or 1))
+        self.max_queued = max(1, int(max_queued))
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='PredictJob')
+        self._stats = {'submitted': 0, 'done': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0}
+
+    def submit(self, func: Callable, total_steps: int, meta: Optional[Dict[str, Any]] = None) -> Job:
+        """
+        提交任务
+
+        Args:
+            func: 任务函数 func(job)，返回值作为任务结果
+            total_steps: 总步数（预测长度），用于计算进度
+            meta: 附加在任务状态中的信息
+
+        Raises:
+            QueueFull: 未结束任务数已达上限
+        """
+        job = Job(func, total_steps, meta)
+        with self._lock:
+            self._purge()
+            active = sum(1 for j in self._jobs.values() if not j.finished)
+            if active >= self.max_queued:
+                self._stats['rejected'] += 1
+                raise QueueFull(f"Too many pending jobs ({active}), try again later")
+            self._jobs[job.id] = job
+            self._stats['submitted'] += 1
+            job.future = self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务，不存在或已过期时返回 None"""
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        取消任务：排队中的任务直接取消，运行中的任务在下一个生成步中止
+
+        Returns:
+            任务，不存在或已过期时返回 None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job._cancel.set()
+            if job.future.cancel():
+                self._finish(job, 'cancelled')
+        return job
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息"""
+        with self._lock:
+            self._purge()
+            counts = {'queued': 0, 'running': 0}
+            for job in self._jobs.values():
+                if job.status in counts:
+                    counts[job.status] += 1
+            return dict(self._stats, **counts, stored=len(self._jobs), max_workers=self.max_workers)
+
+    def _run(self, job: Job):
+        with self._lock:
+            if job._cancel.is_set():
+                self._finish(job, 'cancelled')
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+        try:
+            result = job.func(job)
+        except JobCancelled:
+            log_info(f"任务已取消: {job.id}")
+            with self._lock:
+                self._finish(job, 'cancelled')
+            return
+        except Exception as e:
+            log_error(f"任务失败: {job.id}, {e}")
+            with self._lock:
+                job.error = str(e)
+                self._finish(job, 'failed')
+            return
+        with self._lock:
+            job.result = result
+            job.steps = job.total_steps
+            self._finish(job, 'done')
+
+    def _finish(self, job: Job, status: str):
+        """在持有锁时标记任务结束"""
+        job.status = status
+        job.finished_at = time.time()
+        job.func = None
+        self._stats[status] += 1
+
+    def _purge(self):
+        """在持有锁时清除过期任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
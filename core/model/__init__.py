@@ -1,4 +1,4 @@
-from .kronos import KronosTokenizer, Kronos, KronosPredictor
+from .kronos import KronosTokenizer, Kronos, KronosPredictor, FORECAST_QUANTILES, PRECISIONS, to_datetime64
 
 model_dict = {
     'kronos_tokenizer': KronosTokenizer,
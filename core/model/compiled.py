@@ -0,0 +1,231 @@
+"""
+Compiled, shape-bucketed decoding steps for Kronos generation.
+"""
+
+from contextlib import nullcontext
+
+import torch
+import torch.nn.functional as F
+
+from .module import KVCache
+
+
+# Padded batch sizes of the compiled step; larger batches run eagerly
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Smallest cache length bucket; buckets double up to the model's max context
+MIN_CONTEXT_BUCKET = 64
+
+
+def context_buckets(max_context):
+    """Cache lengths compiled for a model with context `max_context`: powers of two, capped at `max_context`."""
+    buckets = []
+    size = MIN_CONTEXT_BUCKET
+    while size < max_context:
+        buckets.append(size)
+        size *= 2
+    buckets.append(max_context)
+    return tuple(buckets)
+
+
+def _pad_rows(x, rows):
+    """Zero-pads dim 0 of `x` to `rows`. The result has default strides, which compiled graphs are specialized on."""
+    if x.size(0) == rows:
+        return x.clone(memory_format=torch.contiguous_format)
+    return torch.cat([x, x.new_zeros(rows - x.size(0), *x.shape[1:])], dim=0)
+
+
+def _attend_step(attn, q, k, v, slot, valid, keys, values):
+    """Writes one position into the cache slots and attends over all valid slots."""
+    keys.index_copy_(2, slot, k)
+    values.index_copy_(2, slot, v)
+    out = F.scaled_dot_product_attention(q, keys, values, attn_mask=valid)
+    return attn.out_proj(out.transpose(1, 2).reshape(q.size(0), 1, attn.d_model))
+
+
+def _split_heads(attn, x):
+    return x.view(x.size(0), 1, attn.n_heads, attn.head_dim).transpose(1, 2)
+
+
+def decode_s1_step(model, s1_ids, s2_ids, time_embedding, cos, sin, slot, valid, keys, values):
+    """
+    Single-position `Kronos.decode_s1` over a fixed-size cache.
+
+    Args:
+        time_embedding (torch.Tensor, optional): Temporal embedding, one row per batch row. Shape: [batch_size, 1, d_model]
+        cos, sin (torch.Tensor): Rotary table rows of the new position. Shape: [1, 1, 1, head_dim]
+        slot (torch.Tensor): Cache slot of the new position. Shape: [1]
+        valid (torch.Tensor): Bool mask of the slots holding unpadded positions in the window.
+            Shape: [batch_size, 1, 1, cache_len]
+        keys, values (List[torch.Tensor]): Cache buffers of the Transformer blocks, updated in place.
+    """
+    x = model.embedding([s1_ids, s2_ids])
+    if time_embedding is not None:
+        x = x + time_embedding
+    for i, layer in enumerate(model.transformer):
+        attn = layer.self_attn
+        h = layer.norm1(x)
+        q, k, v = _split_heads(attn, attn.q_proj(h)), _split_heads(attn, attn.k_proj(h)), _split_heads(attn, attn.v_proj(h))
+        cos_q, sin_q = cos.to(q.dtype), sin.to(q.dtype)
+        q = q * cos_q + attn.rotary._rotate_half(q) * sin_q
+        k = k * cos_q + attn.rotary._rotate_half(k) * sin_q
+        x = x + _attend_step(attn, q, k, v, slot, valid, keys[i], values[i])
+        x = x + layer.ffn(layer.norm2(x))
+    x = model.norm(x)
+    return model.head(x), x
+
+
+def decode_s2_step(model, context, s1_ids, slot, valid, keys, values):
+    """Single-position `Kronos.decode_s2` over a fixed-size cache; see `decode_s1_step`."""
+    dep = model.dep_layer
+    attn = dep.cross_attn
+    sibling_embed = model.embedding.emb_s1(s1_ids)
+    q = _split_heads(attn, attn.q_proj(sibling_embed))
+    k, v = _split_heads(attn, attn.k_proj(context)), _split_heads(attn, attn.v_proj(context))
+    attn_out = _attend_step(attn, q, k, v, slot, valid, keys, values)
+    return model.head.cond_forward(dep.norm(context + attn_out))
+
+
+class BucketedKVCache(KVCache):
+    """
+    `KVCache` whose batch is padded to a bucket size when the first pass fills it.
+
+    Buffers are zero-initialized: compiled steps read every slot, and masked slots must not hold NaNs.
+    """
+
+    def __init__(self, n_layers, max_len):
+        super().__init__(n_layers, max_len)
+        self.batch_size = None
+
+    def update(self, layer_idx, k, v):
+        if self.keys[layer_idx] is None:
+            self.keys[layer_idx] = k.new_zeros(k.size(0), k.size(1), self.max_len, k.size(3))
+            self.values[layer_idx] = v.new_zeros(v.size(0), v.size(1), self.max_len, v.size(3))
+        return super().update(layer_idx, k, v)
+
+
+class CompiledKronos:
+    """
+    Runs the per-step `decode_s1` / `decode_s2` graphs of a `Kronos` model through `torch.compile`.
+
+    Exposes the `init_kv_cache` / `decode_s1` / `decode_s2` interface used by `auto_regressive_inference`.
+    The first pass over a window fills the cache eagerly. Every following single-token step runs a compiled graph
+    that attends over all slots of the cache with a validity mask, so its shapes depend only on the batch and cache
+    size: batches are zero-padded to the next of `batch_buckets` and caches rounded up to the next context bucket,
+    which bounds the number of graphs. Position-dependent values and the padding of ragged batches enter as
+    tensors (slot index and validity mask), so steps never recompile. The graphs live on this object and are
+    reused across requests; inductor also keeps the generated code on disk.
+
+    Args:
+        model (Kronos): Model in eval mode.
+        max_context (int): Largest cache length.
+        batch_buckets (Sequence[int]): Padded batch sizes; larger batches run eagerly.
+    """
+
+    def __init__(self, model, max_context, batch_buckets=BATCH_BUCKETS):
+        self.model = model
+        self.max_context = max_context
+        self.batch_buckets = tuple(sorted(batch_buckets))
+        self.context_buckets = context_buckets(max_context)
+        self.n_layers = model.n_layers
+        self.rotary = model.transformer[0].self_attn.rotary
+
+        # Two graphs per (batch, context) bucket; let dynamo keep all of them. The limit is named
+        # cache_size_limit before torch 2.6
+        n_graphs = len(self.batch_buckets) * len(self.context_buckets)
+        dynamo_config = torch._dynamo.config
+        limit = 'recompile_limit' if hasattr(dynamo_config, 'recompile_limit') else 'cache_size_limit'
+        setattr(dynamo_config, limit, max(getattr(dynamo_config, limit), n_graphs))
+        self._decode_s1 = torch.compile(decode_s1_step, dynamic=False)
+        self._decode_s2 = torch.compile(decode_s2_step, dynamic=False)
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def init_kv_cache(self, max_len):
+        max_len = next(b for b in self.context_buckets if b >= min(max_len, self.max_context))
+        return BucketedKVCache(self.n_layers + 1, max_len)
+
+    def _batch_bucket(self, batch_size):
+        return next((b for b in self.batch_buckets if b >= batch_size), batch_size)
+
+    def _step_inputs(self, kv_cache):
+        device = self.model.norm.weight.device
+        pos = kv_cache.seq_len - 1
+        cos, sin = self.rotary.reserve(pos + 1)
+        slot = torch.tensor([pos % kv_cache.max_len], device=device)
+        valid = torch.arange(kv_cache.max_len, device=device) <= pos
+        if kv_cache.padding is not None:
+            valid = valid & ~kv_cache.padding
+        else:
+            valid = valid.expand(kv_cache.batch_size, -1).contiguous()
+        return cos[0, 0, pos].view(1, 1, 1, -1), sin[0, 0, pos].view(1, 1, 1, -1), slot, valid.view(-1, 1, 1, kv_cache.max_len)
+
+    def _compiled(self, kv_cache, q_len, layer_idx):
+        """Whether a pass of `q_len` positions can run the compiled step: single token, buffers already filled."""
+        return q_len == 1 and kv_cache.keys[layer_idx] is not None and kv_cache.batch_size in self.batch_buckets
+
+    def decode_s1(self, s1_ids, s2_ids, stamp=None, padding_mask=None, kv_cache=None, last_only=False, time_embedding=None):
+        if not isinstance(kv_cache, BucketedKVCache):
+            return self.model.decode_s1(s1_ids, s2_ids, stamp, padding_mask, kv_cache, last_only, time_embedding)
+
+        batch_size = s1_ids.size(0)
+        if kv_cache.batch_size is None:
+            kv_cache.batch_size = self._batch_bucket(batch_size)
+        rows = kv_cache.batch_size
+        if time_embedding is None and stamp is not None:
+            time_embedding = self.model.time_emb(stamp)
+        if time_embedding is not None and time_embedding.size(0) != batch_size:
+            time_embedding = time_embedding.repeat_interleave(batch_size // time_embedding.size(0), dim=0)
+        s1_ids, s2_ids = _pad_rows(s1_ids, rows), _pad_rows(s2_ids, rows)
+        time_embedding = _pad_rows(time_embedding, rows) if time_embedding is not None else None
+        padding_mask = _pad_rows(padding_mask, rows) if padding_mask is not None else None
+
+        if self._compiled(kv_cache, s1_ids.size(1), 0):
+            kv_cache.advance(1, padding_mask)
+            s1_logits, context = self._decode_s1(self.model, s1_ids, s2_ids, time_embedding, *self._step_inputs(kv_cache),
+                                                 kv_cache.keys[:self.n_layers], kv_cache.values[:self.n_layers])
+        else:
+            s1_logits, context = self.model.decode_s1(s1_ids, s2_ids, padding_mask=padding_mask, kv_cache=kv_cache,
+                                                      last_only=last_only, time_embedding=time_embedding)
+        return s1_logits[:batch_size], context[:batch_size]
+
+    def decode_s2(self, context, s1_ids, padding_mask=None, kv_cache=None):
+        # The bucketed cache already holds the padding of the preceding decode_s1 call
+        if not isinstance(kv_cache, BucketedKVCache):
+            return self.model.decode_s2(context, s1_ids, padding_mask, kv_cache)
+
+        batch_size = s1_ids.size(0)
+        rows = kv_cache.batch_size
+        context, s1_ids = _pad_rows(context, rows), _pad_rows(s1_ids, rows)
+        if self._compiled(kv_cache, context.size(1), self.n_layers):
+            _, _, slot, valid = self._step_inputs(kv_cache)
+            s2_logits = self._decode_s2(self.model, context, s1_ids, slot, valid,
+                                        kv_cache.keys[self.n_layers], kv_cache.values[self.n_layers])
+        else:
+            s2_logits = self.model.decode_s2(context, s1_ids, kv_cache=kv_cache)
+        return s2_logits[:batch_size]
+
+    @torch.no_grad()
+    def warmup(self, batch_sizes=(1,), cache_lens=None, amp_dtype=None):
+        """
+        Compiles the step graphs for the given batch sizes and cache lengths ahead of the first request.
+
+        Args:
+            batch_sizes (Sequence[int]): Expanded batch sizes (series x samples) to prepare.
+            cache_lens (Sequence[int], optional): Cache lengths to prepare. Defaults to every context bucket, so
+                no request compiles a graph.
+            amp_dtype (torch.dtype, optional): Autocast dtype generation runs under.
+        """
+        device = self.model.norm.weight.device
+        for cache_len in cache_lens or self.context_buckets:
+            for batch_size in batch_sizes:
+                kv_cache = self.init_kv_cache(cache_len)
+                ids = torch.zeros(batch_size, 2, dtype=torch.long, device=device)
+                stamp = torch.zeros(batch_size, 2, 5, device=device)
+                with torch.autocast(device.type, dtype=amp_dtype) if amp_dtype is not None else nullcontext():
+                    for t in range(2):
+                        q = slice(None) if t == 0 else slice(1, 2)
+                        _, context = self.decode_s1(ids[:, q], ids[:, q], stamp[:, q], kv_cache=kv_cache, last_only=True)
+                        self.decode_s2(context, ids[:, 1:2], kv_cache=kv_cache)
@@ -3,11 +3,20 @@ import pandas as pd
 import torch
 from huggingface_hub import PyTorchModelHubMixin
 import sys
+import copy
+import queue
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
-from tqdm import trange
+from tqdm import tqdm, trange
 
 # Import from local module
 from .module import *
+from .sampling import sample_from_logits, filtered_probs
+from .compiled import CompiledKronos
+from .token_cache import EncoderTokenCache
 
 
 class KronosTokenizer(nn.Module, PyTorchModelHubMixin):
@@ -71,6 +80,27 @@ class KronosTokenizer(nn.Module, PyTorchModelHubMixin):
         self.post_quant_embed = nn.Linear(in_features=self.codebook_dim, out_features=self.d_model) # Linear layer after quantization (full codebook)
         self.tokenizer = BSQuantizer(self.s1_bits, self.s2_bits, beta, gamma0, gamma, zeta, group_size) # BSQuantizer module
 
+        # post_quant_embed folded into per-index tables for half-mode decoding, see `fold`
+        self.register_buffer('decode_table_s1', None, persistent=False)
+        self.register_buffer('decode_table_s2', None, persistent=False)
+
+    @torch.no_grad()
+    def fold(self):
+        """
+        Folds `post_quant_embed` into lookup tables for half-mode `decode`.
+
+        The bits of the s1 and s2 indices feed disjoint columns of the linear layer, so its output is
+        the sum of one row per s1 index and one per s2 index (the bias folded into the latter). In eval
+        mode `decode(x, half=True)` then uses two gathers instead of bit expansion and a matmul. Call
+        again after the weights change.
+        """
+        half_dim = self.codebook_dim // 2
+        indices = torch.arange(2 ** half_dim, device=self.post_quant_embed.weight.device)
+        bits = self.indices_to_bits((indices, indices), half=True)
+        w_s1, w_s2 = self.post_quant_embed.weight.split(half_dim, dim=1)
+        self.decode_table_s1 = bits[:, :half_dim] @ w_s1.t()
+        self.decode_table_s2 = bits[:, half_dim:] @ w_s2.t() + self.post_quant_embed.bias
+
     def forward(self, x):
         """
         Forward pass of the KronosTokenizer.
@@ -139,40 +169,71 @@ class KronosTokenizer(nn.Module, PyTorchModelHubMixin):
         x = x * q_scale
         return x
 
-    def encode(self, x, half=False):
+    def init_encoder_cache(self, max_len, window=None):
+        """
+        Creates a key/value cache for the encoder, see `encode`.
+
+        Args:
+            max_len (int): Maximum number of positions to cache.
+            window (int, optional): Attention window when smaller than `max_len`, see `KVCache`.
+
+        Returns:
+            KVCache: An empty cache.
+        """
+        return KVCache(len(self.encoder), max_len, window)
+
+    def init_decoder_cache(self, max_len, window=None):
+        """Creates a key/value cache for the decoder, see `decode` and `init_encoder_cache`."""
+        return KVCache(len(self.decoder), max_len, window)
+
+    def encode(self, x, half=False, padding_mask=None, kv_cache=None):
         """
         Encodes the input data into quantized indices.
 
         Args:
             x (torch.Tensor): Input tensor of shape (batch_size, seq_len, d_in).
             half (bool, optional): Whether to use half quantization in BSQuantizer. Defaults to False.
+            padding_mask (torch.Tensor, optional): True at padded positions, which no other position attends to.
+                Shape: (batch_size, seq_len). Defaults to None.
+            kv_cache (KVCache, optional): Cache from `init_encoder_cache`. The encoder blocks are causal, so `x` may
+                then hold just the steps following those already cached; only these are encoded.
 
         Returns:
             torch.Tensor: Quantized indices from BSQuantizer.
         """
+        if kv_cache is not None:
+            kv_cache.advance(x.size(1), padding_mask)
         z = self.embed(x)
-        for layer in self.encoder:
-            z = layer(z)
+        for i, layer in enumerate(self.encoder):
+            z = layer(z, key_padding_mask=padding_mask, kv_cache=kv_cache, layer_idx=i)
         z = self.quant_embed(z)
 
         bsq_loss, quantized, z_indices = self.tokenizer(z, half=half, collect_metrics=False)
         return z_indices
 
-    def decode(self, x, half=False):
+    def decode(self, x, half=False, padding_mask=None, kv_cache=None):
         """
         Decodes quantized indices back to the input data space.
 
         Args:
             x (torch.Tensor): Quantized indices tensor.
             half (bool, optional): Whether the indices were generated with half quantization. Defaults to False.
+            padding_mask (torch.Tensor, optional): True at padded positions, see `encode`. Defaults to None.
+            kv_cache (KVCache, optional): Cache from `init_decoder_cache`. The decoder blocks are causal, so `x` may
+                then hold just the steps following those already cached; only these are decoded.
 
         Returns:
             torch.Tensor: Reconstructed output tensor of shape (batch_size, seq_len, d_in).
         """
-        quantized = self.indices_to_bits(x, half)
-        z = self.post_quant_embed(quantized)
-        for layer in self.decoder:
-            z = layer(z)
+        if half and self.decode_table_s1 is not None and not self.training:
+            z = F.embedding(x[0], self.decode_table_s1) + F.embedding(x[1], self.decode_table_s2)
+        else:
+            quantized = self.indices_to_bits(x, half)
+            z = self.post_quant_embed(quantized)
+        if kv_cache is not None:
+            kv_cache.advance(z.size(1), padding_mask)
+        for i, layer in enumerate(self.decoder):
+            z = layer(z, key_padding_mask=padding_mask, kv_cache=kv_cache, layer_idx=i)
         z = self.head(z)
         return z
 
@@ -275,7 +336,35 @@ class Kronos(nn.Module, PyTorchModelHubMixin):
         s2_logits = self.head.cond_forward(x2)
         return s1_logits, s2_logits
 
-    def decode_s1(self, s1_ids, s2_ids, stamp=None, padding_mask=None):
+    def init_kv_cache(self, max_len, window=None):
+        """
+        Creates a key/value cache for incremental decoding with `decode_s1` / `decode_s2`.
+
+        The cache holds one slot per Transformer block plus one for the dependency-aware layer.
+
+        Args:
+            max_len (int): Maximum number of positions to cache, typically the context length.
+            window (int, optional): Attention window when smaller than `max_len`, see `KVCache`.
+
+        Returns:
+            KVCache: An empty cache.
+        """
+        return KVCache(self.n_layers + 1, max_len, window)
+
+    def embed_time(self, stamp):
+        """
+        Temporal embedding of a stamp track, e.g. history and horizon of a forecast, computed once so generation
+        steps can pass slices of it to `decode_s1` as `time_embedding`.
+
+        Args:
+            stamp (torch.Tensor): Temporal stamp tensor. Shape: [batch_size, seq_len, 5]
+
+        Returns:
+            torch.Tensor: Shape [batch_size, seq_len, d_model]
+        """
+        return self.time_emb(stamp)
+
+    def decode_s1(self, s1_ids, s2_ids, stamp=None, padding_mask=None, kv_cache=None, last_only=False, time_embedding=None):
         """
         Decodes only the s1 tokens.
 
@@ -286,28 +375,47 @@ class Kronos(nn.Module, PyTorchModelHubMixin):
             s1_ids (torch.Tensor): Input tensor of s1 token IDs. Shape: [batch_size, seq_len]
             s2_ids (torch.Tensor): Input tensor of s2 token IDs. Shape: [batch_size, seq_len]
             stamp (torch.Tensor, optional): Temporal stamp tensor. Shape: [batch_size, seq_len]. Defaults to None.
-            padding_mask (torch.Tensor, optional): Mask for padding tokens. Shape: [batch_size, seq_len]. Defaults to None.
+                May also hold one row per group of `batch_size // stamp.size(0)` consecutive rows sharing
+                timestamps, e.g. the samples of one series; its embedding is then broadcast over each group.
+            padding_mask (torch.Tensor, optional): True at padding tokens, which no other position attends to.
+                Shape: [batch_size, seq_len]. With a `kv_cache` it covers the new positions and is recorded in the
+                cache for later passes. Defaults to None.
+            kv_cache (KVCache, optional): Cache from `init_kv_cache`. When given, the inputs only hold the
+                positions following those already cached, and the outputs cover just these positions.
+            last_only (bool, optional): Project only the last position to s1 logits, as needed for generation.
+                The context is still returned for every position. Defaults to False.
+            time_embedding (torch.Tensor, optional): Precomputed `embed_time` of the stamp, used in place of `stamp`.
+                Shape: [batch_size, seq_len, d_model], with the same row grouping as `stamp`. Defaults to None.
 
         Returns:
             Tuple[torch.Tensor, torch.Tensor]:
-                - s1 logits: Logits for s1 token predictions. Shape: [batch_size, seq_len, s1_vocab_size]
+                - s1 logits: Logits for s1 token predictions. Shape: [batch_size, seq_len, s1_vocab_size],
+                  or [batch_size, 1, s1_vocab_size] with `last_only`
                 - context: Context representation from the Transformer. Shape: [batch_size, seq_len, d_model]
         """
+        if kv_cache is not None:
+            kv_cache.advance(s1_ids.size(1), padding_mask)
+
         x = self.embedding([s1_ids, s2_ids])
-        if stamp is not None:
+        if time_embedding is None and stamp is not None:
             time_embedding = self.time_emb(stamp)
-            x = x + time_embedding
+        if time_embedding is not None:
+            if time_embedding.size(0) != x.size(0):
+                group = x.size(0) // time_embedding.size(0)
+                x = (x.view(-1, group, *x.shape[1:]) + time_embedding.unsqueeze(1)).view(x.shape)
+            else:
+                x = x + time_embedding
         x = self.token_drop(x)
 
-        for layer in self.transformer:
-            x = layer(x, key_padding_mask=padding_mask)
+        for i, layer in enumerate(self.transformer):
+            x = layer(x, key_padding_mask=padding_mask, kv_cache=kv_cache, layer_idx=i)
 
         x = self.norm(x)
 
-        s1_logits = self.head(x)
+        s1_logits = self.head(x[:, -1:] if last_only else x)
         return s1_logits, x
 
-    def decode_s2(self, context, s1_ids, padding_mask=None):
+    def decode_s2(self, context, s1_ids, padding_mask=None, kv_cache=None):
         """
         Decodes the s2 tokens, conditioned on the context and s1 tokens.
 
@@ -317,101 +425,98 @@ class Kronos(nn.Module, PyTorchModelHubMixin):
         Args:
             context (torch.Tensor): Context representation from the transformer (output of decode_s1).
                                      Shape: [batch_size, seq_len, d_model]
-            s1_ids (torch.torch.Tensor): Input tensor of s1 token IDs. Shape: [batch_size, seq_len]
-            padding_mask (torch.Tensor, optional): Mask for padding tokens. Shape: [batch_size, seq_len]. Defaults to None.
+            s1_ids (torch.torch.Tensor): Input tensor of s1 token IDs. Shape: [batch_size, q_len]. With q_len < seq_len,
+                only the last q_len positions are decoded; they still attend over the whole context. Generation
+                passes just the freshly sampled s1 token.
+            padding_mask (torch.Tensor, optional): True at padding tokens. Shape: [batch_size, seq_len]. Not needed
+                with a `kv_cache`, which already holds the padding of the preceding `decode_s1` call. Defaults to None.
+            kv_cache (KVCache, optional): The cache passed to the preceding `decode_s1` call. `context` is then
+                that call's output.
 
         Returns:
-            torch.Tensor: s2 logits. Shape: [batch_size, seq_len, s2_vocab_size]
+            torch.Tensor: s2 logits. Shape: [batch_size, q_len, s2_vocab_size]
         """
         sibling_embed = self.embedding.emb_s1(s1_ids)
-        x2 = self.dep_layer(context, sibling_embed, key_padding_mask=padding_mask)
+        x2 = self.dep_layer(context, sibling_embed, key_padding_mask=padding_mask, kv_cache=kv_cache, layer_idx=self.n_layers)
         return self.head.cond_forward(x2)
 
 
-def top_k_top_p_filtering(
-        logits,
-        top_k: int = 0,
-        top_p: float = 1.0,
-        filter_value: float = -float("Inf"),
-        min_tokens_to_keep: int = 1,
-):
-    """Filter a distribution of logits using top-k and/or nucleus (top-p) filtering
-    Args:
-        logits: logits distribution shape (batch size, vocabulary size)
-        if top_k > 0: keep only top k tokens with highest probability (top-k filtering).
-        if top_p < 1.0: keep the top tokens with cumulative probability >= top_p (nucleus filtering).
-            Nucleus filtering is described in Holtzman et al. (http://arxiv.org/abs/1904.09751)
-        Make sure we keep at least min_tokens_to_keep per batch example in the output
-    From: https://gist.github.com/thomwolf/1a5a29f6962089e871b94cbd09daf317
+def auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, max_context, pred_len, clip=5, T=1.0, top_k=0, top_p=0.99, sample_count=5, verbose=False, use_cache=True,
+                              return_samples=False, amp_dtype=None, draft_model=None, draft_tokens=4, padding_mask=None, x_token=None,
+                              step_callback=None, chunk_callback=None, chunk_size=1):
     """
-    if top_k > 0:
-        top_k = min(max(top_k, min_tokens_to_keep), logits.size(-1))  # Safety check
-        # Remove all tokens with a probability less than the last token of the top-k
-        indices_to_remove = logits < torch.topk(logits, top_k)[0][..., -1, None]
-        logits[indices_to_remove] = filter_value
-        return logits
+    Autoregressively samples `pred_len` tokens and decodes them back to the input space.
 
-    if top_p < 1.0:
-        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-        cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
+    With `use_cache`, the context window is run through the model once and each following step only
+    feeds the newly sampled token, reusing the cached keys/values of earlier positions. Once the sequence
+    exceeds `max_context` the window slides, and the cached states of the retained positions were computed
+    with the evicted tokens in view in every layer past the first. The cache is then refilled from the
+    shifted window at each step, so the result matches `use_cache=False` exactly; the cache only saves
+    work while the sequence still fits the context.
 
-        # Remove tokens with cumulative probability above the threshold (token with 0 are kept)
-        sorted_indices_to_remove = cumulative_probs > top_p
-        if min_tokens_to_keep > 1:
-            # Keep at least min_tokens_to_keep (set to min_tokens_to_keep-1 because we add the first one below)
-            sorted_indices_to_remove[..., :min_tokens_to_keep] = 0
-        # Shift the indices to the right to keep also the first token above the threshold
-        sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
-        sorted_indices_to_remove[..., 0] = 0
+    With `amp_dtype` (e.g. torch.bfloat16) the model runs under autocast in that dtype. The tokenizer, and
+    the logits handed to sampling, stay in float32.
 
-        # scatter sorted tensors to original indexing
-        indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
-        logits[indices_to_remove] = filter_value
-        return logits
+    With a `draft_model` sharing the tokenizer, generation is speculative, see `speculative_inference`.
 
+    Series of different lengths are left-padded to a common length and flagged in `padding_mask` (True at padded
+    steps, shape (batch_size, seq_len)). Padded steps are hidden from every attention layer, and RoPE scores only
+    depend on relative positions, so each series generates as it would unpadded: its sliding window holds the same
+    real steps, since the padding sits before its history.
 
-def sample_from_logits(logits, temperature=1.0, top_k=None, top_p=None, sample_logits=True):
-    logits = logits / temperature
-    if top_k is not None or top_p is not None:
-        if top_k > 0 or top_p < 1.0:
-            logits = top_k_top_p_filtering(logits, top_k=top_k, top_p=top_p)
+    `x_token` takes the (s1_ids, s2_ids) of `x` when they were already encoded, e.g. by `EncoderTokenCache`; the
+    tokenizer encoder is then skipped and `x` only provides the shape.
 
-    probs = F.softmax(logits, dim=-1)
+    `step_callback`, when given, is called with the number of generated steps after every step. An exception it
+    raises aborts generation, which is how callers cancel a running forecast.
 
-    if not sample_logits:
-        _, x = top_k(probs, k=1, dim=-1)
-    else:
-        x = torch.multinomial(probs, num_samples=1)
-
-    return x
+    `chunk_callback`, when given, receives the forecast while it is generated, see `PrefixDecoder.stream`: it is
+    called as chunk_callback(start, samples) every `chunk_size` steps and after the last one, with `start` the
+    index of the chunk's first step in the horizon and `samples` its decoded steps, shape
+    (batch_size, sample_count, n, d_in).
 
+    Returns:
+        np.ndarray: Decoded series averaged over samples, shape (batch_size, seq_len, d_in). With `return_samples`,
+            the individual samples as a tensor on the input device, shape (batch_size, sample_count, seq_len, d_in).
+    """
+    if draft_model is not None:
+        return speculative_inference(tokenizer, model, draft_model, x, x_stamp, y_stamp, max_context, pred_len, clip, T, top_k, top_p,
+                                     sample_count, verbose, draft_tokens, return_samples, amp_dtype, padding_mask, x_token,
+                                     step_callback, chunk_callback, chunk_size)
 
-def auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, max_context, pred_len, clip=5, T=1.0, top_k=0, top_p=0.99, sample_count=5, verbose=False):
     with torch.no_grad():
         x = torch.clip(x, -clip, clip)
 
         device = x.device
-        x = x.unsqueeze(1).repeat(1, sample_count, 1, 1).reshape(-1, x.size(1), x.size(2)).to(device)
-        x_stamp = x_stamp.unsqueeze(1).repeat(1, sample_count, 1, 1).reshape(-1, x_stamp.size(1), x_stamp.size(2)).to(device)
-        y_stamp = y_stamp.unsqueeze(1).repeat(1, sample_count, 1, 1).reshape(-1, y_stamp.size(1), y_stamp.size(2)).to(device)
+        x_stamp = x_stamp.to(device)
+        y_stamp = y_stamp.to(device)
+        padding_mask = padding_mask.to(device) if padding_mask is not None else None
+
+        # The encoder is deterministic, so each series is encoded once and its tokens are
+        # repeated per sample; rows of the expanded batch are ordered series-major.
+        if x_token is None:
+            x_token = tokenizer.encode(x, half=True, padding_mask=padding_mask)
+        x_token = [t.to(device) for t in x_token]
+        decoder = PrefixDecoder(tokenizer, x_token, pred_len, max_context, sample_count, padding_mask)
+        x_token = [t.repeat_interleave(sample_count, dim=0) for t in x_token]
 
-        x_token = tokenizer.encode(x, half=True)
-        
         initial_seq_len = x.size(1)
         batch_size = x_token[0].size(0)
         total_seq_len = initial_seq_len + pred_len
-        full_stamp = torch.cat([x_stamp, y_stamp], dim=1)
+        full_padding = expand_padding_mask(padding_mask, pred_len, sample_count)
+        # Timestamps stay per series; decode_s1 broadcasts their embedding over the samples.
+        # The embedding of the whole track is computed once and sliced per step.
+        time_track = model.embed_time(torch.cat([x_stamp, y_stamp], dim=1))
 
-        generated_pre = x_token[0].new_empty(batch_size, pred_len)
-        generated_post = x_token[1].new_empty(batch_size, pred_len)
+        # History and generated tokens share one preallocated track; the model window is a view
+        # into it whose start moves forward once the context is full, so sliding never copies.
+        full_pre = x_token[0].new_empty(batch_size, total_seq_len)
+        full_post = x_token[1].new_empty(batch_size, total_seq_len)
+        full_pre[:, :initial_seq_len] = x_token[0]
+        full_post[:, :initial_seq_len] = x_token[1]
 
-        pre_buffer = x_token[0].new_zeros(batch_size, max_context)
-        post_buffer = x_token[1].new_zeros(batch_size, max_context)
-        buffer_len = min(initial_seq_len, max_context)
-        if buffer_len > 0:
-            start_idx = max(0, initial_seq_len - max_context)
-            pre_buffer[:, :buffer_len] = x_token[0][:, start_idx:start_idx + buffer_len]
-            post_buffer[:, :buffer_len] = x_token[1][:, start_idx:start_idx + buffer_len]
+        kv_cache = model.init_kv_cache(min(max_context, total_seq_len)) if use_cache else None
+        amp = torch.autocast(device.type, dtype=amp_dtype) if amp_dtype is not None else nullcontext()
 
         if verbose:
             ran = trange
@@ -419,75 +524,601 @@ def auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, max_context
             ran = range
         for i in ran(pred_len):
             current_seq_len = initial_seq_len + i
-            window_len = min(current_seq_len, max_context)
-
-            if current_seq_len <= max_context:
-                input_tokens = [
-                    pre_buffer[:, :window_len],
-                    post_buffer[:, :window_len]
-                ]
-            else:
-                input_tokens = [pre_buffer, post_buffer]
 
             context_end = current_seq_len
             context_start = max(0, context_end - max_context)
-            current_stamp = full_stamp[:, context_start:context_end, :].contiguous()
-
-            s1_logits, context = model.decode_s1(input_tokens[0], input_tokens[1], current_stamp)
-            s1_logits = s1_logits[:, -1, :]
+            if kv_cache is not None:
+                if context_start > 0:
+                    # The window slid, so the cached states depend on evicted tokens: refill from the shifted window
+                    kv_cache.reset()
+                elif i > 0:
+                    # Only the token sampled in the previous step is new
+                    context_start = context_end - 1
+
+            input_tokens = [
+                full_pre[:, context_start:context_end],
+                full_post[:, context_start:context_end]
+            ]
+            current_time = time_track[:, context_start:context_end]
+            current_padding = full_padding[:, context_start:context_end] if full_padding is not None else None
+
+            with amp:
+                s1_logits, context = model.decode_s1(input_tokens[0], input_tokens[1], padding_mask=current_padding,
+                                                     kv_cache=kv_cache, last_only=True, time_embedding=current_time)
+            s1_logits = s1_logits[:, -1, :].float()
             sample_pre = sample_from_logits(s1_logits, temperature=T, top_k=top_k, top_p=top_p, sample_logits=True)
 
-            s2_logits = model.decode_s2(context, sample_pre)
-            s2_logits = s2_logits[:, -1, :]
+            with amp:
+                s2_logits = model.decode_s2(context, sample_pre, current_padding, kv_cache=kv_cache)
+            s2_logits = s2_logits[:, -1, :].float()
             sample_post = sample_from_logits(s2_logits, temperature=T, top_k=top_k, top_p=top_p, sample_logits=True)
 
-            generated_pre[:, i] = sample_pre.squeeze(-1)
-            generated_post[:, i] = sample_post.squeeze(-1)
+            full_pre[:, current_seq_len] = sample_pre.squeeze(-1)
+            full_post[:, current_seq_len] = sample_post.squeeze(-1)
+            if step_callback is not None:
+                step_callback(i + 1)
+            if chunk_callback is not None:
+                decoder.stream(full_pre, full_post, current_seq_len + 1, chunk_size, chunk_callback)
 
-            if current_seq_len < max_context:
-                pre_buffer[:, current_seq_len] = sample_pre.squeeze(-1)
-                post_buffer[:, current_seq_len] = sample_post.squeeze(-1)
-            else:
-                pre_buffer.copy_(torch.roll(pre_buffer, shifts=-1, dims=1))
-                post_buffer.copy_(torch.roll(post_buffer, shifts=-1, dims=1))
-                pre_buffer[:, -1] = sample_pre.squeeze(-1)
-                post_buffer[:, -1] = sample_post.squeeze(-1)
-
-        full_pre = torch.cat([x_token[0], generated_pre], dim=1)
-        full_post = torch.cat([x_token[1], generated_post], dim=1)
-
-        context_start = max(0, total_seq_len - max_context)
-        input_tokens = [
-            full_pre[:, context_start:total_seq_len].contiguous(),
-            full_post[:, context_start:total_seq_len].contiguous()
-        ]
-        z = tokenizer.decode(input_tokens, half=True)
+        z = decoder.decode_window(full_pre, full_post)
         z = z.reshape(-1, sample_count, z.size(1), z.size(2))
+        if return_samples:
+            return z
         preds = z.cpu().numpy()
         preds = np.mean(preds, axis=1)
 
         return preds
 
 
+def expand_padding_mask(padding_mask, pred_len, sample_count):
+    """
+    Extends a (batch_size, seq_len) padding mask over the `pred_len` generated steps, which are never padding,
+    and repeats it per sample like the expanded batch. Returns None without a mask.
+    """
+    if padding_mask is None:
+        return None
+    padding_mask = torch.cat([padding_mask.bool(), padding_mask.new_zeros(padding_mask.size(0), pred_len, dtype=torch.bool)], dim=1)
+    return padding_mask.repeat_interleave(sample_count, dim=0)
+
+
+class PrefixDecoder:
+    """
+    Decodes generated tokens against tokenizer decoder state cached for the history.
+
+    The generated series is decoded over the window [start, seq_len + pred_len) of the last `max_context` steps.
+    The decoder blocks are causal, so the history part of that window decodes the same for every sample of a
+    series. It is decoded once per series on construction and its keys/values are kept in a `KVCache` shared by
+    the samples; `decode` then only runs the generated steps through the decoder. Decoding the first k generated
+    steps gives the values the full window yields for them, so partial horizons can be decoded while generation
+    is still running; `stream` does so incrementally.
+
+    Args:
+        tokenizer (KronosTokenizer): Tokenizer in eval mode.
+        x_token (Tuple[torch.Tensor, torch.Tensor]): s1 / s2 ids of the history, one row per series, shape
+            (batch_size, seq_len).
+        pred_len (int): Number of generated steps.
+        max_context (int): Length of the decoded window.
+        sample_count (int): Samples per series; rows of generated tokens are ordered series-major.
+        padding_mask (torch.Tensor, optional): True at left-padded history steps, shape (batch_size, seq_len).
+    """
+
+    def __init__(self, tokenizer, x_token, pred_len, max_context, sample_count, padding_mask=None):
+        seq_len = x_token[0].size(1)
+        total_len = seq_len + pred_len
+        self.tokenizer = tokenizer
+        self.sample_count = sample_count
+        self.seq_len = seq_len
+        self.total_len = total_len
+        self.start = max(0, total_len - max_context)
+        # First step run through `decode`; steps before it are held in the cache
+        self.tail_start = max(seq_len, self.start)
+        # End of the steps `stream` has decoded on top of the cached prefix
+        self.streamed = self.tail_start
+        self.kv_cache = tokenizer.init_decoder_cache(total_len - self.start)
+        self.prefix = None
+        if self.start < seq_len:
+            prefix_padding = padding_mask[:, self.start:] if padding_mask is not None else None
+            self.prefix = tokenizer.decode([t[:, self.start:] for t in x_token], half=True,
+                                           padding_mask=prefix_padding, kv_cache=self.kv_cache)
+        self.kv_cache.repeat_interleave(sample_count)
+        self.prefix_len = self.kv_cache.seq_len
+
+    def decode(self, tokens):
+        """
+        Decodes generated steps.
+
+        Args:
+            tokens (Tuple[torch.Tensor, torch.Tensor]): s1 / s2 ids of the steps from `tail_start` on, shape
+                (batch_size * sample_count, n).
+
+        Returns:
+            torch.Tensor: Decoded steps, shape (batch_size * sample_count, n, d_in).
+        """
+        self.kv_cache.truncate(self.prefix_len)
+        self.streamed = self.tail_start
+        z = self.tokenizer.decode(tokens, half=True, kv_cache=self.kv_cache)
+        self.kv_cache.truncate(self.prefix_len)
+        return z
+
+    def stream(self, full_pre, full_post, end, chunk_size, chunk_callback):
+        """
+        Decodes the generated steps before `end` that earlier calls have not, once there are `chunk_size` of them or
+        generation is complete, and passes them to chunk_callback(start, samples) as described in
+        `auto_regressive_inference`. Decoded steps stay in the cache, so every step is decoded once. Steps before
+        `tail_start`, which only occur when the horizon exceeds the window, fall outside the decoded window and
+        are not streamed.
+
+        Args:
+            full_pre, full_post (torch.Tensor): s1 / s2 tracks, shape (batch_size * sample_count, seq_len + pred_len).
+            end (int): End of the steps generated so far.
+        """
+        begin = self.streamed
+        if end <= begin or (end - begin < chunk_size and end < self.total_len):
+            return
+        z = self.tokenizer.decode([full_pre[:, begin:end], full_post[:, begin:end]], half=True, kv_cache=self.kv_cache)
+        self.streamed = end
+        chunk_callback(begin - self.seq_len, z.reshape(-1, self.sample_count, z.size(1), z.size(2)))
+
+    def decode_window(self, full_pre, full_post):
+        """
+        Decodes the whole window from the s1 / s2 tracks of shape (batch_size * sample_count, seq_len + pred_len),
+        as `tokenizer.decode` over the window would.
+        """
+        total_len = full_pre.size(1)
+        z = self.decode([full_pre[:, self.tail_start:total_len], full_post[:, self.tail_start:total_len]])
+        if self.prefix is not None:
+            z = torch.cat([self.prefix.repeat_interleave(self.sample_count, dim=0), z], dim=1)
+        return z
+
+
+def speculative_inference(tokenizer, model, draft_model, x, x_stamp, y_stamp, max_context, pred_len, clip=5, T=1.0, top_k=0, top_p=0.99,
+                          sample_count=5, verbose=False, draft_tokens=4, return_samples=False, amp_dtype=None, padding_mask=None,
+                          x_token=None, step_callback=None, chunk_callback=None, chunk_size=1):
+    """
+    Speculative variant of `auto_regressive_inference`: `draft_model` proposes tokens that `model` verifies.
+
+    Each round the draft samples up to `draft_tokens` (s1, s2) tokens one at a time. The target then scores all of
+    them in a single cached forward pass. The sub-tokens are checked in generation order (s1 before s2 of each
+    step): a draft sub-token is kept with probability min(1, p / q), where p and q are the target's and the draft's
+    filtered sampling distributions. The first rejected one is resampled from the normalized residual max(0, p - q),
+    so every generated token follows the target's distribution exactly. The batch advances by the shortest accepted
+    prefix over its rows, plus one token: rows that accepted further keep their accepted draft token at that step.
+    When everything was accepted, the extra token is sampled from the target's next-step distribution.
+
+    Both models keep key/value caches whose spare slots absorb the multi-token verification passes; rejected
+    positions are truncated. The draft must share the target's tokenizer, e.g. Kronos-small for Kronos-base.
+    Drafts are only verified while the sequence fits `max_context`. Past it every step needs its own window, which
+    one multi-token pass cannot provide, so the target generates the remaining steps one at a time from a refilled
+    cache as `auto_regressive_inference` does.
+
+    Returns:
+        Same as `auto_regressive_inference`.
+    """
+    with torch.no_grad():
+        x = torch.clip(x, -clip, clip)
+
+        device = x.device
+        x_stamp = x_stamp.to(device)
+        y_stamp = y_stamp.to(device)
+        padding_mask = padding_mask.to(device) if padding_mask is not None else None
+
+        if x_token is None:
+            x_token = tokenizer.encode(x, half=True, padding_mask=padding_mask)
+        x_token = [t.to(device) for t in x_token]
+        decoder = PrefixDecoder(tokenizer, x_token, pred_len, max_context, sample_count, padding_mask)
+        x_token = [t.repeat_interleave(sample_count, dim=0) for t in x_token]
+
+        initial_seq_len = x.size(1)
+        full_padding = expand_padding_mask(padding_mask, pred_len, sample_count)
+        if initial_seq_len < 2:
+            raise ValueError("Speculative decoding needs a context of at least two steps.")
+        batch_size = x_token[0].size(0)
+        total_seq_len = initial_seq_len + pred_len
+        full_stamp = torch.cat([x_stamp, y_stamp], dim=1)
+        target_time, draft_time = model.embed_time(full_stamp), draft_model.embed_time(full_stamp)
+
+        full_pre = x_token[0].new_empty(batch_size, total_seq_len)
+        full_post = x_token[1].new_empty(batch_size, total_seq_len)
+        full_pre[:, :initial_seq_len] = x_token[0]
+        full_post[:, :initial_seq_len] = x_token[1]
+
+        # Cache positions count from the first token of the initial window
+        origin = max(0, initial_seq_len - max_context)
+        cache_len = min(max_context, total_seq_len - origin) + draft_tokens + 1
+        target_cache = model.init_kv_cache(cache_len, window=max_context)
+        draft_cache = draft_model.init_kv_cache(cache_len, window=max_context)
+        amp = torch.autocast(device.type, dtype=amp_dtype) if amp_dtype is not None else nullcontext()
+        filtered = lambda logits: filtered_probs(logits.float(), temperature=T, top_k=top_k, top_p=top_p)
+        sample = lambda probs: torch.multinomial(probs, num_samples=1).squeeze(-1)
+        pick = lambda probs, ids: probs.gather(-1, ids.unsqueeze(-1)).squeeze(-1)
+
+        def residual(p, q):
+            r = (p - q).clamp(min=0)
+            return torch.where(r.sum(dim=-1, keepdim=True) > 0, r, p)
+
+        # Every committed token but the last has been fed to both models
+        target_fed = draft_fed = initial_seq_len - 1
+        prefill_padding = full_padding[:, origin:target_fed] if full_padding is not None else None
+        for m, cache, time_track, ctx in ((model, target_cache, target_time, amp), (draft_model, draft_cache, draft_time, nullcontext())):
+            with ctx:
+                _, context = m.decode_s1(full_pre[:, origin:target_fed], full_post[:, origin:target_fed],
+                                         padding_mask=prefill_padding, kv_cache=cache, last_only=True,
+                                         time_embedding=time_track[:, origin:target_fed])
+                # Fills the dependency-aware layer's cache; the logits are not needed
+                m.decode_s2(context, full_pre[:, target_fed - 1:target_fed], kv_cache=cache)
+
+        pbar = tqdm(total=pred_len) if verbose else None
+        proposed = accepted_total = 0
+        current = initial_seq_len
+        while current < total_seq_len:
+            if current > max_context:
+                start = current - max_context
+                target_cache.reset()
+                with amp:
+                    s1_logits, context = model.decode_s1(full_pre[:, start:current], full_post[:, start:current],
+                                                         padding_mask=full_padding[:, start:current] if full_padding is not None else None,
+                                                         kv_cache=target_cache, last_only=True, time_embedding=target_time[:, start:current])
+                full_pre[:, current] = sample(filtered(s1_logits[:, -1]))
+                with amp:
+                    s2_logits = model.decode_s2(context, full_pre[:, current:current + 1], kv_cache=target_cache)
+                full_post[:, current] = sample(filtered(s2_logits[:, -1]))
+                current += 1
+                if pbar is not None:
+                    pbar.update(1)
+                if step_callback is not None:
+                    step_callback(current - initial_seq_len)
+                if chunk_callback is not None:
+                    decoder.stream(full_pre, full_post, current, chunk_size, chunk_callback)
+                continue
+
+            # The verified steps must end inside the context, where no window slides
+            k = min(draft_tokens, total_seq_len - current - 1, max_context - current)
+
+            draft_s1, draft_s2 = [], []
+            for j in range(k):
+                end = current + j
+                s1_logits, context = draft_model.decode_s1(full_pre[:, draft_fed:end], full_post[:, draft_fed:end],
+                                                           kv_cache=draft_cache, last_only=True,
+                                                           time_embedding=draft_time[:, draft_fed:end])
+                draft_fed = end
+                q1 = filtered(s1_logits[:, -1])
+                token_s1 = sample(q1)
+                q2 = filtered(draft_model.decode_s2(context, token_s1.unsqueeze(-1), kv_cache=draft_cache)[:, -1])
+                token_s2 = sample(q2)
+                full_pre[:, end] = token_s1
+                full_post[:, end] = token_s2
+                draft_s1.append(q1)
+                draft_s2.append(q2)
+
+            # One target pass scores the k drafted steps and the step after them
+            end = current + k
+            with amp:
+                s1_logits, context = model.decode_s1(full_pre[:, target_fed:end], full_post[:, target_fed:end],
+                                                     kv_cache=target_cache, time_embedding=target_time[:, target_fed:end])
+            target_fed = end
+            p1 = filtered(s1_logits.reshape(-1, s1_logits.size(-1))).view(batch_size, k + 1, -1)
+            # The last query only fills the slot of the step after the drafts
+            queries = torch.cat([full_pre[:, current:end], full_pre[:, end - 1:end] if k else full_pre[:, :1]], dim=1)
+
+            if k:
+                with amp:
+                    s2_logits = model.decode_s2(context, queries, kv_cache=target_cache)
+                p2 = filtered(s2_logits[:, :k].reshape(-1, s2_logits.size(-1))).view(batch_size, k, -1)
+                q1, q2 = torch.stack(draft_s1, dim=1), torch.stack(draft_s2, dim=1)
+                ids1, ids2 = full_pre[:, current:end], full_post[:, current:end]
+                keep1 = torch.rand(batch_size, k, device=device) * pick(q1, ids1) < pick(p1[:, :k], ids1)
+                keep2 = torch.rand(batch_size, k, device=device) * pick(q2, ids2) < pick(p2, ids2)
+                n_kept = (keep1 & keep2).long().cumprod(dim=1).sum(dim=1)
+                n = int(n_kept.min())
+                proposed += k * batch_size
+                accepted_total += int(n_kept.sum())
+            else:
+                n = 0
+
+            step = current + n
+            if n < k:
+                rejected_here = n_kept == n
+                resample_s1 = rejected_here & ~keep1[:, n]
+                resample_s2 = rejected_here & keep1[:, n]
+                full_pre[:, step] = torch.where(resample_s1, sample(residual(p1[:, n], q1[:, n])), full_pre[:, step])
+                full_post[:, step] = torch.where(resample_s2, sample(residual(p2[:, n], q2[:, n])), full_post[:, step])
+                redraw_s2 = resample_s1
+            else:
+                full_pre[:, step] = sample(p1[:, k])
+                redraw_s2 = torch.ones(batch_size, dtype=torch.bool, device=device)
+
+            if bool(redraw_s2.any()):
+                # s2 of a resampled s1 is drawn from the target given that s1
+                queries[:, n] = full_pre[:, step]
+                with amp:
+                    s2_logits = model.decode_s2(context, queries, kv_cache=target_cache)
+                fresh_s2 = sample(filtered(s2_logits[:, n]))
+                full_post[:, step] = torch.where(redraw_s2, fresh_s2, full_post[:, step])
+
+            current = step + 1
+            target_fed = current - 1
+            draft_fed = min(draft_fed, current - 1)
+            target_cache.truncate(target_fed - origin)
+            draft_cache.truncate(draft_fed - origin)
+            if pbar is not None:
+                pbar.update(n + 1)
+                if proposed:
+                    pbar.set_postfix(acceptance=f"{accepted_total / proposed:.2f}")
+            if step_callback is not None:
+                step_callback(current - initial_seq_len)
+            if chunk_callback is not None:
+                decoder.stream(full_pre, full_post, current, chunk_size, chunk_callback)
+        if pbar is not None:
+            pbar.close()
+
+        z = decoder.decode_window(full_pre, full_post)
+        z = z.reshape(-1, sample_count, z.size(1), z.size(2))
+        if return_samples:
+            return z
+        return np.mean(z.cpu().numpy(), axis=1)
+
+
+# Quantile levels reported as forecast bands
+FORECAST_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Largest share of a series' steps `predict_batch` fills with left padding to batch it with longer series
+MAX_PADDING_FRACTION = 0.25
+
+
+def check_quantiles(quantiles):
+    """Raises ValueError unless every level in `quantiles` is a finite number in [0, 1]."""
+    for q in quantiles or ():
+        if not isinstance(q, (int, float, np.number)) or not 0 <= q <= 1:
+            raise ValueError(f"Quantile levels must be numbers in [0, 1], got {q!r}.")
+
+
+class StepProgress:
+    """
+    Combines the step counts of several generation runs, e.g. the micro-batches of a batch or its length buckets,
+    into one count out of `pred_len`: the average over the runs, rounded down.
+
+    Args:
+        callback (Callable[[int], None]): Receives the combined count.
+        parts (int): Number of runs.
+    """
+
+    def __init__(self, callback, parts):
+        self.callback = callback
+        self.done = [0] * parts
+
+    def part(self, k):
+        """Step callback for run `k`."""
+        def update(steps):
+            self.done[k] = steps
+            self.callback(sum(self.done) // len(self.done))
+        return update
+
+
+class ForecastAggregator:
+    """
+    Accumulates sampled forecasts into per-series statistics as micro-batches complete.
+
+    The mean is kept as a running average. Quantiles are computed in torch from each series' samples once all
+    of them have arrived, so only the requested statistics are copied to host memory.
+
+    Args:
+        num_series (int): Number of series in the batch.
+        sample_count (int): Number of samples drawn per series.
+        quantiles (Sequence[float]): Quantile levels in [0, 1] to report.
+        keep_samples (bool): Whether to also return the raw sampled trajectories.
+    """
+
+    def __init__(self, num_series, sample_count, quantiles=(), keep_samples=False):
+        self.num_series = num_series
+        self.sample_count = sample_count
+        self.quantiles = tuple(quantiles)
+        self.keep_samples = keep_samples
+        self.counts = [0] * num_series
+        self.mean = None
+        self.quantile_values = None
+        self.samples = None
+        self._pending = {}  # series index -> sample chunks of a series split across micro-batches
+
+    def update(self, start, samples):
+        """
+        Adds the samples of series `start` .. `start + samples.size(0)`.
+
+        Args:
+            start (int): Index of the first series in the chunk.
+            samples (torch.Tensor): Shape (n_series, n_samples, pred_len, d_in). A chunk either covers whole
+                series or part of the samples of a single series.
+        """
+        n_series, n_samples = samples.shape[:2]
+        end = start + n_series
+        if self.mean is None:
+            shape = samples.shape[2:]
+            self.mean = samples.new_zeros(self.num_series, *shape)
+            if self.quantiles:
+                self.quantile_values = samples.new_zeros(self.num_series, len(self.quantiles), *shape)
+            if self.keep_samples:
+                self.samples = samples.new_zeros(self.num_series, self.sample_count, *shape)
+
+        seen = self.counts[start]
+        total = seen + n_samples
+        self.mean[start:end] += (samples.mean(dim=1) - self.mean[start:end]) * (n_samples / total)
+        self.counts[start:end] = [total] * n_series
+        if self.keep_samples:
+            self.samples[start:end, seen:total] = samples
+
+        if not self.quantiles:
+            return
+        if total < self.sample_count:
+            self._pending.setdefault(start, []).append(samples)
+            return
+        if seen > 0:
+            samples = torch.cat(self._pending.pop(start) + [samples], dim=1)
+        levels = torch.tensor(self.quantiles, dtype=samples.dtype, device=samples.device)
+        self.quantile_values[start:end] = torch.quantile(samples, levels, dim=1).transpose(0, 1)
+
+    def result(self):
+        """
+        Returns:
+            dict: 'mean' (num_series, pred_len, d_in), 'quantiles' (num_series, n_quantiles, pred_len, d_in) or None,
+                and 'samples' (num_series, sample_count, pred_len, d_in) or None, as float32 numpy arrays.
+        """
+        to_numpy = lambda t: None if t is None else t.float().cpu().numpy()
+        return {
+            'mean': to_numpy(self.mean),
+            'quantiles': to_numpy(self.quantile_values),
+            'samples': to_numpy(self.samples),
+        }
+
+
+# Calendar fields of the temporal embedding, in input order
+TIME_FEATURES = ('minute', 'hour', 'weekday', 'day', 'month')
+
+
+def to_datetime64(timestamps):
+    """
+    Timestamps as a datetime64 array of wall-clock times.
+
+    NumPy datetime64 arrays are used as they are and int64 arrays are read as epoch nanoseconds; anything else
+    (Series, DatetimeIndex, lists) goes through pandas, with timezone-aware values taken in their own timezone.
+    """
+    if isinstance(timestamps, np.ndarray):
+        if timestamps.dtype.kind == 'M':
+            return timestamps
+        if timestamps.dtype.kind in 'iu':
+            return timestamps.astype(np.int64, copy=False).view('datetime64[ns]')
+    index = pd.DatetimeIndex(timestamps)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values
+
+
+def time_features(timestamps):
+    """
+    Calendar fields of `TIME_FEATURES` computed with datetime64 arithmetic.
+
+    Args:
+        timestamps (np.ndarray): datetime64 values, see `to_datetime64`.
+
+    Returns:
+        np.ndarray: int64 array of shape (len(timestamps), 5).
+    """
+    minutes = timestamps.astype('datetime64[m]').astype(np.int64)
+    days = timestamps.astype('datetime64[D]')
+    months = timestamps.astype('datetime64[M]')
+    features = np.empty((len(timestamps), len(TIME_FEATURES)), dtype=np.int64)
+    features[:, 0] = minutes % 60
+    features[:, 1] = minutes // 60 % 24
+    # 1970-01-01 was a Thursday; weekdays count from Monday = 0
+    features[:, 2] = (days.astype(np.int64) + 3) % 7
+    features[:, 3] = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    features[:, 4] = months.astype(np.int64) % 12 + 1
+    return features
+
+
 def calc_time_stamps(x_timestamp):
-    time_df = pd.DataFrame()
-    # Handle both Series and DatetimeIndex
-    ts = pd.Series(x_timestamp) if isinstance(x_timestamp, pd.DatetimeIndex) else x_timestamp
-    time_df['minute'] = ts.dt.minute
-    time_df['hour'] = ts.dt.hour
-    time_df['weekday'] = ts.dt.weekday
-    time_df['day'] = ts.dt.day
-    time_df['month'] = ts.dt.month
-    return time_df
+    return pd.DataFrame(time_features(to_datetime64(x_timestamp)), columns=list(TIME_FEATURES))
 
 
-class KronosPredictor:
+# Inference precisions accepted by KronosPredictor
+PRECISIONS = ('float32', 'bfloat16', 'int8')
+
+
+def quantize_int8(model):
+    """
+    Returns a copy of `model` whose Linear layers use dynamic INT8 quantization (CPU only).
+
+    Weights are stored as qint8 and activations are quantized on the fly per batch. Embedding tables,
+    norms and everything outside the Linear layers stay in float32.
+    """
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=False)
+
+
+def cast_linear_weights(model, dtype):
+    """
+    Returns a copy of `model` with the weights of its Linear layers cast to `dtype`.
+
+    Embeddings and RMSNorm weights keep float32, so the residual stream and normalization stay in float32;
+    run the copy under `torch.autocast` in `dtype` to feed the Linear layers.
+    """
+    model = copy.deepcopy(model)
+    for module in model.modules():
+        if isinstance(module, nn.Linear):
+            module.to(dtype)
+    return model
+
+
+def make_reference_window(length=256, seed=0):
+    """
+    Builds a deterministic, normalized synthetic OHLCVA window for model comparisons.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: x of shape (1, length, 6) and x_stamp of shape (1, length, 5).
+    """
+    rng = np.random.RandomState(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, length)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0.0, 0.005, length)) * close
+    volume = rng.lognormal(10.0, 0.5, length)
+    x = np.stack([open_, np.maximum(open_, close) + spread, np.minimum(open_, close) - spread, close,
+                  volume, volume * close], axis=1).astype(np.float32)
+    x = (x - x.mean(axis=0)) / (x.std(axis=0) + 1e-5)
+
+    timestamps = pd.Series(pd.date_range('2024-01-02 09:30', periods=length, freq='5min'))
+    x_stamp = calc_time_stamps(timestamps).values.astype(np.float32)
+    return torch.from_numpy(x)[None], torch.from_numpy(x_stamp)[None]
+
 
-    def __init__(self, model, tokenizer, device=None, max_context=512, clip=5):
+def measure_logit_drift(tokenizer, reference_model, model, x, x_stamp, amp_dtype=None):
+    """
+    Compares the next-token distributions of `model` against `reference_model` on one window.
+
+    Both models are teacher-forced on the same tokens, so each position is compared under identical inputs.
+    `model` runs under autocast in `amp_dtype` when given.
+
+    Returns:
+        dict: Per-stage ('s1', 's2') mean KL divergence KL(reference || model), argmax agreement rate
+            and maximum absolute logit difference.
+    """
+    def stats(ref_logits, logits):
+        ref_logp = torch.log_softmax(ref_logits.float(), dim=-1)
+        logp = torch.log_softmax(logits.float(), dim=-1)
+        kl = (ref_logp.exp() * (ref_logp - logp)).sum(dim=-1).mean().item()
+        agreement = (ref_logits.argmax(dim=-1) == logits.argmax(dim=-1)).float().mean().item()
+        max_abs = (ref_logits.float() - logits.float()).abs().max().item()
+        return {'kl': kl, 'argmax_agreement': agreement, 'max_abs_logit_diff': max_abs}
+
+    with torch.no_grad():
+        s1_ids, s2_ids = tokenizer.encode(x, half=True)
+        report = {}
+        outputs = []
+        for m, amp_dtype in ((reference_model, None), (model, amp_dtype)):
+            with torch.autocast(x.device.type, dtype=amp_dtype) if amp_dtype is not None else nullcontext():
+                s1_logits, context = m.decode_s1(s1_ids, s2_ids, x_stamp)
+                outputs.append((s1_logits, m.decode_s2(context, s1_ids)))
+        report['s1'] = stats(outputs[0][0], outputs[1][0])
+        report['s2'] = stats(outputs[0][1], outputs[1][1])
+    return report
+
+
+class KronosPredictor:
+    # Whether generation accepts left-padded ragged batches; without it `predict_batch` groups equal lengths only
+    supports_padding = True
+
+    def __init__(self, model, tokenizer, device=None, max_context=512, clip=5, use_cache=True, memory_budget_mb=None, max_workers=1,
+                 fold_weights=True, precision='float32', compile_model=False, warmup_batch_sizes=(1,), draft_model=None, draft_tokens=4,
+                 encode_cache_size=0, encode_cache_tolerance=0.05):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision '{precision}', expected one of {PRECISIONS}.")
+        self.precision = precision
+        # Logit drift against the float32 model, filled in for reduced precisions
+        self.precision_report = None
         self.tokenizer = tokenizer
         self.model = model
         self.max_context = max_context
         self.clip = clip
+        self.use_cache = use_cache
+        # Generation memory budget; the B x sample_count batch is split into micro-batches that fit it
+        self.memory_budget_mb = memory_budget_mb
+        self.max_workers = max(1, int(max_workers))
         self.price_cols = ['open', 'high', 'low', 'close']
         self.vol_col = 'volume'
         self.amt_vol = 'amount'
@@ -507,78 +1138,426 @@ class KronosPredictor:
         self.tokenizer = self.tokenizer.to(self.device)
         self.model = self.model.to(self.device)
 
-    def generate(self, x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose):
+        reserve_rotary_tables(self.tokenizer, self.max_context)
+        reserve_rotary_tables(self.model, self.max_context)
+
+        if fold_weights:
+            # Replace the embedding projections on the generation path with table lookups
+            self.tokenizer.fold()
+            self.model.embedding.fold()
+            self.model.time_emb.fold()
+
+        # Autocast dtype for the model during generation; None runs it in the dtype of its weights
+        self.amp_dtype = torch.bfloat16 if precision == 'bfloat16' else None
+        if precision != 'float32':
+            if torch.device(self.device).type != 'cpu':
+                raise ValueError(f"{precision} inference is only supported on CPU.")
+            # The tokenizer stays in float32: it runs once per window, and its quantizer is sensitive to small errors
+            reference = self.model
+            if precision == 'int8':
+                self.model = quantize_int8(reference)
+            else:
+                self.model = cast_linear_weights(reference, self.amp_dtype)
+            x, x_stamp = make_reference_window(min(256, self.max_context))
+            self.precision_report = measure_logit_drift(self.tokenizer, reference, self.model, x, x_stamp, self.amp_dtype)
+
+        # Per-series encoder state for rolling windows, used by predictions that pass a cache key
+        self.encode_cache = EncoderTokenCache(self.tokenizer, encode_cache_size, encode_cache_tolerance, clip) if encode_cache_size else None
+
+        # Smaller model sharing the tokenizer that drafts tokens for speculative decoding
+        self.draft_model = None
+        self.draft_tokens = draft_tokens
+        if draft_model is not None:
+            if not use_cache or compile_model:
+                raise ValueError("Speculative decoding requires use_cache=True and compile_model=False.")
+            self.draft_model = draft_model.to(self.device)
+            reserve_rotary_tables(self.draft_model, self.max_context)
+            if fold_weights:
+                self.draft_model.embedding.fold()
+                self.draft_model.time_emb.fold()
+
+        if compile_model:
+            if not use_cache:
+                raise ValueError("compile_model requires use_cache=True.")
+            # Compile the decoding step graphs for the expected batch sizes now rather than on the first request
+            self.model = CompiledKronos(self.model, self.max_context)
+            self.model.warmup(warmup_batch_sizes, amp_dtype=self.amp_dtype)
+
+    def warmup(self, lookback, pred_len, sample_count=1):
+        """
+        Runs one forecast of a synthetic series, so allocator pools, kernels and lazily built tables are in place
+        before the first request.
 
-        x_tensor = torch.from_numpy(np.array(x).astype(np.float32)).to(self.device)
-        x_stamp_tensor = torch.from_numpy(np.array(x_stamp).astype(np.float32)).to(self.device)
-        y_stamp_tensor = torch.from_numpy(np.array(y_stamp).astype(np.float32)).to(self.device)
+        Args:
+            lookback (int): History length of the typical request.
+            pred_len (int): Prediction length of the typical request.
+            sample_count (int): Samples per series of the typical request.
+        """
+        rng = np.random.default_rng(0)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, lookback)))
+        volume = rng.uniform(1, 10, lookback)
+        x = np.column_stack([close, close * 1.01, close * 0.99, close, volume, volume * close]).astype(np.float32)
+        timestamps = np.datetime64('2024-01-02T09:30') + np.arange(lookback + pred_len) * np.timedelta64(5, 'm')
+        self.predict_arrays(x, timestamps[:lookback], timestamps[lookback:], pred_len, sample_count=sample_count, verbose=False)
+
+    def estimate_row_bytes(self, seq_len):
+        """
+        Rough peak memory one row of the expanded (series x sample) batch needs during generation.
 
-        preds = auto_regressive_inference(self.tokenizer, self.model, x_tensor, x_stamp_tensor, y_stamp_tensor, self.max_context, pred_len,
-                                          self.clip, T, top_k, top_p, sample_count, verbose)
-        preds = preds[:, -pred_len:, :]
-        return preds
+        Covers the KV cache of the Transformer stack and the widest per-layer activations of a full-window
+        pass (attention scores and feed-forward hidden states) in either the model or the tokenizer.
+        """
+        model, tokenizer = self.model, self.tokenizer
+        window = min(seq_len, self.max_context)
+        elem = 4
+        # Under bfloat16 autocast the cached keys/values come out of bfloat16 projections
+        cache_elem = 2 if self.amp_dtype == torch.bfloat16 else elem
+        cache = (model.n_layers + 1) * 2 * self.max_context * model.d_model * cache_elem
+        model_act = window * (model.n_heads * window + 2 * model.ff_dim + 4 * model.d_model) * elem
+        tokenizer_act = self.max_context * (tokenizer.n_heads * self.max_context + 2 * tokenizer.ff_dim + 4 * tokenizer.d_model) * elem
+        return cache + max(model_act, tokenizer_act)
+
+    def plan_micro_batches(self, num_series, seq_len, sample_count):
+        """
+        Splits the expanded batch into micro-batches that fit `memory_budget_mb`.
 
-    def predict(self, df, x_timestamp, y_timestamp, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, verbose=True):
+        Returns:
+            List[Tuple[int, int, int]]: (series_start, series_end, n_samples) per micro-batch. Whole series
+                are grouped when their samples fit together; otherwise a series' samples are spread over
+                several micro-batches.
+        """
+        if not self.memory_budget_mb:
+            return [(0, num_series, sample_count)]
 
-        if not isinstance(df, pd.DataFrame):
-            raise ValueError("Input must be a pandas DataFrame.")
+        budget = self.memory_budget_mb * 1024 ** 2 / self.max_workers
+        rows = max(1, int(budget // self.estimate_row_bytes(seq_len)))
+        if rows >= sample_count:
+            step = rows // sample_count
+            return [(b, min(b + step, num_series), sample_count) for b in range(0, num_series, step)]
+        return [(b, b + 1, min(rows, sample_count - s)) for b in range(num_series) for s in range(0, sample_count, rows)]
 
-        if not all(col in df.columns for col in self.price_cols):
-            raise ValueError(f"Price columns {self.price_cols} not found in DataFrame.")
+    def plan_length_buckets(self, seq_lens, max_padding=MAX_PADDING_FRACTION):
+        """
+        Groups series by history length for ragged batch prediction.
 
-        df = df.copy()
+        Series are sorted longest first, and a series joins the current group while left-padding it to the
+        group's longest series fills at most `max_padding` of its steps. Backends without padding support only
+        group equal lengths.
+
+        Returns:
+            List[List[int]]: Series indices per group, each group starting with its longest series.
+        """
+        if not self.supports_padding:
+            max_padding = 0.0
+        buckets = []
+        for i in sorted(range(len(seq_lens)), key=lambda i: -seq_lens[i]):
+            if buckets and seq_lens[i] >= (1.0 - max_padding) * seq_lens[buckets[-1][0]]:
+                buckets[-1].append(i)
+            else:
+                buckets.append([i])
+        return buckets
+
+    def _bucket_tokens(self, tokens, x, padding_mask):
+        """
+        Left-padded tokens of a `predict_batch` group whose series partly come from `encode_cache`.
+
+        Returns None when no series of the group is cached; generation then encodes the whole group itself.
+        Otherwise the remaining series are encoded here.
+        """
+        if all(t is None for t in tokens):
+            return None
+        s1_ids = torch.zeros(x.shape[:2], dtype=torch.long, device=self.device)
+        s2_ids = torch.zeros_like(s1_ids)
+        with torch.no_grad():
+            for row, t in enumerate(tokens):
+                pad = int(padding_mask[row].sum())
+                if t is None:
+                    x_row = torch.from_numpy(x[row:row + 1, pad:]).to(self.device)
+                    t = self.tokenizer.encode(x_row, half=True)
+                s1_ids[row, pad:], s2_ids[row, pad:] = t[0][0], t[1][0]
+        return s1_ids, s2_ids
+
+    def generate(self, x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose):
+        return self.generate_forecast(x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose)['mean']
+
+    def generate_forecast(self, x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose, quantiles=(), return_samples=False,
+                          padding_mask=None, x_token=None, step_callback=None, chunk_callback=None, chunk_size=1):
+        """
+        Samples forecasts for a normalized batch and aggregates them per series.
+
+        Args:
+            padding_mask (np.ndarray, optional): True at the left padding of shorter series, shape (batch_size, seq_len).
+            x_token (Tuple[torch.Tensor, torch.Tensor], optional): Tokens of `x` when already encoded, see
+                `auto_regressive_inference`.
+            step_callback (Callable[[int], None], optional): Progress callback, see `predict_batch_arrays`.
+            chunk_callback (Callable[[int, dict], None], optional): Receives the forecast every `chunk_size` steps
+                as chunk_callback(start, result), with `result` as returned here but covering the chunk's steps
+                only and without samples. The batch then runs as a single generation pass.
+
+        Returns:
+            dict: See `ForecastAggregator.result`; all arrays cover the last `pred_len` steps.
+        """
+        x_tensor = torch.from_numpy(np.ascontiguousarray(x, dtype=np.float32)).to(self.device)
+        x_stamp_tensor = torch.from_numpy(np.ascontiguousarray(x_stamp, dtype=np.float32)).to(self.device)
+        y_stamp_tensor = torch.from_numpy(np.ascontiguousarray(y_stamp, dtype=np.float32)).to(self.device)
+        padding_tensor = torch.from_numpy(np.asarray(padding_mask, dtype=bool)).to(self.device) if padding_mask is not None else None
+
+        chunks = self.plan_micro_batches(x_tensor.size(0), x_tensor.size(1), sample_count)
+        aggregator = ForecastAggregator(x_tensor.size(0), sample_count, quantiles, return_samples)
+        if chunk_callback is not None:
+            # Every chunk of the horizon is aggregated as soon as all samples of it are decoded
+            chunks = [(0, x_tensor.size(0), sample_count)]
+        progress = StepProgress(step_callback, len(chunks)) if step_callback is not None else None
+
+        def on_chunk(start, samples):
+            partial = ForecastAggregator(samples.size(0), sample_count, quantiles)
+            partial.update(0, samples)
+            chunk_callback(start, partial.result())
+
+        def run(k):
+            start, end, n_samples = chunks[k]
+            samples = auto_regressive_inference(self.tokenizer, self.model, x_tensor[start:end], x_stamp_tensor[start:end], y_stamp_tensor[start:end],
+                                                self.max_context, pred_len, self.clip, T, top_k, top_p, n_samples, verbose, self.use_cache,
+                                                return_samples=True, amp_dtype=self.amp_dtype, draft_model=self.draft_model,
+                                                draft_tokens=self.draft_tokens,
+                                                padding_mask=padding_tensor[start:end] if padding_tensor is not None else None,
+                                                x_token=[t[start:end] for t in x_token] if x_token is not None else None,
+                                                step_callback=progress.part(k) if progress is not None else None,
+                                                chunk_callback=on_chunk if chunk_callback is not None else None,
+                                                chunk_size=chunk_size)
+            return samples[:, :, -pred_len:, :]
+
+        if len(chunks) == 1:
+            aggregator.update(0, run(0))
+        else:
+            # At most `max_workers` chunks are in flight, each sized to its share of the budget; a chunk is
+            # merged and released before the next one is submitted
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                pending = deque()
+                for k in range(len(chunks)):
+                    if len(pending) == self.max_workers:
+                        start, future = pending.popleft()
+                        aggregator.update(start, future.result())
+                    pending.append((chunks[k][0], pool.submit(run, k)))
+                while pending:
+                    start, future = pending.popleft()
+                    aggregator.update(start, future.result())
+
+        return aggregator.result()
+
+    def _denormalize(self, forecast, i, x_mean, x_std, quantiles, return_samples):
+        """De-normalizes series `i` of a `generate_forecast` result into the arrays `predict_arrays` returns."""
+        scale = x_std + 1e-5
+        mean = forecast['mean'][i] * scale + x_mean
+        if quantiles is None and not return_samples:
+            return mean
+
+        result = {'mean': mean, 'quantiles': {}}
+        for j, q in enumerate(quantiles or ()):
+            result['quantiles'][q] = forecast['quantiles'][i, j] * scale + x_mean
+        if return_samples:
+            result['samples'] = forecast['samples'][i] * scale + x_mean
+        return result
+
+    def _to_frames(self, result, y_timestamp):
+        """Wraps a `predict_arrays` result into the DataFrames `predict` returns."""
+        columns = self.price_cols + [self.vol_col, self.amt_vol]
+        if isinstance(result, np.ndarray):
+            return pd.DataFrame(result, columns=columns, index=y_timestamp)
+
+        frames = {
+            'mean': pd.DataFrame(result['mean'], columns=columns, index=y_timestamp),
+            'quantiles': {q: pd.DataFrame(v, columns=columns, index=y_timestamp) for q, v in result['quantiles'].items()}
+        }
+        if 'samples' in result:
+            frames['samples'] = result['samples']
+        return frames
+
+    def _frame_values(self, df):
+        """
+        OHLCVA array of a DataFrame. Missing volume and amount are filled with zeros; a missing amount alone is
+        estimated as volume times the mean price.
+        """
+        prices = df[self.price_cols].to_numpy(np.float64)
         if self.vol_col not in df.columns:
-            df[self.vol_col] = 0.0  # Fill missing volume with zeros
-            df[self.amt_vol] = 0.0  # Fill missing amount with zeros
-        if self.amt_vol not in df.columns and self.vol_col in df.columns:
-            df[self.amt_vol] = df[self.vol_col] * df[self.price_cols].mean(axis=1)
+            volume = amount = np.zeros(len(df))
+        else:
+            volume = df[self.vol_col].to_numpy(np.float64)
+            if self.amt_vol in df.columns:
+                amount = df[self.amt_vol].to_numpy(np.float64)
+            else:
+                amount = volume * prices.mean(axis=1)
+        return np.column_stack([prices, volume, amount]).astype(np.float32)
+
+    def _check_values(self, x, name):
+        """`x` as a float32 OHLCVA array; `name` identifies the input in errors."""
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        n_features = len(self.price_cols) + 2
+        if x.ndim != 2 or x.shape[1] != n_features:
+            raise ValueError(f"{name} must have shape (lookback, {n_features}), got {x.shape}.")
+        if np.isnan(x).any():
+            raise ValueError(f"{name} contains NaN values in price or volume columns.")
+        return x
+
+    def _encode_cached(self, cache_key, x, x_timestamp):
+        """
+        Normalization statistics and tokens of a raw window from `encode_cache`.
 
-        if df[self.price_cols + [self.vol_col, self.amt_vol]].isnull().values.any():
-            raise ValueError("Input DataFrame contains NaN values in price or volume columns.")
+        Returns:
+            Tuple: (x_mean, x_std, x_token), or (None, None, None) when the series is not cached.
+        """
+        if cache_key is None or self.encode_cache is None:
+            return None, None, None
+        return self.encode_cache.encode(cache_key, x, x_timestamp)
+
+    def _prepare_series(self, i, x, x_timestamp, y_timestamp, pred_len, cache_key):
+        """
+        Validates series `i` of a batch and normalizes it.
 
-        x_time_df = calc_time_stamps(x_timestamp)
-        y_time_df = calc_time_stamps(y_timestamp)
+        Returns:
+            Tuple: (x_norm, x_stamp, y_stamp, x_mean, x_std, x_token); `x_token` is None unless `encode_cache` holds
+                the series.
+        """
+        x = self._check_values(x, f"Input at index {i}")
+        x_timestamp = to_datetime64(x_timestamp)
+        x_stamp = time_features(x_timestamp).astype(np.float32)
+        y_stamp = time_features(to_datetime64(y_timestamp)).astype(np.float32)
+
+        if x.shape[0] != x_stamp.shape[0]:
+            raise ValueError(f"Inconsistent lengths at index {i}: x has {x.shape[0]} vs x_stamp has {x_stamp.shape[0]}.")
+        if y_stamp.shape[0] != pred_len:
+            raise ValueError(f"y_timestamp length at index {i} should equal pred_len={pred_len}, got {y_stamp.shape[0]}.")
+
+        x_mean, x_std, x_token = self._encode_cached(cache_key, x, x_timestamp)
+        if x_token is None:
+            x_mean, x_std = np.mean(x, axis=0), np.std(x, axis=0)
+        x_norm = (x - x_mean) / (x_std + 1e-5)
+        x_norm = np.clip(x_norm, -self.clip, self.clip)
+        return x_norm, x_stamp, y_stamp, x_mean, x_std, x_token
+
+    def predict(self, df, x_timestamp, y_timestamp, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, verbose=True, quantiles=None, return_samples=False,
+                cache_key=None):
+        """
+        Forecasts `pred_len` steps of a single series.
+
+        A DataFrame wrapper around `predict_arrays`. With `cache_key` (e.g. (source, symbol, interval)) and an
+        `encode_cache`, the window is tokenized incrementally from the state of the previous window of that key,
+        see `EncoderTokenCache`.
+
+        Returns:
+            pd.DataFrame: Mean forecast indexed by `y_timestamp`. When `quantiles` (e.g. `FORECAST_QUANTILES`) or
+                `return_samples` is given, a dict instead: 'mean' (that DataFrame), 'quantiles' ({level: DataFrame})
+                and, with `return_samples`, 'samples' (np.ndarray of shape (sample_count, pred_len, 6)).
+        """
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError("Input must be a pandas DataFrame.")
 
-        x = df[self.price_cols + [self.vol_col, self.amt_vol]].values.astype(np.float32)
-        x_stamp = x_time_df.values.astype(np.float32)
-        y_stamp = y_time_df.values.astype(np.float32)
+        if not all(col in df.columns for col in self.price_cols):
+            raise ValueError(f"Price columns {self.price_cols} not found in DataFrame.")
 
-        x_mean, x_std = np.mean(x, axis=0), np.std(x, axis=0)
+        x = self._check_values(self._frame_values(df), "Input DataFrame")
+        result = self.predict_arrays(x, to_datetime64(x_timestamp), to_datetime64(y_timestamp), pred_len, T, top_k, top_p,
+                                     sample_count, verbose, quantiles, return_samples, cache_key)
+        return self._to_frames(result, y_timestamp)
 
-        x = (x - x_mean) / (x_std + 1e-5)
-        x = np.clip(x, -self.clip, self.clip)
+    def predict_arrays(self, x, x_timestamp, y_timestamp, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, verbose=True,
+                       quantiles=None, return_samples=False, cache_key=None, step_callback=None):
+        """
+        Forecasts `pred_len` steps of a single series given as arrays, without going through pandas.
 
-        x = x[np.newaxis, :]
-        x_stamp = x_stamp[np.newaxis, :]
-        y_stamp = y_stamp[np.newaxis, :]
+        Args:
+            x (np.ndarray): History of shape (lookback, 6), columns open, high, low, close, volume, amount;
+                preferably contiguous float32, which is used without a copy.
+            x_timestamp (np.ndarray): datetime64 or int64 epoch nanoseconds of the `lookback` history steps.
+            y_timestamp (np.ndarray): Same for the `pred_len` predicted steps.
+            step_callback (Callable[[int], None], optional): See `predict_batch_arrays`.
+            Other arguments as in `predict`.
 
-        preds = self.generate(x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose)
+        Returns:
+            np.ndarray: Mean forecast of shape (pred_len, 6). When `quantiles` or `return_samples` is given, a dict
+                instead: 'mean' (that array), 'quantiles' ({level: array}) and, with `return_samples`, 'samples'
+                (shape (sample_count, pred_len, 6)).
+        """
+        x = self._check_values(x, "Input")
+        return self.predict_batch_arrays([x], [x_timestamp], [y_timestamp], pred_len, T, top_k, top_p, sample_count, verbose,
+                                         quantiles, return_samples, cache_keys=[cache_key], step_callback=step_callback)[0]
 
-        preds = preds.squeeze(0)
-        preds = preds * (x_std + 1e-5) + x_mean
+    def predict_stream(self, x, x_timestamp, y_timestamp, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, quantiles=None,
+                       chunk_size=10, cache_key=None):
+        """
+        Forecasts a single series like `predict_arrays`, yielding the forecast in chunks of `chunk_size` steps while
+        it is generated.
 
-        pred_df = pd.DataFrame(preds, columns=self.price_cols + [self.vol_col, self.amt_vol], index=y_timestamp)
-        return pred_df
+        Generation runs in a background thread with all samples of the series in one pass, so each chunk is
+        aggregated once its steps are decoded; decoding a partial horizon gives the values the complete forecast
+        has for those steps, up to float rounding. Closing the generator stops generation at its next step.
 
+        Args:
+            chunk_size (int): Steps per chunk; the last chunk may be shorter.
+            Other arguments as in `predict_arrays`.
 
-    def predict_batch(self, df_list, x_timestamp_list, y_timestamp_list, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, verbose=True):
+        Yields:
+            dict: 'start' (index of the chunk's first step in the horizon), 'mean' (array of shape (n, 6)) and
+                'quantiles' ({level: array}).
         """
-        Perform parallel (batch) prediction on multiple time series. All series must have the same historical length and prediction length (pred_len).
+        x = self._check_values(x, "Input")
+        check_quantiles(quantiles)
+        x_norm, x_stamp, y_stamp, x_mean, x_std, x_token = self._prepare_series(0, x, x_timestamp, y_timestamp, pred_len, cache_key)
+        x_norm, x_stamp, y_stamp = x_norm[None], x_stamp[None], y_stamp[None]
+        x_token = self._bucket_tokens([x_token], x_norm, np.zeros(x_norm.shape[:2], dtype=bool))
+
+        chunks = queue.Queue()
+        closed = threading.Event()
+        finished = object()
+
+        def check_closed(steps):
+            if closed.is_set():
+                raise RuntimeError("Forecast stream closed.")
+
+        def on_chunk(start, forecast):
+            chunks.put((start, self._denormalize(forecast, 0, x_mean, x_std, quantiles or [], False)))
+
+        def run():
+            try:
+                self.generate_forecast(x_norm, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, False, quantiles or (),
+                                       x_token=x_token, step_callback=check_closed, chunk_callback=on_chunk,
+                                       chunk_size=max(1, int(chunk_size)))
+                chunks.put(finished)
+            except Exception as e:
+                chunks.put(e)
+
+        thread = threading.Thread(target=run, name='KronosStream', daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is finished:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                start, result = item
+                yield {'start': start, **result}
+        finally:
+            closed.set()
+            thread.join()
+
+    def predict_batch(self, df_list, x_timestamp_list, y_timestamp_list, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1, verbose=True,
+                      quantiles=None, return_samples=False, max_padding=MAX_PADDING_FRACTION, cache_keys=None):
+        """
+        Perform parallel (batch) prediction on multiple time series. All series share the prediction length (pred_len);
+        their historical lengths may differ. A DataFrame wrapper around `predict_batch_arrays`.
 
         Args:
             df_list (List[pd.DataFrame]): List of input DataFrames, each containing price columns and optional volume/amount columns.
             x_timestamp_list (List[pd.DatetimeIndex or Series]): List of timestamps corresponding to historical data, length should match the number of rows in each DataFrame.
             y_timestamp_list (List[pd.DatetimeIndex or Series]): List of future prediction timestamps, length should equal pred_len.
             pred_len (int): Number of prediction steps.
-            T (float): Sampling temperature.
-            top_k (int): Top-k filtering threshold.
-            top_p (float): Top-p (nucleus sampling) threshold.
-            sample_count (int): Number of parallel samples per series, automatically averaged internally.
-            verbose (bool): Whether to display autoregressive progress.
+            Other arguments as in `predict_batch_arrays`.
 
         Returns:
             List[pd.DataFrame]: List of prediction results in the same order as input, each DataFrame contains
                                 `open, high, low, close, volume, amount` columns, indexed by corresponding `y_timestamp`.
+                                With `quantiles` or `return_samples`, each entry is a dict as returned by `predict`.
         """
         # Basic validation
         if not isinstance(df_list, (list, tuple)) or not isinstance(x_timestamp_list, (list, tuple)) or not isinstance(y_timestamp_list, (list, tuple)):
@@ -586,79 +1565,99 @@ class KronosPredictor:
         if not (len(df_list) == len(x_timestamp_list) == len(y_timestamp_list)):
             raise ValueError("df_list, x_timestamp_list, y_timestamp_list must have consistent lengths.")
 
-        num_series = len(df_list)
-
         x_list = []
-        x_stamp_list = []
-        y_stamp_list = []
-        means = []
-        stds = []
-        seq_lens = []
-        y_lens = []
-
-        for i in range(num_series):
-            df = df_list[i]
+        for i, df in enumerate(df_list):
             if not isinstance(df, pd.DataFrame):
                 raise ValueError(f"Input at index {i} is not a pandas DataFrame.")
             if not all(col in df.columns for col in self.price_cols):
                 raise ValueError(f"DataFrame at index {i} is missing price columns {self.price_cols}.")
+            x_list.append(self._check_values(self._frame_values(df), f"DataFrame at index {i}"))
 
-            df = df.copy()
-            if self.vol_col not in df.columns:
-                df[self.vol_col] = 0.0
-                df[self.amt_vol] = 0.0
-            if self.amt_vol not in df.columns and self.vol_col in df.columns:
-                df[self.amt_vol] = df[self.vol_col] * df[self.price_cols].mean(axis=1)
+        results = self.predict_batch_arrays(x_list, [to_datetime64(t) for t in x_timestamp_list],
+                                            [to_datetime64(t) for t in y_timestamp_list], pred_len, T, top_k, top_p,
+                                            sample_count, verbose, quantiles, return_samples, max_padding, cache_keys)
+        return [self._to_frames(result, y_timestamp) for result, y_timestamp in zip(results, y_timestamp_list)]
 
-            if df[self.price_cols + [self.vol_col, self.amt_vol]].isnull().values.any():
-                raise ValueError(f"DataFrame at index {i} contains NaN values in price or volume columns.")
+    def predict_batch_arrays(self, x_list, x_timestamp_list, y_timestamp_list, pred_len, T=1.0, top_k=0, top_p=0.9, sample_count=1,
+                             verbose=True, quantiles=None, return_samples=False, max_padding=MAX_PADDING_FRACTION, cache_keys=None,
+                             step_callback=None):
+        """
+        Batch version of `predict_arrays`.
 
-            x_timestamp = x_timestamp_list[i]
-            y_timestamp = y_timestamp_list[i]
+        Series are grouped by history length (see `plan_length_buckets`) and each group runs as one batch, with its
+        shorter series left-padded and the padding masked out of attention, so every series is forecast as if it
+        were predicted on its own.
 
-            x_time_df = calc_time_stamps(x_timestamp)
-            y_time_df = calc_time_stamps(y_timestamp)
+        Args:
+            x_list (List[np.ndarray]): Histories of shape (lookback_i, 6), see `predict_arrays`.
+            x_timestamp_list (List[np.ndarray]): datetime64 or int64 epoch nanoseconds of each history.
+            y_timestamp_list (List[np.ndarray]): Same for the predicted steps, each of length `pred_len`.
+            pred_len (int): Number of prediction steps.
+            T (float): Sampling temperature.
+            top_k (int): Top-k filtering threshold.
+            top_p (float): Top-p (nucleus sampling) threshold.
+            sample_count (int): Number of parallel samples per series, automatically averaged internally.
+            verbose (bool): Whether to display autoregressive progress.
+            quantiles (Sequence[float], optional): Quantile levels to report as forecast bands.
+            return_samples (bool): Whether to also return the sampled trajectories.
+            max_padding (float): Largest share of a series' steps that may be left padding; 0 batches equal lengths only.
+            cache_keys (List[Hashable], optional): Per series `cache_key` as in `predict`; None entries are not cached.
+            step_callback (Callable[[int], None], optional): Called as generation advances with the number of steps
+                completed out of `pred_len`, averaged over the generation runs of the batch. An exception it raises
+                aborts the prediction, e.g. to cancel it.
 
-            x = df[self.price_cols + [self.vol_col, self.amt_vol]].values.astype(np.float32)
-            x_stamp = x_time_df.values.astype(np.float32)
-            y_stamp = y_time_df.values.astype(np.float32)
+        Returns:
+            List: Per series result as returned by `predict_arrays`, in input order.
+        """
+        if not (len(x_list) == len(x_timestamp_list) == len(y_timestamp_list)):
+            raise ValueError("x_list, x_timestamp_list, y_timestamp_list must have consistent lengths.")
+        check_quantiles(quantiles)
 
-            if x.shape[0] != x_stamp.shape[0]:
-                raise ValueError(f"Inconsistent lengths at index {i}: x has {x.shape[0]} vs x_stamp has {x_stamp.shape[0]}.")
-            if y_stamp.shape[0] != pred_len:
-                raise ValueError(f"y_timestamp length at index {i} should equal pred_len={pred_len}, got {y_stamp.shape[0]}.")
+        num_series = len(x_list)
 
-            x_mean, x_std = np.mean(x, axis=0), np.std(x, axis=0)
-            x_norm = (x - x_mean) / (x_std + 1e-5)
-            x_norm = np.clip(x_norm, -self.clip, self.clip)
+        x_list_norm = []
+        x_stamp_list = []
+        y_stamp_list = []
+        means = []
+        stds = []
+        seq_lens = []
+        tokens = []
+
+        for i in range(num_series):
+            x_norm, x_stamp, y_stamp, x_mean, x_std, x_token = self._prepare_series(
+                i, x_list[i], x_timestamp_list[i], y_timestamp_list[i], pred_len, cache_keys[i] if cache_keys else None)
 
-            x_list.append(x_norm)
+            x_list_norm.append(x_norm)
             x_stamp_list.append(x_stamp)
             y_stamp_list.append(y_stamp)
             means.append(x_mean)
             stds.append(x_std)
-
+            tokens.append(x_token)
             seq_lens.append(x_norm.shape[0])
-            y_lens.append(y_stamp.shape[0])
-
-        # Require all series to have consistent historical and prediction lengths for batch processing
-        if len(set(seq_lens)) != 1:
-            raise ValueError(f"Parallel prediction requires all series to have consistent historical lengths, got: {seq_lens}")
-        if len(set(y_lens)) != 1:
-            raise ValueError(f"Parallel prediction requires all series to have consistent prediction lengths, got: {y_lens}")
-
-        x_batch = np.stack(x_list, axis=0).astype(np.float32)           # (B, seq_len, feat)
-        x_stamp_batch = np.stack(x_stamp_list, axis=0).astype(np.float32) # (B, seq_len, time_feat)
-        y_stamp_batch = np.stack(y_stamp_list, axis=0).astype(np.float32) # (B, pred_len, time_feat)
-
-        preds = self.generate(x_batch, x_stamp_batch, y_stamp_batch, pred_len, T, top_k, top_p, sample_count, verbose)
-        # preds: (B, pred_len, feat)
-
-        pred_dfs = []
-        for i in range(num_series):
-            preds_i = preds[i] * (stds[i] + 1e-5) + means[i]
-            pred_df = pd.DataFrame(preds_i, columns=self.price_cols + [self.vol_col, self.amt_vol], index=y_timestamp_list[i])
-            pred_dfs.append(pred_df)
-
-        return pred_dfs
 
+        results = [None] * num_series
+        buckets = self.plan_length_buckets(seq_lens, max_padding)
+        progress = StepProgress(step_callback, len(buckets)) if step_callback is not None else None
+        for b, bucket in enumerate(buckets):
+            seq_len = seq_lens[bucket[0]]
+            x_batch = np.zeros((len(bucket), seq_len, x_list_norm[bucket[0]].shape[1]), dtype=np.float32)        # (B, seq_len, feat)
+            x_stamp_batch = np.zeros((len(bucket), seq_len, x_stamp_list[bucket[0]].shape[1]), dtype=np.float32) # (B, seq_len, time_feat)
+            padding_mask = np.zeros((len(bucket), seq_len), dtype=bool)
+            for row, i in enumerate(bucket):
+                # Left padding keeps the last history step aligned with the start of generation
+                pad = seq_len - seq_lens[i]
+                x_batch[row, pad:] = x_list_norm[i]
+                x_stamp_batch[row, pad:] = x_stamp_list[i]
+                padding_mask[row, :pad] = True
+            y_stamp_batch = np.stack([y_stamp_list[i] for i in bucket], axis=0) # (B, pred_len, time_feat)
+            x_token = self._bucket_tokens([tokens[i] for i in bucket], x_batch, padding_mask)
+
+            forecast = self.generate_forecast(x_batch, x_stamp_batch, y_stamp_batch, pred_len, T, top_k, top_p, sample_count, verbose,
+                                              quantiles or (), return_samples, padding_mask if padding_mask.any() else None, x_token,
+                                              progress.part(b) if progress is not None else None)
+            # forecast['mean']: (B, pred_len, feat)
+
+            for row, i in enumerate(bucket):
+                results[i] = self._denormalize(forecast, row, means[i], stds[i], quantiles, return_samples)
+
+        return results
@@ -282,26 +282,38 @@ class FeedForward(nn.Module):
 
 
 class RotaryPositionalEmbedding(nn.Module):
+    # cos/sin tables shared by every instance with the same dimension on the same device,
+    # keyed by (dim, device) and grown on demand
+    _tables = {}
+
     def __init__(self, dim):
         super().__init__()
         inv_freq = 1.0 / (10000 ** (torch.arange(0, dim, 2).float() / dim))
         self.register_buffer("inv_freq", inv_freq)
-        self.seq_len_cached = None
-        self.cos_cached = None
-        self.sin_cached = None
-
-    def _update_cos_sin_cache(self, x, seq_len):
-        if seq_len != self.seq_len_cached:
-            self.seq_len_cached = seq_len
-            t = torch.arange(seq_len, device=x.device).type_as(self.inv_freq)
-            freqs = torch.einsum('i,j->ij', t, self.inv_freq)
-            emb = torch.cat((freqs, freqs), dim=-1).to(x.device)
-            self.cos_cached = emb.cos()[None, None, :, :]
-            self.sin_cached = emb.sin()[None, None, :, :]
-        return self.cos_cached, self.sin_cached
 
-    def forward(self, q, k):
-        cos, sin = self._update_cos_sin_cache(q, q.shape[-2])
+    def reserve(self, seq_len):
+        """Makes sure the shared tables cover positions [0, seq_len) on this module's device."""
+        key = (self.inv_freq.numel(), self.inv_freq.device)
+        tables = self._tables.get(key)
+        if tables is None or tables[0].shape[-2] < seq_len:
+            if tables is not None:
+                # Grow geometrically so absolute positions past the reserved context rebuild rarely
+                seq_len = max(seq_len, 2 * tables[0].shape[-2])
+            t = torch.arange(seq_len, device=self.inv_freq.device).type_as(self.inv_freq)
+            freqs = torch.einsum('i,j->ij', t, self.inv_freq)
+            emb = torch.cat((freqs, freqs), dim=-1)
+            tables = (emb.cos()[None, None, :, :], emb.sin()[None, None, :, :])
+            self._tables[key] = tables
+        return tables
+
+    def _update_cos_sin_cache(self, x, seq_len, offset=0):
+        cos, sin = self.reserve(offset + seq_len)
+        return cos[:, :, offset:offset + seq_len], sin[:, :, offset:offset + seq_len]
+
+    def forward(self, q, k, offset=0):
+        cos, sin = self._update_cos_sin_cache(q, q.shape[-2], offset)
+        # Tables are float32; match reduced-precision activations so cached keys keep their dtype
+        cos, sin = cos.to(q.dtype), sin.to(q.dtype)
         return (
             (q * cos) + (self._rotate_half(q) * sin),
             (k * cos) + (self._rotate_half(k) * sin),
@@ -312,6 +324,165 @@ class RotaryPositionalEmbedding(nn.Module):
         return torch.cat((-x2, x1), dim=-1)
 
 
+def reserve_rotary_tables(module, seq_len):
+    """Precomputes the shared rotary tables used by `module` for sequences up to `seq_len`."""
+    for m in module.modules():
+        if isinstance(m, RotaryPositionalEmbedding):
+            m.reserve(seq_len)
+
+
+def padding_attention_mask(key_padding_mask, q_len, causal=True):
+    """
+    Boolean attention mask that hides padded keys, for queries at the last `q_len` positions.
+
+    Padded queries still attend to their own position, so no row is fully masked: the softmax of such a row
+    would be NaN, and NaN values leak through the zero weights of later layers.
+
+    Args:
+        key_padding_mask (torch.Tensor): True (or nonzero) at padded positions. Shape: [batch, k_len]
+        q_len (int): Number of query positions.
+        causal (bool): Whether queries also only see keys at or before their own position.
+
+    Returns:
+        torch.Tensor: True where attention is allowed. Shape: [batch, 1, q_len, k_len]
+    """
+    k_len = key_padding_mask.size(1)
+    key_pos = torch.arange(k_len, device=key_padding_mask.device)
+    query_pos = key_pos[k_len - q_len:]
+    mask = ~key_padding_mask.bool()[:, None, :] | (key_pos[None, :] == query_pos[:, None])
+    if causal:
+        mask = mask & (key_pos[None, :] <= query_pos[:, None])
+    return mask.unsqueeze(1)
+
+
+class KVCache:
+    """
+    Per-layer key/value cache for incremental decoding.
+
+    Keys are stored after the rotary embedding has been applied at their absolute position. Since
+    RoPE attention scores depend only on the relative offset between query and key, earlier entries
+    stay valid as new tokens are appended. Before each forward pass the caller reserves the positions
+    of the new tokens with `advance`; every attention layer then writes its keys/values for those
+    positions with `update`.
+
+    The cache is a ring buffer of `max_len` slots: once full, position `p` overwrites slot
+    `p % max_len`, so the attention window slides forward without moving any data.
+
+    Queries attend over at most `window` positions. With `n` spare slots beyond the window, a pass can
+    add up to `n + 1` positions, and `truncate` can drop rejected ones as speculative decoding does,
+    without overwriting keys that later queries still see.
+
+    Padded positions of a ragged batch are recorded per slot when they are reserved (see `advance`) and
+    hidden from every later query, so later passes need no padding mask of their own.
+
+    Args:
+        n_layers (int): Number of attention layers sharing the cache.
+        max_len (int): Number of positions kept.
+        window (int, optional): Attention window. Defaults to `max_len`.
+    """
+
+    def __init__(self, n_layers, max_len, window=None):
+        self.n_layers = n_layers
+        self.max_len = max_len
+        self.window = min(window or max_len, max_len)
+        self.keys = [None] * n_layers
+        self.values = [None] * n_layers
+        self.seq_len = 0
+        self.step_start = 0
+        # Bool [batch, max_len] in slot order, True at padded positions; None while the batch has no padding
+        self.padding = None
+
+    def reset(self):
+        """Drops all cached positions, keeping the allocated buffers."""
+        self.seq_len = 0
+        self.step_start = 0
+        self.padding = None
+
+    def truncate(self, seq_len):
+        """Drops the positions from `seq_len` on; their slots are overwritten by the next `advance`."""
+        self.seq_len = min(self.seq_len, seq_len)
+        self.step_start = min(self.step_start, self.seq_len)
+
+    def repeat_interleave(self, repeats):
+        """Repeats every batch row `repeats` times in place, e.g. to share the state of a prefix between samples."""
+        self.keys = [k.repeat_interleave(repeats, dim=0) if k is not None else None for k in self.keys]
+        self.values = [v.repeat_interleave(repeats, dim=0) if v is not None else None for v in self.values]
+        if self.padding is not None:
+            self.padding = self.padding.repeat_interleave(repeats, dim=0)
+
+    def advance(self, n, padding_mask=None):
+        """
+        Reserves the next `n` positions for the upcoming forward pass.
+
+        Args:
+            n (int): Number of new positions.
+            padding_mask (torch.Tensor, optional): True at padded positions among the new ones. Shape: [batch, n]
+        """
+        if n > self.max_len:
+            raise ValueError(f"Cannot cache {n} new positions with max_len={self.max_len}")
+        self.step_start = self.seq_len
+        self.seq_len += n
+        if padding_mask is not None and self.padding is None:
+            self.padding = padding_mask.new_zeros(padding_mask.size(0), self.max_len, dtype=torch.bool)
+        if self.padding is not None:
+            slots = torch.arange(self.step_start, self.seq_len, device=self.padding.device) % self.max_len
+            self.padding[:, slots] = padding_mask.bool() if padding_mask is not None else False
+
+    def update(self, layer_idx, k, v):
+        """
+        Writes the keys/values of the reserved positions and returns those of all cached positions.
+
+        Args:
+            layer_idx (int): Layer index.
+            k, v (torch.Tensor): Shape [batch, n_heads, n, head_dim] for the reserved positions.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: Keys and values of shape [batch, n_heads, min(seq_len, max_len), head_dim],
+                in slot order.
+        """
+        if self.keys[layer_idx] is None:
+            batch_size, n_heads, _, head_dim = k.shape
+            self.keys[layer_idx] = k.new_empty(batch_size, n_heads, self.max_len, head_dim)
+            self.values[layer_idx] = v.new_empty(batch_size, n_heads, self.max_len, head_dim)
+        keys, values = self.keys[layer_idx], self.values[layer_idx]
+
+        slot = self.step_start % self.max_len
+        n_first = min(self.seq_len - self.step_start, self.max_len - slot)
+        keys[:, :, slot:slot + n_first] = k[:, :, :n_first]
+        values[:, :, slot:slot + n_first] = v[:, :, :n_first]
+        if n_first < k.size(2):
+            keys[:, :, :k.size(2) - n_first] = k[:, :, n_first:]
+            values[:, :, :k.size(2) - n_first] = v[:, :, n_first:]
+
+        n_valid = min(self.seq_len, self.max_len)
+        return keys[:, :, :n_valid], values[:, :, :n_valid]
+
+    def attention_mask(self, q_len, device):
+        """
+        Causal mask for queries at the last `q_len` cached positions.
+
+        Padded keys are hidden as in `padding_attention_mask`; the mask then has shape [batch, 1, q_len, n_valid].
+
+        Returns:
+            Tuple[Optional[torch.Tensor], bool]: (attn_mask, is_causal) arguments for scaled_dot_product_attention.
+        """
+        n_valid = min(self.seq_len, self.max_len)
+        if self.padding is None:
+            if q_len == self.seq_len and q_len <= self.window:
+                return None, True
+            if q_len == 1 and n_valid <= self.window:
+                return None, False
+        slots = torch.arange(n_valid, device=device)
+        # Absolute position currently held by each slot
+        key_pos = self.seq_len - 1 - (self.seq_len - 1 - slots) % self.max_len
+        query_pos = torch.arange(self.seq_len - q_len, self.seq_len, device=device)
+        mask = (key_pos[None, :] <= query_pos[:, None]) & (key_pos[None, :] > query_pos[:, None] - self.window)
+        if self.padding is not None:
+            visible = ~self.padding[:, None, :n_valid] | (key_pos[None, :] == query_pos[:, None])
+            mask = (mask & visible).unsqueeze(1)
+        return mask, False
+
+
 class MultiHeadAttentionWithRoPE(nn.Module):
     def __init__(self, d_model, n_heads, attn_dropout_p=0.0, resid_dropout_p=0.0):
         super().__init__()
@@ -327,26 +498,38 @@ class MultiHeadAttentionWithRoPE(nn.Module):
         self.attn_dropout_p = attn_dropout_p
         self.resid_dropout = nn.Dropout(resid_dropout_p)
 
-    def forward(self, x, key_padding_mask=None):
+    def forward(self, x, key_padding_mask=None, kv_cache=None, layer_idx=0):
+        """
+        Args:
+            x (torch.Tensor): Input of shape [batch, seq_len, d_model]. With a `kv_cache` these are only
+                the new positions reserved by `KVCache.advance`.
+            key_padding_mask (torch.Tensor, optional): True at padded positions. Shape: [batch, seq_len]. Ignored
+                with a `kv_cache`, which records padding itself.
+            kv_cache (KVCache, optional): Cache holding keys/values of the previous positions.
+            layer_idx (int): Index of this layer inside `kv_cache`.
+        """
         batch_size, seq_len, _ = x.shape
 
         q = self.q_proj(x).view(batch_size, seq_len, self.n_heads, self.head_dim).transpose(1, 2)
         k = self.k_proj(x).view(batch_size, seq_len, self.n_heads, self.head_dim).transpose(1, 2)
         v = self.v_proj(x).view(batch_size, seq_len, self.n_heads, self.head_dim).transpose(1, 2)
 
-        q, k = self.rotary(q, k)
-
-        if key_padding_mask is not None:
-            attn_mask = key_padding_mask.unsqueeze(1).unsqueeze(2)  # [batch, 1, 1, seq_len]
-            attn_mask = attn_mask.expand(-1, self.n_heads, seq_len, -1)  # [batch, n_heads, q_len, k_len]
+        if kv_cache is not None:
+            q, k = self.rotary(q, k, offset=kv_cache.step_start)
+            k, v = kv_cache.update(layer_idx, k, v)
+            attn_mask, is_causal = kv_cache.attention_mask(seq_len, x.device)
         else:
-            attn_mask = None
+            q, k = self.rotary(q, k)
+            if key_padding_mask is not None:
+                attn_mask, is_causal = padding_attention_mask(key_padding_mask, seq_len), False
+            else:
+                attn_mask, is_causal = None, True
 
         attn_output = F.scaled_dot_product_attention(
             q, k, v,
             attn_mask=attn_mask,
             dropout_p=self.attn_dropout_p if self.training else 0.0,
-            is_causal=True
+            is_causal=is_causal
         )
 
         attn_output = attn_output.transpose(1, 2).contiguous().view(batch_size, seq_len, self.d_model)
@@ -368,7 +551,7 @@ class MultiHeadCrossAttentionWithRoPE(nn.Module):
         self.attn_dropout_p = attn_dropout_p
         self.resid_dropout = nn.Dropout(resid_dropout)
 
-    def forward(self, query, key, value, key_padding_mask=None):
+    def forward(self, query, key, value, key_padding_mask=None, kv_cache=None, layer_idx=0):
         batch_size, q_len, _ = query.shape
         _, seq_len, _ = key.shape
 
@@ -376,15 +559,17 @@ class MultiHeadCrossAttentionWithRoPE(nn.Module):
         k = self.k_proj(key).view(batch_size, seq_len, self.n_heads, self.head_dim).transpose(1, 2)
         v = self.v_proj(value).view(batch_size, seq_len, self.n_heads, self.head_dim).transpose(1, 2)
 
-        q, k = self.rotary(q, k)
-
-        if key_padding_mask is not None:
-            attn_mask = key_padding_mask.unsqueeze(1).unsqueeze(2)
-            attn_mask = attn_mask.expand(-1, self.n_heads, q_len, -1)
+        if kv_cache is not None:
+            # At inference every query is a single sibling token, for which the rotary embedding
+            # is the identity, so cached keys are stored unrotated.
+            k, v = kv_cache.update(layer_idx, k, v)
+            attn_mask, is_causal_flag = kv_cache.attention_mask(q_len, query.device)
         else:
-            attn_mask = None
-
-        is_causal_flag = self.training
+            q, k = self.rotary(q, k)
+            if key_padding_mask is not None:
+                attn_mask, is_causal_flag = padding_attention_mask(key_padding_mask, q_len, causal=self.training), False
+            else:
+                attn_mask, is_causal_flag = None, self.training
 
         attn_output = F.scaled_dot_product_attention(
             q, k, v,
@@ -414,6 +599,24 @@ class HierarchicalEmbedding(nn.Module):
         nn.init.normal_(self.emb_s1.weight, mean=0, std=d_model ** -0.5)
         nn.init.normal_(self.emb_s2.weight, mean=0, std=d_model ** -0.5)
 
+        # Per-vocabulary tables with the scaling and fusion_proj folded in, see `fold`
+        self.register_buffer('folded_s1', None, persistent=False)
+        self.register_buffer('folded_s2', None, persistent=False)
+
+    @torch.no_grad()
+    def fold(self):
+        """
+        Folds the embedding scale and `fusion_proj` into one lookup table per sub-token.
+
+        `fusion_proj` is linear, so projecting the concatenated embeddings equals summing
+        per-vocabulary rows of `emb_s1 @ W1^T` and `emb_s2 @ W2^T + b`. In eval mode `forward` then
+        costs two gathers and an add. Call again after the weights change.
+        """
+        scale = math.sqrt(self.d_model)
+        w_s1, w_s2 = self.fusion_proj.weight.split(self.d_model, dim=1)
+        self.folded_s1 = (self.emb_s1.weight * scale) @ w_s1.t()
+        self.folded_s2 = (self.emb_s2.weight * scale) @ w_s2.t() + self.fusion_proj.bias
+
     def split_token(self, token_ids: torch.Tensor, s2_bits: int):
         """Inputs:
             token_ids (torch.Tensor): Composite token IDs of shape [batch_size, seq_len] or [N], each in range [0, 2^(s1_bits + s2_bits) - 1].
@@ -438,6 +641,8 @@ class HierarchicalEmbedding(nn.Module):
             s1_ids, s2_ids = token_ids
         else:
             s1_ids, s2_ids = self.split_token(token_ids, self.s2_bits)
+        if self.folded_s1 is not None and not self.training:
+            return F.embedding(s1_ids, self.folded_s1) + F.embedding(s2_ids, self.folded_s2)
         s1_emb = self.emb_s1(s1_ids) * math.sqrt(self.d_model)
         s2_emb = self.emb_s2(s2_ids) * math.sqrt(self.d_model)
         return self.fusion_proj(torch.cat([s1_emb, s2_emb], dim=-1))
@@ -449,16 +654,21 @@ class DependencyAwareLayer(nn.Module):
         self.cross_attn = MultiHeadCrossAttentionWithRoPE(d_model, n_heads, attn_dropout_p, resid_dropout)
         self.norm = RMSNorm(d_model)
 
-    def forward(self, hidden_states, sibling_embed, key_padding_mask=None):
+    def forward(self, hidden_states, sibling_embed, key_padding_mask=None, kv_cache=None, layer_idx=0):
         """hidden_states: [batch, seq_len, d_model]
-        sibling_embed: Embedding from another subtoken
+        sibling_embed: Embedding from another subtoken, [batch, q_len, d_model]. When q_len < seq_len the
+            queries belong to the last q_len positions, which still attend over all of hidden_states.
+        kv_cache: optional KVCache holding the hidden states of earlier positions
         """
         attn_out = self.cross_attn(
             query=sibling_embed,
             key=hidden_states,
             value=hidden_states,
-            key_padding_mask=key_padding_mask
+            key_padding_mask=key_padding_mask,
+            kv_cache=kv_cache,
+            layer_idx=layer_idx
         )
+        hidden_states = hidden_states[:, -sibling_embed.size(1):]
         return self.norm(hidden_states + attn_out)
 
 
@@ -470,10 +680,10 @@ class TransformerBlock(nn.Module):
         self.norm2 = RMSNorm(d_model)
         self.ffn = FeedForward(d_model, ff_dim, ffn_dropout_p)
 
-    def forward(self, x, key_padding_mask=None):
+    def forward(self, x, key_padding_mask=None, kv_cache=None, layer_idx=0):
         residual = x
         x = self.norm1(x)
-        attn_out = self.self_attn(x, key_padding_mask=key_padding_mask)
+        attn_out = self.self_attn(x, key_padding_mask=key_padding_mask, kv_cache=kv_cache, layer_idx=layer_idx)
         x = residual + attn_out
 
         residual = x
@@ -549,17 +759,30 @@ class TemporalEmbedding(nn.Module):
         self.weekday_embed = Embed(weekday_size, d_model)
         self.day_embed = Embed(day_size, d_model)
         self.month_embed = Embed(month_size, d_model)
+        # Row offset of each field's table in the concatenated table
+        sizes = torch.tensor([0, minute_size, hour_size, weekday_size, day_size])
+        self.register_buffer('offsets', sizes.cumsum(0), persistent=False)
+        # Concatenated table of all fields, see `fold`
+        self.register_buffer('folded_table', None, persistent=False)
+
+    @torch.no_grad()
+    def fold(self):
+        """
+        Concatenates the per-field tables once, so eval-mode `forward` does not rebuild them on every call.
+        Call again after the weights change.
+        """
+        self.folded_table = torch.cat(self._tables())
 
-    def forward(self, x):
-        x = x.long()
-
-        minute_x = self.minute_embed(x[:, :, 0])
-        hour_x = self.hour_embed(x[:, :, 1])
-        weekday_x = self.weekday_embed(x[:, :, 2])
-        day_x = self.day_embed(x[:, :, 3])
-        month_x = self.month_embed(x[:, :, 4])
+    def _tables(self):
+        embeds = (self.minute_embed, self.hour_embed, self.weekday_embed, self.day_embed, self.month_embed)
+        return [e.emb.weight if isinstance(e, FixedEmbedding) else e.weight for e in embeds]
 
-        return hour_x + weekday_x + day_x + month_x + minute_x
+    def forward(self, x):
+        # One lookup in the concatenated tables instead of one per field
+        x = x.long() + self.offsets
+        if self.folded_table is not None and not self.training:
+            return F.embedding(x, self.folded_table).sum(dim=-2)
+        return F.embedding(x, torch.cat(self._tables())).sum(dim=-2)
 
 
 
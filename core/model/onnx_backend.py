@@ -0,0 +1,208 @@
+"""
+onnxruntime backend for Kronos inference.
+
+Runs the graphs written by `export_onnx` on onnxruntime's CPU execution provider. Generation, the
+key/value cache, token sampling and the aggregation of samples into forecasts run in onnxruntime and
+NumPy rather than PyTorch modules. PyTorch is still a dependency: the predictor subclasses
+`KronosPredictor` for its pre- and postprocessing, and that module imports torch.
+"""
+
+import json
+import os
+
+import numpy as np
+from tqdm import trange
+
+from .kronos import KronosPredictor
+from .onnx_export import ONNX_GRAPHS, ONNX_META_FILE
+from .sampling import NUCLEUS_CANDIDATES
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNXRUNTIME_AVAILABLE = False
+
+
+def onnx_export_exists(onnx_dir):
+    """Whether `onnx_dir` holds a complete export."""
+    names = [f'{name}.onnx' for name in ONNX_GRAPHS] + [ONNX_META_FILE]
+    return all(os.path.exists(os.path.join(onnx_dir, name)) for name in names)
+
+
+def sample_from_logits_np(logits, rng, temperature=1.0, top_k=None, top_p=None):
+    """
+    NumPy counterpart of `sample_from_logits`: temperature, top-k and nucleus sampling on a candidate set.
+
+    Args:
+        logits (np.ndarray): Shape (batch_size, vocab_size).
+        rng (np.random.Generator): Random source.
+
+    Returns:
+        np.ndarray: Token ids of shape (batch_size,).
+    """
+    top_k = top_k or 0
+    top_p = 1.0 if top_p is None else top_p
+    vocab_size = logits.shape[-1]
+    logits = logits.astype(np.float64) / temperature
+    log_norm = logits.max(axis=-1, keepdims=True)
+    log_norm = log_norm + np.log(np.exp(logits - log_norm).sum(axis=-1, keepdims=True))
+
+    k = vocab_size if top_k <= 0 and top_p >= 1.0 else min(top_k if top_k > 0 else NUCLEUS_CANDIDATES, vocab_size)
+    while True:
+        if k < vocab_size:
+            indices = np.argpartition(-logits, k - 1, axis=-1)[:, :k]
+        else:
+            indices = np.broadcast_to(np.arange(vocab_size), logits.shape)
+        values = np.take_along_axis(logits, indices, axis=-1)
+        order = np.argsort(-values, axis=-1, kind='stable')
+        indices, values = np.take_along_axis(indices, order, axis=-1), np.take_along_axis(values, order, axis=-1)
+        probs = np.exp(values - log_norm)
+        if top_k > 0 or k == vocab_size or (probs.sum(axis=-1) > top_p).all():
+            break
+        k = min(4 * k, vocab_size)
+
+    if top_k > 0:
+        probs = probs / probs.sum(axis=-1, keepdims=True)
+    if top_p < 1.0:
+        # Drop candidates once the mass before them exceeds top_p; the most likely one is always kept
+        mass_before = probs.cumsum(axis=-1) - probs
+        probs = np.where(mass_before > top_p, 0.0, probs)
+
+    cdf = probs.cumsum(axis=-1)
+    draw = rng.random((logits.shape[0], 1)) * cdf[:, -1:]
+    choice = np.minimum((cdf <= draw).sum(axis=-1), k - 1)
+    return indices[np.arange(logits.shape[0]), choice]
+
+
+class OnnxKronosPredictor(KronosPredictor):
+    """
+    `KronosPredictor` that generates through onnxruntime sessions instead of PyTorch modules.
+
+    Preprocessing and de-normalization are shared with `KronosPredictor`. The cache follows the torch backend:
+    each step feeds only the new token, and once the window slides past `max_context` the cache is refilled from
+    the shifted window at every step.
+
+    Args:
+        onnx_dir (str): Directory written by `export_onnx`.
+        max_context (int, optional): Context length; defaults to the one recorded at export.
+        clip (float): Clipping bound of the normalized input.
+        num_threads (int, optional): Intra-op threads per session; onnxruntime's default when None.
+        seed (int, optional): Seed of the sampling random generator.
+    """
+
+    # The exported graphs take no padding mask; `predict_batch` batches equal history lengths only
+    supports_padding = False
+
+    def __init__(self, onnx_dir, max_context=None, clip=5, num_threads=None, seed=None):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("onnxruntime is required for the ONNX backend: pip install onnxruntime")
+        with open(os.path.join(onnx_dir, ONNX_META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self.tokenizer = None
+        self.model = None
+        self.device = 'cpu'
+        self.max_context = max_context or self.meta['max_context']
+        self.clip = clip
+        self.use_cache = True
+        self.memory_budget_mb = None
+        self.max_workers = 1
+        self.precision = 'float32'
+        self.precision_report = None
+        self.encode_cache = None
+        self.price_cols = ['open', 'high', 'low', 'close']
+        self.vol_col = 'volume'
+        self.amt_vol = 'amount'
+        self.time_cols = ['minute', 'hour', 'weekday', 'day', 'month']
+        self.rng = np.random.default_rng(seed)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.sessions = {
+            name: ort.InferenceSession(os.path.join(onnx_dir, f'{name}.onnx'), options, providers=['CPUExecutionProvider'])
+            for name in ONNX_GRAPHS
+        }
+
+    def _sample(self, logits, T, top_k, top_p):
+        return sample_from_logits_np(logits, self.rng, temperature=T, top_k=top_k, top_p=top_p)
+
+    def generate_samples(self, x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose, step_callback=None):
+        """
+        Samples forecasts for a normalized batch.
+
+        Returns:
+            np.ndarray: Decoded samples of the last `pred_len` steps, shape (batch_size, sample_count, pred_len, d_in).
+        """
+        meta, run = self.meta, lambda name, feeds: self.sessions[name].run(None, feeds)
+        x = np.clip(np.asarray(x, dtype=np.float32), -self.clip, self.clip)
+        s1_ids, s2_ids = run('encode', {'x': x})
+
+        batch_size, initial_seq_len = s1_ids.shape[0] * sample_count, s1_ids.shape[1]
+        total_seq_len = initial_seq_len + pred_len
+        full_pre = np.empty((batch_size, total_seq_len), dtype=np.int64)
+        full_post = np.empty((batch_size, total_seq_len), dtype=np.int64)
+        full_pre[:, :initial_seq_len] = np.repeat(s1_ids, sample_count, axis=0)
+        full_post[:, :initial_seq_len] = np.repeat(s2_ids, sample_count, axis=0)
+        full_stamp = np.repeat(np.concatenate([x_stamp, y_stamp], axis=1).astype(np.float32), sample_count, axis=0)
+
+        empty_keys = np.zeros((meta['n_layers'], batch_size, meta['n_heads'], 0, meta['head_dim']), dtype=np.float32)
+        empty_dep_keys = np.zeros((batch_size, meta['dep_heads'], 0, meta['dep_head_dim']), dtype=np.float32)
+
+        for i in (trange if verbose else range)(pred_len):
+            context_end = initial_seq_len + i
+            context_start = max(0, context_end - self.max_context)
+            if i == 0 or context_start > 0:
+                # First pass, or the window slid and the cached states depend on evicted tokens: refill
+                keys = values = empty_keys
+                dep_keys = dep_values = empty_dep_keys
+                offset = 0
+            else:
+                # Only the token sampled in the previous step is new
+                context_start = offset = context_end - 1
+
+            s1_logits, context, keys, values = run('decode_s1', {
+                's1_ids': np.ascontiguousarray(full_pre[:, context_start:context_end]),
+                's2_ids': np.ascontiguousarray(full_post[:, context_start:context_end]),
+                'stamp': np.ascontiguousarray(full_stamp[:, context_start:context_end]),
+                'past_keys': keys, 'past_values': values,
+                'offset': np.array(offset, dtype=np.int64),
+            })
+            sample_pre = self._sample(s1_logits, T, top_k, top_p)
+
+            s2_logits, dep_keys, dep_values = run('decode_s2', {
+                'context': context, 's1_ids': sample_pre[:, None].astype(np.int64),
+                'past_keys': dep_keys, 'past_values': dep_values,
+            })
+            sample_post = self._sample(s2_logits, T, top_k, top_p)
+
+            full_pre[:, context_end] = sample_pre
+            full_post[:, context_end] = sample_post
+            if step_callback is not None:
+                step_callback(i + 1)
+
+        context_start = max(0, total_seq_len - self.max_context)
+        z, = run('decode', {
+            's1_ids': np.ascontiguousarray(full_pre[:, context_start:]),
+            's2_ids': np.ascontiguousarray(full_post[:, context_start:]),
+        })
+        z = z.reshape(-1, sample_count, z.shape[1], z.shape[2])
+        return z[:, :, -pred_len:, :]
+
+    def generate_forecast(self, x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose, quantiles=(), return_samples=False,
+                          padding_mask=None, x_token=None, step_callback=None, chunk_callback=None, chunk_size=1):
+        if padding_mask is not None or x_token is not None:
+            raise ValueError("The ONNX backend does not support padded batches or precomputed tokens.")
+        samples = self.generate_samples(x, x_stamp, y_stamp, pred_len, T, top_k, top_p, sample_count, verbose, step_callback)
+        # Same layout as `ForecastAggregator.result`, computed over the sample axis
+        result = {
+            'mean': samples.mean(axis=1),
+            'quantiles': np.quantile(samples, list(quantiles), axis=1).swapaxes(0, 1).astype(np.float32) if quantiles else None,
+            'samples': samples if return_samples else None,
+        }
+        if chunk_callback is not None:
+            # The exported decoder keeps no state to decode partial horizons, so the forecast streams as one chunk
+            chunk_callback(0, {'mean': result['mean'], 'quantiles': result['quantiles'], 'samples': None})
+        return result
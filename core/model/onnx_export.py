@@ -0,0 +1,189 @@
+"""
+ONNX export of the Kronos tokenizer and the per-step decoding graphs.
+
+Four graphs are written to the export directory, see `ONNX_GRAPHS`:
+
+- encode:    x [batch, seq, d_in] -> s1_ids, s2_ids [batch, seq]
+- decode:    s1_ids, s2_ids [batch, seq] -> x [batch, seq, d_in]
+- decode_s1: s1_ids, s2_ids [batch, q], stamp [batch, q, 5], past_keys, past_values [n_layers, batch, heads, past, head_dim],
+             offset [] -> s1_logits [batch, s1_vocab] (last position), context [batch, q, d_model], present_keys,
+             present_values [n_layers, batch, heads, past + q, head_dim]
+- decode_s2: context [batch, q, d_model], s1_ids [batch, 1], past_keys, past_values [batch, heads, past, head_dim]
+             -> s2_logits [batch, s2_vocab] (last position), present_keys, present_values
+
+Keys are stored after the rotary embedding at their absolute position, as in `KVCache`. `offset` is the absolute
+position of the first new token.
+"""
+
+import copy
+import json
+import os
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+ONNX_GRAPHS = ('encode', 'decode', 'decode_s1', 'decode_s2')
+# Export settings read back by the onnxruntime backend
+ONNX_META_FILE = 'kronos_onnx.json'
+ONNX_OPSET = 17
+
+
+def _split_heads(attn, x):
+    return x.view(x.size(0), x.size(1), attn.n_heads, attn.head_dim).transpose(1, 2)
+
+
+def _attend(attn, q, k, v, past_len):
+    """Attention of the queries at the last q positions over `past_len` cached and the new keys."""
+    q_len, k_len = q.size(2), k.size(2)
+    query_pos = torch.arange(q_len, device=q.device) + past_len
+    key_pos = torch.arange(k_len, device=q.device)
+    mask = key_pos[None, :] <= query_pos[:, None]
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+    return attn.out_proj(out.transpose(1, 2).reshape(q.size(0), q_len, attn.d_model))
+
+
+class _Encode(nn.Module):
+    def __init__(self, tokenizer):
+        super().__init__()
+        self.tokenizer = tokenizer
+
+    def forward(self, x):
+        s1_ids, s2_ids = self.tokenizer.encode(x, half=True)
+        return s1_ids, s2_ids
+
+
+class _Decode(nn.Module):
+    def __init__(self, tokenizer):
+        super().__init__()
+        self.tokenizer = tokenizer
+
+    def forward(self, s1_ids, s2_ids):
+        return self.tokenizer.decode([s1_ids, s2_ids], half=True)
+
+
+class _DecodeS1(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, s1_ids, s2_ids, stamp, past_keys, past_values, offset):
+        model = self.model
+        past_len = past_keys.size(3)
+        x = model.embedding([s1_ids, s2_ids]) + model.time_emb(stamp)
+
+        rotary = model.transformer[0].self_attn.rotary
+        positions = (torch.arange(s1_ids.size(1), device=x.device) + offset).float()
+        freqs = positions[:, None] * rotary.inv_freq[None, :]
+        emb = torch.cat((freqs, freqs), dim=-1)
+        cos, sin = emb.cos()[None, None], emb.sin()[None, None]
+
+        present_keys, present_values = [], []
+        for i, layer in enumerate(model.transformer):
+            attn = layer.self_attn
+            h = layer.norm1(x)
+            q, k, v = _split_heads(attn, attn.q_proj(h)), _split_heads(attn, attn.k_proj(h)), _split_heads(attn, attn.v_proj(h))
+            q = q * cos + rotary._rotate_half(q) * sin
+            k = torch.cat([past_keys[i], k * cos + rotary._rotate_half(k) * sin], dim=2)
+            v = torch.cat([past_values[i], v], dim=2)
+            present_keys.append(k)
+            present_values.append(v)
+            x = x + _attend(attn, q, k, v, past_len)
+            x = x + layer.ffn(layer.norm2(x))
+        x = model.norm(x)
+        return model.head(x[:, -1]), x, torch.stack(present_keys), torch.stack(present_values)
+
+
+class _DecodeS2(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, context, s1_ids, past_keys, past_values):
+        model = self.model
+        dep = model.dep_layer
+        attn = dep.cross_attn
+        # The sibling query sits at the last position; its rotary embedding is the identity
+        q = _split_heads(attn, attn.q_proj(model.embedding.emb_s1(s1_ids)))
+        k = torch.cat([past_keys, _split_heads(attn, attn.k_proj(context))], dim=2)
+        v = torch.cat([past_values, _split_heads(attn, attn.v_proj(context))], dim=2)
+        attn_out = _attend(attn, q, k, v, k.size(2) - 1)
+        x2 = dep.norm(context[:, -1:] + attn_out)
+        return model.head.cond_forward(x2)[:, -1], k, v
+
+
+@torch.no_grad()
+def export_onnx(tokenizer, model, output_dir, max_context, opset=ONNX_OPSET):
+    """
+    Exports the tokenizer and model graphs to `output_dir` for the onnxruntime backend.
+
+    Both modules are exported in float32 on the CPU; the tokenizer's decode tables are folded first. The export
+    works on copies, so the given modules, which may be shared with resident predictors, keep their device and dtype.
+
+    Args:
+        tokenizer (KronosTokenizer): Tokenizer in eval mode.
+        model (Kronos): Model in eval mode.
+        output_dir (str): Target directory, created if missing.
+        max_context (int): Context length the backend slides its window at.
+        opset (int): ONNX opset version.
+
+    Returns:
+        dict: Paths of the written graphs keyed by name, see `ONNX_GRAPHS`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = copy.deepcopy(tokenizer).float().cpu().eval()
+    model = copy.deepcopy(model).float().cpu().eval()
+    tokenizer.fold()
+    model.embedding.fold()
+    model.time_emb.fold()
+
+    attn = model.transformer[0].self_attn
+    n_layers, n_heads, head_dim = model.n_layers, attn.n_heads, attn.head_dim
+    batch, seq = 2, 8
+    x = torch.randn(batch, seq, tokenizer.d_in)
+    ids = torch.zeros(batch, seq, dtype=torch.long)
+    stamp = torch.zeros(batch, seq, 5)
+    past = torch.zeros(n_layers, batch, n_heads, 3, head_dim)
+    context = torch.randn(batch, seq, model.d_model)
+    past_s2 = torch.zeros(batch, n_heads, 3, head_dim)
+
+    graphs = {
+        'encode': (_Encode(tokenizer), (x,), ['x'], ['s1_ids', 's2_ids'],
+                   {'x': {0: 'batch', 1: 'seq'}, 's1_ids': {0: 'batch', 1: 'seq'}, 's2_ids': {0: 'batch', 1: 'seq'}}),
+        'decode': (_Decode(tokenizer), (ids, ids), ['s1_ids', 's2_ids'], ['x'],
+                   {'s1_ids': {0: 'batch', 1: 'seq'}, 's2_ids': {0: 'batch', 1: 'seq'}, 'x': {0: 'batch', 1: 'seq'}}),
+        'decode_s1': (_DecodeS1(model), (ids, ids, stamp, past, past, torch.tensor(3)),
+                      ['s1_ids', 's2_ids', 'stamp', 'past_keys', 'past_values', 'offset'],
+                      ['s1_logits', 'context', 'present_keys', 'present_values'],
+                      {'s1_ids': {0: 'batch', 1: 'q'}, 's2_ids': {0: 'batch', 1: 'q'}, 'stamp': {0: 'batch', 1: 'q'},
+                       'past_keys': {1: 'batch', 3: 'past'}, 'past_values': {1: 'batch', 3: 'past'},
+                       's1_logits': {0: 'batch'}, 'context': {0: 'batch', 1: 'q'},
+                       'present_keys': {1: 'batch', 3: 'total'}, 'present_values': {1: 'batch', 3: 'total'}}),
+        'decode_s2': (_DecodeS2(model), (context, ids[:, :1], past_s2, past_s2),
+                      ['context', 's1_ids', 'past_keys', 'past_values'],
+                      ['s2_logits', 'present_keys', 'present_values'],
+                      {'context': {0: 'batch', 1: 'q'}, 's1_ids': {0: 'batch'},
+                       'past_keys': {0: 'batch', 2: 'past'}, 'past_values': {0: 'batch', 2: 'past'},
+                       's2_logits': {0: 'batch'}, 'present_keys': {0: 'batch', 2: 'total'},
+                       'present_values': {0: 'batch', 2: 'total'}}),
+    }
+
+    paths = {}
+    for name, (module, args, input_names, output_names, dynamic_axes) in graphs.items():
+        paths[name] = os.path.join(output_dir, f'{name}.onnx')
+        torch.onnx.export(module, args, paths[name], input_names=input_names, output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False)
+
+    meta = {
+        'max_context': max_context,
+        'n_layers': n_layers,
+        'n_heads': n_heads,
+        'head_dim': head_dim,
+        'dep_heads': model.dep_layer.cross_attn.n_heads,
+        'dep_head_dim': model.dep_layer.cross_attn.head_dim,
+        'd_in': tokenizer.d_in,
+    }
+    with open(os.path.join(output_dir, ONNX_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return paths
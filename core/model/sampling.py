@@ -0,0 +1,136 @@
+"""
+Token sampling for autoregressive generation.
+"""
+
+import torch
+import torch.nn.functional as F
+
+
+# Candidates gathered per row before nucleus selection; the set is widened for rows
+# whose candidates hold less than top_p of the probability mass
+NUCLEUS_CANDIDATES = 64
+
+
+def top_k_top_p_filtering(
+        logits,
+        top_k: int = 0,
+        top_p: float = 1.0,
+        filter_value: float = -float("Inf"),
+        min_tokens_to_keep: int = 1,
+):
+    """Filter a distribution of logits using top-k and/or nucleus (top-p) filtering
+    Args:
+        logits: logits distribution shape (batch size, vocabulary size)
+        if top_k > 0: keep only top k tokens with highest probability (top-k filtering).
+        if top_p < 1.0: keep the top tokens with cumulative probability >= top_p (nucleus filtering).
+            Nucleus filtering is described in Holtzman et al. (http://arxiv.org/abs/1904.09751)
+        Make sure we keep at least min_tokens_to_keep per batch example in the output
+    From: https://gist.github.com/thomwolf/1a5a29f6962089e871b94cbd09daf317
+    """
+    if top_k > 0:
+        top_k = min(max(top_k, min_tokens_to_keep), logits.size(-1))  # Safety check
+        # Remove all tokens with a probability less than the last token of the top-k
+        indices_to_remove = logits < torch.topk(logits, top_k)[0][..., -1, None]
+        logits[indices_to_remove] = filter_value
+        return logits
+
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+        cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
+
+        # Remove tokens with cumulative probability above the threshold (token with 0 are kept)
+        sorted_indices_to_remove = cumulative_probs > top_p
+        if min_tokens_to_keep > 1:
+            # Keep at least min_tokens_to_keep (set to min_tokens_to_keep-1 because we add the first one below)
+            sorted_indices_to_remove[..., :min_tokens_to_keep] = 0
+        # Shift the indices to the right to keep also the first token above the threshold
+        sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
+        sorted_indices_to_remove[..., 0] = 0
+
+        # scatter sorted tensors to original indexing
+        indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
+        logits[indices_to_remove] = filter_value
+        return logits
+
+
+def filtered_probs(logits, temperature=1.0, top_k=None, top_p=None):
+    """
+    Returns the full distribution `sample_from_logits` draws from, as probabilities over the vocabulary.
+
+    Used where the probability of given tokens is needed rather than a sample, e.g. to accept or reject
+    draft tokens in speculative decoding.
+
+    Args:
+        logits (torch.Tensor): Shape (batch_size, vocab_size).
+
+    Returns:
+        torch.Tensor: Normalized probabilities of shape (batch_size, vocab_size).
+    """
+    top_k = top_k or 0
+    top_p = 1.0 if top_p is None else top_p
+    probs = F.softmax(logits.float() / temperature, dim=-1)
+    if top_k <= 0 and top_p >= 1.0:
+        return probs
+
+    sorted_probs, indices = torch.sort(probs, dim=-1, descending=True)
+    if top_k > 0:
+        sorted_probs[:, top_k:] = 0.0
+        sorted_probs = sorted_probs / sorted_probs.sum(dim=-1, keepdim=True)
+    if top_p < 1.0:
+        mass_before = sorted_probs.cumsum(dim=-1) - sorted_probs
+        sorted_probs = sorted_probs.masked_fill(mass_before > top_p, 0.0)
+    sorted_probs = sorted_probs / sorted_probs.sum(dim=-1, keepdim=True)
+    return torch.zeros_like(probs).scatter_(-1, indices, sorted_probs)
+
+
+def sample_from_logits(logits, temperature=1.0, top_k=None, top_p=None, sample_logits=True):
+    """
+    Samples one token id per row of `logits`.
+
+    Temperature, top-k and nucleus (top-p) filtering work on a partial top-k candidate set rather than
+    a sort of the whole vocabulary. For nucleus-only sampling the candidates' probabilities are taken
+    relative to the full distribution through a single logsumexp, and the set is widened only while some
+    row's candidates hold less than `top_p` of the mass. With `top_k` the nucleus is selected within the
+    top-k tokens. Each call runs at most one softmax.
+
+    Args:
+        logits (torch.Tensor): Shape (batch_size, vocab_size).
+        temperature (float): Sampling temperature.
+        top_k (int, optional): Keep only the k most likely tokens when > 0.
+        top_p (float, optional): Keep the smallest set of tokens whose cumulative probability reaches top_p.
+        sample_logits (bool): Sample from the filtered distribution; otherwise take the most likely token.
+
+    Returns:
+        torch.Tensor: Token ids of shape (batch_size, 1).
+    """
+    if not sample_logits:
+        return torch.argmax(logits, dim=-1, keepdim=True)
+
+    top_k = top_k or 0
+    top_p = 1.0 if top_p is None else top_p
+    vocab_size = logits.size(-1)
+    logits = logits / temperature
+
+    if top_k <= 0 and top_p >= 1.0:
+        return torch.multinomial(F.softmax(logits, dim=-1), num_samples=1)
+
+    if top_k > 0:
+        values, indices = torch.topk(logits, min(top_k, vocab_size), dim=-1)
+        probs = F.softmax(values, dim=-1)
+    else:
+        log_norm = torch.logsumexp(logits, dim=-1, keepdim=True)
+        k = min(NUCLEUS_CANDIDATES, vocab_size)
+        while True:
+            values, indices = torch.topk(logits, k, dim=-1)
+            probs = torch.exp(values - log_norm)
+            if k == vocab_size or bool((probs.sum(dim=-1) > top_p).all()):
+                break
+            k = min(4 * k, vocab_size)
+
+    if top_p < 1.0:
+        # Drop candidates once the mass before them exceeds top_p; the most likely one is always kept
+        mass_before = probs.cumsum(dim=-1) - probs
+        probs = probs.masked_fill(mass_before > top_p, 0.0)
+
+    choice = torch.multinomial(probs, num_samples=1)
+    return indices.gather(-1, choice)
@@ -0,0 +1,155 @@
+"""
+Per-series cache of tokenizer encoder state for rolling prediction windows.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import torch
+
+
+# Trailing bars of a cached window that may be revised in place, such as a still-open candle
+REVISION_BARS = 16
+# Cached positions are re-based after this many windows so rotary positions stay bounded
+MAX_WINDOWS = 16
+
+
+class _Entry:
+    def __init__(self, mean, std, kv_cache, s1_ids, s2_ids, timestamps, tail):
+        self.mean = mean
+        self.std = std
+        self.kv_cache = kv_cache
+        self.s1_ids = s1_ids
+        self.s2_ids = s2_ids
+        # Timestamps of the cached window, and raw rows of its last REVISION_BARS bars
+        self.timestamps = timestamps
+        self.tail = tail
+
+
+class EncoderTokenCache:
+    """
+    Tokens of the latest lookback window per series, extended incrementally as the window rolls forward.
+
+    The tokenizer encoder is causal. When a series' window moves forward, only the new bars are encoded: they
+    attend over the cached keys/values of the last `lookback` bars (a `KVCache` ring buffer with that window), and
+    the token ids of the retained bars are reused. The retained bars were encoded with older bars in view, so
+    tokens can differ from a cold encode of the window, see `scripts/verify_encode_cache.py`. Trailing bars whose values changed,
+    such as a still-open candle, are rolled back with `KVCache.truncate` and encoded again.
+
+    Normalization is held at the statistics of the window an entry was built from, so its tokens stay valid.
+    The entry is rebuilt from scratch when the statistics of the current window drift by more than `tolerance`
+    in any column: the mean shift in units of the cached std, or the std change relative to it. It is also
+    rebuilt when the lookback changes, the new window does not continue the cached one, too many bars are new,
+    or the cached positions span `MAX_WINDOWS` windows.
+
+    Args:
+        tokenizer (KronosTokenizer): Tokenizer in eval mode.
+        max_entries (int): Number of series kept; the least recently used one is dropped first.
+        tolerance (float): Largest normalization drift before an entry is rebuilt.
+        clip (float): Clipping bound of the normalized input.
+        revision_bars (int): Trailing bars checked for revised values.
+    """
+
+    def __init__(self, tokenizer, max_entries=64, tolerance=0.05, clip=5, revision_bars=REVISION_BARS):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.tolerance = tolerance
+        self.clip = clip
+        self.revision_bars = revision_bars
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'rebuilds': 0, 'encoded_bars': 0}
+
+    def encode(self, key, x, timestamps):
+        """
+        Tokens of a raw window, reusing the cached state of `key`.
+
+        Args:
+            key (Hashable): Identity of the series, e.g. (source, symbol, interval).
+            x (np.ndarray): Raw window, shape (lookback, d_in).
+            timestamps (array-like): Timestamps of the rows of `x`, increasing.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, Tuple[torch.Tensor, torch.Tensor]]: Mean and std the window is
+                normalized with, and its s1 / s2 ids of shape (1, lookback).
+        """
+        timestamps = pd.DatetimeIndex(timestamps).values
+        with self._lock, torch.no_grad():
+            entry = self._entries.get(key)
+            plan = self._plan(entry, x, timestamps) if entry is not None else None
+            if plan is None:
+                entry = self._build(x, timestamps)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self.stats['rebuilds'] += 1
+            else:
+                self._extend(entry, x, timestamps, *plan)
+                self.stats['hits'] += 1
+            self._entries.move_to_end(key)
+            return entry.mean, entry.std, (entry.s1_ids, entry.s2_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _plan(self, entry, x, timestamps):
+        """(bars to roll back, bars to encode) to bring `entry` to the window `x`, or None to rebuild."""
+        lookback = len(x)
+        if entry.s1_ids.size(1) != lookback:
+            return None
+        scale = entry.std + 1e-5
+        drift = max((np.abs(x.mean(axis=0) - entry.mean) / scale).max(), (np.abs(x.std(axis=0) - entry.std) / scale).max())
+        if drift > self.tolerance:
+            return None
+
+        # Align the new window with the cached one by the first timestamp of the cached tail
+        tail_start = lookback - len(entry.tail)
+        start = np.flatnonzero(timestamps == entry.timestamps[tail_start])
+        if len(start) == 0 or start[0] > tail_start:
+            return None
+        shift = tail_start - int(start[0])
+        overlap = lookback - shift
+        if not np.array_equal(timestamps[:overlap], entry.timestamps[shift:]):
+            return None
+        # Bars of the cached tail are kept up to the first one whose values changed
+        same = (x[tail_start - shift:overlap] == entry.tail).all(axis=1)
+        kept = len(same) if same.all() else int(np.argmin(same))
+
+        n_rollback = len(same) - kept
+        n_encode = shift + n_rollback
+        if n_encode >= lookback or entry.kv_cache.seq_len + shift > MAX_WINDOWS * lookback:
+            return None
+        return n_rollback, n_encode
+
+    def _normalize(self, x, mean, std):
+        x = np.clip((x - mean) / (std + 1e-5), -self.clip, self.clip)
+        device = self.tokenizer.embed.weight.device
+        return torch.from_numpy(x.astype(np.float32)).unsqueeze(0).to(device)
+
+    def _build(self, x, timestamps):
+        lookback = len(x)
+        mean, std = x.mean(axis=0), x.std(axis=0)
+        kv_cache = self.tokenizer.init_encoder_cache(lookback + self.revision_bars, window=lookback)
+        s1_ids, s2_ids = self.tokenizer.encode(self._normalize(x, mean, std), half=True, kv_cache=kv_cache)
+        self.stats['encoded_bars'] += lookback
+        return _Entry(mean, std, kv_cache, s1_ids, s2_ids, timestamps.copy(), x[-self.revision_bars:].copy())
+
+    def _extend(self, entry, x, timestamps, n_rollback, n_encode):
+        lookback = len(x)
+        kv_cache = entry.kv_cache
+        kv_cache.truncate(kv_cache.seq_len - n_rollback)
+        kept = entry.s1_ids.size(1) - n_rollback
+        s1_ids, s2_ids = entry.s1_ids[:, :kept], entry.s2_ids[:, :kept]
+        new_x = self._normalize(x[len(x) - n_encode:], entry.mean, entry.std)
+        # A pass may add one position more than the spare slots without overwriting keys its queries still see
+        chunk = self.revision_bars + 1
+        for start in range(0, n_encode, chunk):
+            new_s1, new_s2 = self.tokenizer.encode(new_x[:, start:start + chunk], half=True, kv_cache=kv_cache)
+            s1_ids, s2_ids = torch.cat([s1_ids, new_s1], dim=1), torch.cat([s2_ids, new_s2], dim=1)
+        self.stats['encoded_bars'] += n_encode
+        entry.s1_ids, entry.s2_ids = s1_ids[:, -lookback:], s2_ids[:, -lookback:]
+        entry.timestamps = timestamps.copy()
+        entry.tail = x[-self.revision_bars:].copy()
@@ -0,0 +1,309 @@
+"""
+常驻模型注册表模块
+在内存预算内同时保留多个已加载的预测器，切换模型或按请求指定模型时无需重新从磁盘加载
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from .logger import get_logger
+    logger = get_logger()
+except:
+    logger = None
+
+
+def log_info(msg: str):
+    if logger:
+        logger.info(msg)
+    else:
+        print(f"[INFO] {msg}")
+
+
+def log_warning(msg: str):
+    if logger:
+        logger.warning(msg)
+    else:
+        print(f"[WARNING] {msg}")
+
+
+def module_bytes(module) -> int:
+    """模块参数与缓冲区占用的字节数"""
+    if module is None:
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def resolve_device(device: str) -> str:
+    """请求的设备不可用时降级为 CPU"""
+    import torch
+    if device.startswith('cuda') and not torch.cuda.is_available():
+        log_warning("CUDA requested but not available, downgrading to CPU")
+        return 'cpu'
+    if device == 'mps' and not (hasattr(torch.backends, 'mps') and torch.backends.mps.is_available()):
+        log_warning("MPS requested but not available, downgrading to CPU")
+        return 'cpu'
+    return device
+
+
+class ModelEntry:
+    """一个常驻的预测器及其加载参数"""
+
+    def __init__(self, key: tuple, predictor, config: Dict[str, Any], size_bytes: int, tokenizer_key: Optional[tuple]):
+        self.key = key
+        self.predictor = predictor
+        self.config = config
+        self.size_bytes = size_bytes
+        self.tokenizer_key = tokenizer_key
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """
+    常驻模型注册表
+
+    以 (模型, 设备, 精度, 编译, 投机解码) 为键保留已加载的 KronosPredictor。加载新模型后，若常驻模型
+    占用的内存超出预算，则按最近最少使用的顺序淘汰其他模型（固定的当前模型除外）；正在执行的请求仍持有
+    被淘汰预测器的引用，其内存在请求结束后释放。同一设备上 tokenizer_id 相同的模型共享一个 tokenizer 实例，
+    只计一次内存。
+    """
+
+    def __init__(self, available_models: Dict[str, Dict[str, Any]], cache_dir: str, onnx_root: str,
+                 memory_budget_mb: Optional[float] = None, predictor_options: Optional[Dict[str, Any]] = None):
+        """
+        初始化注册表
+
+        Args:
+            available_models: models.json 中的模型配置
+            cache_dir: HuggingFace 模型缓存目录
+            onnx_root: ONNX 导出根目录，每个模型一个子目录
+            memory_budget_mb: 常驻模型的内存预算（MB），None 表示不限制
+            predictor_options: 传给 KronosPredictor 的其余参数
+        """
+        self.available_models = available_models
+        self.cache_dir = cache_dir
+        self.onnx_root = onnx_root
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.predictor_options = dict(predictor_options or {})
+        self._entries: 'OrderedDict[tuple, ModelEntry]' = OrderedDict()
+        # (tokenizer_id, device) -> (tokenizer, 字节数)
+        self._tokenizers: Dict[tuple, Tuple[Any, int]] = {}
+        self._lock = threading.Lock()
+        # 串行化加载，避免并发请求重复加载同一模型
+        self._load_lock = threading.Lock()
+        self._stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+        # 不参与淘汰的模型，即界面当前选中的模型
+        self._pinned: Optional[tuple] = None
+
+    def get(self, model_key: str, device: str = 'cpu', precision: str = 'float32', compile_model: bool = False,
+            speculative: bool = False, pin: bool = False) -> Tuple[Any, Dict[str, Any]]:
+        """
+        获取预测器，未常驻时加载
+
+        Args:
+            pin: 固定为当前模型，不被淘汰；同时取消之前固定的模型
+
+        Returns:
+            (predictor, model_config)
+
+        Raises:
+            ValueError: 模型或参数组合不受支持
+        """
+        if model_key not in self.available_models:
+            raise ValueError(f'Unknown model: {model_key}')
+        key = (model_key, resolve_device(device), precision, bool(compile_model), bool(speculative))
+        entry = self._lookup(key)
+        if entry is None:
+            with self._load_lock:
+                entry = self._lookup(key)
+                if entry is None:
+                    entry = self._load(key)
+        if pin:
+            with self._lock:
+                self._pinned = key
+        return entry.predictor, entry.config
+
+    def resolve(self, model_key: str) -> Tuple[Any, Dict[str, Any]]:
+        """
+        按模型名获取预测器：优先使用该模型最近使用的常驻实例，否则以模型的默认设备加载
+        """
+        with self._lock:
+            for key in reversed(self._entries):
+                if key[0] == model_key:
+                    entry = self._entries[key]
+                    self._touch(entry)
+                    return entry.predictor, entry.config
+        model_cfg = self.available_models.get(model_key)
+        if model_cfg is None:
+            raise ValueError(f'Unknown model: {model_key}')
+        return self.get(model_key, device=model_cfg.get('default_device', 'cpu'))
+
+    def is_resident(self, model_key: str) -> bool:
+        with self._lock:
+            return any(key[0] == model_key for key in self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取常驻模型与内存统计"""
+        with self._lock:
+            models = [
+                {
+                    'key': entry.key[0],
+                    'name': entry.config['name'],
+                    'device': entry.key[1],
+                    'precision': entry.key[2],
+                    'compiled': entry.key[3],
+                    'speculative': entry.key[4],
+                    'size_mb': round(entry.size_bytes / (1024 * 1024), 1),
+                    'pinned': entry.key == self._pinned,
+                    'last_used': entry.last_used
+                }
+                for entry in reversed(self._entries.values())
+            ]
+            total = self._total_bytes()
+            stats = dict(self._stats)
+        return dict(stats, models=models, total_mb=round(total / (1024 * 1024), 1),
+                    budget_mb=round(self.memory_budget / (1024 * 1024), 1) if self.memory_budget else None)
+
+    def _lookup(self, key: tuple) -> Optional[ModelEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch(entry)
+            return entry
+
+    def _touch(self, entry: ModelEntry):
+        self._entries.move_to_end(entry.key)
+        entry.last_used = time.time()
+        self._stats['hits'] += 1
+
+    def _total_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values()) + sum(size for _, size in self._tokenizers.values())
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        if entry.tokenizer_key and all(e.tokenizer_key != entry.tokenizer_key for e in self._entries.values()):
+            self._tokenizers.pop(entry.tokenizer_key, None)
+        log_info(f"模型已移出常驻内存: {entry.config['name']} ({entry.key[1]}, {entry.key[2]})")
+
+    def _tokenizer(self, tokenizer_id: str, device: str):
+        """获取共享的 tokenizer，同一设备上相同 tokenizer_id 只加载一次"""
+        from core.model import KronosTokenizer
+
+        tokenizer_key = (tokenizer_id, device)
+        with self._lock:
+            shared = self._tokenizers.get(tokenizer_key)
+        if shared is not None:
+            log_info(f"复用已加载的 tokenizer: {tokenizer_id}")
+            return shared[0], tokenizer_key
+        log_info(f"加载 tokenizer: {tokenizer_id}")
+        try:
+            tokenizer = KronosTokenizer.from_pretrained(tokenizer_id, cache_dir=self.cache_dir, local_files_only=False)
+        except Exception as e:
+            raise RuntimeError(f'Failed to load tokenizer: {str(e)}') from e
+        return tokenizer, tokenizer_key
+
+    def _kronos(self, model_id: str, what: str = 'model'):
+        from core.model import Kronos
+
+        log_info(f"加载模型: {model_id}")
+        try:
+            return Kronos.from_pretrained(model_id, cache_dir=self.cache_dir, local_files_only=False)
+        except Exception as e:
+            raise RuntimeError(f'Failed to load {what}: {str(e)}') from e
+
+    def _load(self, key: tuple) -> ModelEntry:
+        from core.model import KronosPredictor, PRECISIONS
+        from core.model.onnx_backend import OnnxKronosPredictor, onnx_export_exists
+        from core.model.onnx_export import export_onnx
+
+        model_key, device, precision, compile_model, speculative = key
+        model_cfg = self.available_models[model_key]
+        if precision not in PRECISIONS:
+            raise ValueError(f'Unknown precision: {precision}')
+        # 推理后端由 models.json 中每个模型的 backend 字段决定：torch（默认）或 onnx
+        backend = model_cfg.get('backend', 'torch')
+        if backend not in ('torch', 'onnx'):
+            raise ValueError(f'Unknown backend: {backend}')
+        if backend == 'onnx' and (precision != 'float32' or compile_model):
+            raise ValueError('ONNX backend only supports float32 precision without compile')
+        # BF16 autocast 与 INT8 动态量化只支持 CPU
+        if precision != 'float32' and device != 'cpu':
+            raise ValueError(f'{precision} precision is only supported on CPU')
+
+        # 投机解码：由 models.json 中 draft_model 指定的小模型起草，draft 必须与目标模型共用 tokenizer
+        draft_cfg = None
+        if speculative:
+            draft_key = model_cfg.get('draft_model')
+            if backend != 'torch' or compile_model:
+                raise ValueError('Speculative decoding requires the torch backend without compile')
+            if draft_key not in self.available_models:
+                raise ValueError(f'No draft model configured for {model_key}')
+            draft_cfg = self.available_models[draft_key]
+            if draft_cfg['tokenizer_id'] != model_cfg['tokenizer_id']:
+                raise ValueError(f'Draft model {draft_key} uses a different tokenizer')
+
+        log_info(f"加载模型: {model_cfg['name']} on {device} ({precision})")
+        onnx_dir = os.path.join(self.onnx_root, model_key)
+        # 已导出 ONNX 时无需加载 PyTorch 权重
+        need_torch = backend == 'torch' or not onnx_export_exists(onnx_dir)
+
+        tokenizer = tokenizer_key = model = draft_model = None
+        if need_torch:
+            tokenizer, tokenizer_key = self._tokenizer(model_cfg['tokenizer_id'], device)
+            model = self._kronos(model_cfg['model_id'])
+        if draft_cfg:
+            draft_model = self._kronos(draft_cfg['model_id'], 'draft model')
+        # 按加载时的 FP32 权重估算常驻内存，量化后的实际占用更小
+        size_bytes = module_bytes(model) + module_bytes(draft_model)
+
+        if backend == 'onnx':
+            if need_torch:
+                log_info(f"导出 ONNX 模型: {onnx_dir}")
+                export_onnx(tokenizer, model, onnx_dir, model_cfg['context_length'])
+            device = 'cpu'
+            # ONNX 会话不共享 tokenizer，按导出文件大小计入内存
+            tokenizer_key = None
+            size_bytes = sum(os.path.getsize(os.path.join(onnx_dir, f)) for f in os.listdir(onnx_dir))
+            predictor = OnnxKronosPredictor(onnx_dir, max_context=model_cfg['context_length'])
+        else:
+            predictor = KronosPredictor(
+                model, tokenizer,
+                device=device,
+                max_context=model_cfg['context_length'],
+                precision=precision,
+                # 编译模式会在加载时完成各批次桶的预热编译，首次加载耗时较长
+                compile_model=compile_model,
+                draft_model=draft_model,
+                **self.predictor_options
+            )
+        if predictor.precision_report:
+            # 量化模型相对 FP32 的 logits 偏移，便于判断精度损失
+            log_info(f"精度偏移报告 ({precision}): {predictor.precision_report}")
+
+        config = dict(model_cfg, device=device, precision=precision, compiled=compile_model, backend=backend, speculative=speculative)
+        entry = ModelEntry(key, predictor, config, size_bytes, tokenizer_key)
+        with self._lock:
+            if tokenizer_key is not None and tokenizer_key not in self._tokenizers:
+                self._tokenizers[tokenizer_key] = (tokenizer, module_bytes(tokenizer))
+            self._entries[key] = entry
+            self._stats['loads'] += 1
+            self._evict_over_budget(keep=key)
+        log_info(f"模型加载成功: {model_cfg['name']}")
+        return entry
+
+    def _evict_over_budget(self, keep: tuple):
+        """淘汰最近最少使用的模型，直到常驻内存回到预算内；刚加载的与固定的模型始终保留"""
+        if self.memory_budget is None:
+            return
+        for key in list(self._entries):
+            if self._total_bytes() <= self.memory_budget:
+                break
+            if key not in (keep, self._pinned):
+                self._remove(key)
+                self._stats['evictions'] += 1
+        if self._total_bytes() > self.memory_budget:
+            log_warning(f"常驻模型占用的内存超出预算: {self._total_bytes() / (1024 * 1024):.1f} MB")
@@ -0,0 +1,122 @@
+"""
+启动预加载模块
+服务启动时在后台加载默认模型并运行一次预热预测，通过就绪状态告知负载均衡何时可以接收流量
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from .logger import get_logger
+    logger = get_logger()
+except:
+    logger = None
+
+
+def log_info(msg: str):
+    if logger:
+        logger.info(msg)
+    else:
+        print(f"[INFO] {msg}")
+
+
+def log_error(msg: str):
+    if logger:
+        logger.error(msg)
+    else:
+        print(f"[ERROR] {msg}")
+
+
+class ModelPreloader:
+    """
+    启动预加载器
+
+    依次通过模型注册表加载配置的模型，并以典型的 lookback 与 pred_len 运行一次
+    合成数据预测，使首个请求无需等待下载、反序列化以及内存分配器与算子的首次初始化。
+    状态依次为 pending → loading → warming → ready；任一模型失败则为 failed。
+    """
+
+    def __init__(self, registry, models: List[Dict[str, Any]], warmup: Optional[Dict[str, int]] = None,
+                 on_loaded: Optional[Callable] = None):
+        """
+        初始化预加载器
+
+        Args:
+            registry: ModelRegistry 实例
+            models: 每个模型传给 registry.get 的参数，如 {'model_key': 'kronos-small', 'device': 'cpu'}
+            warmup: 预热预测参数 {'lookback', 'pred_len', 'sample_count'}，None 表示不预热
+            on_loaded: 第一个模型加载完成后的回调，参数为 (加载参数, predictor, model_config)
+        """
+        self.registry = registry
+        self.models = models
+        self.warmup = warmup
+        self.on_loaded = on_loaded
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status = {
+            'state': 'pending' if models else 'ready',
+            'error': None,
+            'started_at': None,
+            'ready_at': None,
+            'models': [{'key': spec['model_key'], 'state': 'pending'} for spec in models]
+        }
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._status['state'] == 'ready'
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取预加载状态"""
+        with self._lock:
+            status = dict(self._status, models=[dict(m) for m in self._status['models']])
+        status['ready'] = status['state'] == 'ready'
+        return status
+
+    def start(self) -> threading.Thread:
+        """在后台线程中执行预加载"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='ModelPreloader', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def run(self):
+        """同步执行预加载"""
+        if not self.models:
+            return
+        self._update(state='loading', started_at=time.time())
+        i = 0
+        try:
+            for i, spec in enumerate(self.models):
+                self._update(state='loading')
+                self._update_model(i, state='loading')
+                started = time.time()
+                predictor, model_config = self.registry.get(**spec)
+                self._update_model(i, state='loaded', load_seconds=round(time.time() - started, 2))
+                if i == 0 and self.on_loaded:
+                    self.on_loaded(spec, predictor, model_config)
+
+                if self.warmup:
+                    self._update(state='warming')
+                    self._update_model(i, state='warming')
+                    started = time.time()
+                    predictor.warmup(**self.warmup)
+                    self._update_model(i, state='ready', warmup_seconds=round(time.time() - started, 2))
+                else:
+                    self._update_model(i, state='ready')
+                log_info(f"预加载完成: {model_config['name']}")
+        except Exception as e:
+            log_error(f"预加载失败: {e}")
+            self._update_model(i, state='failed')
+            self._update(state='failed', error=str(e))
+            return
+        self._update(state='ready', ready_at=time.time())
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def _update_model(self, i: int, **fields):
+        with self._lock:
+            self._status['models'][i].update(fields)
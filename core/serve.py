@@ -0,0 +1,316 @@
+"""
+多进程服务入口
+主进程预加载模型后由 gunicorn fork 多个工作进程共享同一份权重（写时复制），每个进程绑定互不相交的 CPU 核心
+用法: python core/serve.py [--workers N] [--host HOST] [--port PORT]
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+import argparse
+import ctypes
+import gc
+import importlib.util
+import json
+import multiprocessing
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray, RawValue
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from core.logger import get_logger
+    logger = get_logger()
+except:
+    logger = None
+
+
+def log_info(msg: str):
+    if logger:
+        logger.info(msg)
+    else:
+        print(f"[INFO] {msg}")
+
+
+def log_error(msg: str):
+    if logger:
+        logger.error(msg)
+    else:
+        print(f"[ERROR] {msg}")
+
+
+# 心跳间隔（秒），超过 3 个间隔未更新视为无响应
+HEARTBEAT_INTERVAL = 1.0
+
+
+class WorkerSlot(ctypes.Structure):
+    """工作进程在共享内存中的健康状态，由工作进程写入，任一进程均可读取"""
+    _fields_ = [
+        ('pid', ctypes.c_int),
+        ('started_at', ctypes.c_double),
+        ('heartbeat', ctypes.c_double),
+        ('requests', ctypes.c_long),
+        ('active', ctypes.c_int),
+        ('restarts', ctypes.c_int),
+    ]
+
+
+class ModelSelection(ctypes.Structure):
+    """当前选中的模型在共享内存中的记录，由处理 /api/load-model 的工作进程写入，其余进程据此切换"""
+    _fields_ = [
+        ('generation', ctypes.c_long),
+        ('spec', ctypes.c_char * 512),
+    ]
+
+
+def partition_cores(cores: List[int], workers: int) -> List[List[int]]:
+    """
+    将可用核心划分为 workers 组互不相交的连续核心；核心数少于进程数时每个进程分得一个核心，轮流共用
+    """
+    cores = sorted(cores)
+    if len(cores) < workers:
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    size, extra = divmod(len(cores), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        n = size + (1 if i < extra else 0)
+        groups.append(cores[start:start + n])
+        start += n
+    return groups
+
+
+def available_cores() -> List[int]:
+    """当前进程可用的 CPU 核心"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class WorkerPool:
+    """
+    预 fork 工作进程池，由 gunicorn 提供服务
+
+    主进程加载应用后，gunicorn 以 preload_app 方式 fork 出 workers 个 gthread 工作进程，在同一监听套接字上
+    接受连接，工作进程退出后由 gunicorn 重启。fork 前已加载的模型权重由所有工作进程共享，只读访问不会复制
+    内存页；gc.freeze 把已有对象移出垃圾回收的跟踪范围，避免回收扫描写入对象头而复制页面。
+    每个工作进程在 post_fork 钩子中占用一个健康状态槽位，绑定该槽位的核心并设置 torch 线程数。
+    """
+
+    def __init__(self, app, host: str, port: int, workers: int, pin_cores: bool = True, threads: int = 8,
+                 timeout: int = 120):
+        """
+        初始化进程池
+
+        Args:
+            app: WSGI 应用
+            host, port: 监听地址
+            workers: 工作进程数
+            pin_cores: 是否将每个进程绑定到各自的核心并据此设置 torch 线程数
+            threads: 每个工作进程处理请求的线程数
+            timeout: 工作进程无响应多久（秒）后被 gunicorn 重启
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, int(workers))
+        self.threads = max(1, int(threads))
+        self.timeout = timeout
+        self.pin_cores = pin_cores and hasattr(os, 'sched_setaffinity')
+        self.cores = partition_cores(available_cores(), self.workers)
+        self.slots = RawArray(WorkerSlot, self.workers)
+        self.selection = RawValue(ModelSelection)
+        self._selection_lock = multiprocessing.Lock()
+        self.index: Optional[int] = None  # 当前工作进程的槽位序号，主进程中为 None
+
+    def get_status(self) -> Dict[str, Any]:
+        """各工作进程的健康状态"""
+        now = time.time()
+        workers = []
+        for i, slot in enumerate(self.slots):
+            if slot.pid == 0:
+                state = 'starting'
+            elif now - slot.heartbeat > 3 * HEARTBEAT_INTERVAL:
+                state = 'unresponsive'
+            else:
+                state = 'healthy'
+            workers.append({
+                'index': i,
+                'pid': slot.pid,
+                'state': state,
+                'cores': self.cores[i] if self.pin_cores else None,
+                'threads': len(self.cores[i]) if self.pin_cores else None,
+                'uptime': round(now - slot.started_at, 1) if slot.pid else None,
+                'heartbeat_age': round(now - slot.heartbeat, 2) if slot.pid else None,
+                'requests': slot.requests,
+                'active': slot.active,
+                'restarts': slot.restarts
+            })
+        return {
+            'mode': 'multiprocess',
+            'current': self.index,
+            'healthy': all(w['state'] == 'healthy' for w in workers),
+            'workers': workers
+        }
+
+    def select_model(self, spec: Dict[str, Any]) -> int:
+        """
+        记录新选中的模型，其他工作进程在各自的下一个请求前切换到该模型
+
+        Args:
+            spec: 模型的加载参数（model_key、device、precision 等）
+
+        Returns:
+            选择的代数，每次选择加一
+        """
+        with self._selection_lock:
+            self.selection.spec = json.dumps(spec).encode('utf-8')
+            self.selection.generation += 1
+            return self.selection.generation
+
+    def selected_model(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """(代数, 加载参数)，尚未选择过模型时为 (0, None)，即沿用主进程预加载的模型"""
+        with self._selection_lock:
+            generation, spec = self.selection.generation, self.selection.spec
+        return generation, json.loads(spec) if generation else None
+
+    def run(self):
+        """启动 gunicorn 主进程，直到收到 SIGTERM 或 SIGINT"""
+        from gunicorn.app.base import BaseApplication
+
+        pool = self
+
+        class Server(BaseApplication):
+            def load_config(self):
+                settings = {
+                    'bind': f'{pool.host}:{pool.port}',
+                    'workers': pool.workers,
+                    'worker_class': 'gthread',
+                    'threads': pool.threads,
+                    'timeout': pool.timeout,
+                    'preload_app': True,
+                    'pre_fork': pool._pre_fork,
+                    'post_fork': pool._post_fork,
+                    'worker_exit': pool._worker_exit,
+                }
+                for key, value in settings.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return pool.app
+
+        # 已有对象（包括模型）不再参与垃圾回收扫描，工作进程中保持共享
+        gc.collect()
+        gc.freeze()
+        log_info(f"启动 {self.workers} 个工作进程: http://{self.host}:{self.port}")
+        Server().run()
+        log_info("所有工作进程已退出")
+
+    def _pre_fork(self, server, worker):
+        """主进程中为即将 fork 的工作进程分配空闲槽位；重启的进程沿用退出进程的槽位"""
+        used = {getattr(w, 'slot_index', None) for w in server.WORKERS.values()}
+        free = [i for i in range(self.workers) if i not in used]
+        worker.slot_index = free[0] if free else None
+        if free and self.slots[free[0]].started_at:
+            self.slots[free[0]].restarts += 1
+
+    def _worker_exit(self, server, worker):
+        """
+        工作进程退出时跳过解释器的清理直接结束：fork 前主进程中创建的 torch 线程池在子进程中并不存在，
+        析构时等待这些线程会使进程异常终止
+        """
+        exc = sys.exc_info()[1]
+        code = exc.code if isinstance(exc, SystemExit) else 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code if isinstance(code, int) else 1)
+
+    def _post_fork(self, server, worker):
+        """工作进程启动时：绑定核心、设置线程数、统计请求并定时写入心跳"""
+        from werkzeug.wsgi import ClosingIterator
+
+        i = worker.slot_index
+        if i is None:
+            log_error(f"工作进程 (pid {os.getpid()}) 没有空闲的状态槽位，不绑定核心")
+            return
+        self.index = i
+        slot = self.slots[i]
+        slot.pid = 0
+
+        if self.pin_cores:
+            os.sched_setaffinity(0, self.cores[i])
+            try:
+                import torch
+                torch.set_num_threads(len(self.cores[i]))
+            except ImportError:
+                pass
+
+        lock = threading.Lock()
+        app = self.app.wsgi_app
+
+        def finished():
+            with lock:
+                slot.active -= 1
+
+        def counted(environ, start_response):
+            with lock:
+                slot.requests += 1
+                slot.active += 1
+            try:
+                return ClosingIterator(app(environ, start_response), finished)
+            except BaseException:
+                finished()
+                raise
+
+        self.app.wsgi_app = counted
+
+        def heartbeat():
+            while True:
+                slot.heartbeat = time.time()
+                time.sleep(HEARTBEAT_INTERVAL)
+
+        slot.started_at = slot.heartbeat = time.time()
+        slot.requests = slot.active = 0
+        threading.Thread(target=heartbeat, name='Heartbeat', daemon=True).start()
+        slot.pid = os.getpid()
+        log_info(f"工作进程 {i} (pid {slot.pid}) 已启动，核心 {self.cores[i] if self.pin_cores else '不绑定'}")
+
+
+def main():
+    """多进程服务入口：主进程预加载并预热模型，然后 fork 工作进程"""
+    from core import app as web
+
+    parser = argparse.ArgumentParser(description='Kronos Web UI multi-process server')
+    parser.add_argument('--workers', type=int, default=web.config.get('serve.workers') or 1)
+    parser.add_argument('--host', default=web.config.get('app.host', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=web.config.get('app.port', 7070))
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        log_error("当前系统不支持 fork，改为单进程启动")
+        web.main()
+        return
+    if importlib.util.find_spec('gunicorn') is None:
+        log_error("未安装 gunicorn，改为单进程启动: pip install gunicorn")
+        web.main()
+        return
+
+    # 在主进程中同步加载并预热，工作进程 fork 后直接共享
+    web.preloader.run()
+    if not web.preloader.ready:
+        log_error(f"预加载未完成: {web.preloader.get_status()['error']}，工作进程将按需加载模型")
+
+    pool = WorkerPool(web.app, args.host, args.port, args.workers, web.config.get('serve.pin_cores', True),
+                      web.config.get('serve.threads', 8), web.config.get('serve.timeout', 120))
+    web.worker_pool = pool
+    if pool.workers > 1:
+        log_info("各工作进程不共享任务队列，/api/jobs 已停用")
+    pool.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+导出 Kronos 模型为 ONNX，供 onnxruntime 后端使用
+
+用法:
+    python scripts/export_onnx.py kronos-small
+    python scripts/export_onnx.py kronos-mini --output cache/onnx/kronos-mini
+
+导出后将 config/models.json 中对应模型的 "backend" 设为 "onnx"
+"""
+
+import argparse
+import os
+import sys
+
+# 添加项目路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.config_loader import get_config
+from core.model import Kronos, KronosTokenizer
+from core.model.onnx_export import export_onnx
+
+
+def main():
+    models = get_config().get_all_models()
+    parser = argparse.ArgumentParser(description="Export Kronos tokenizer and model graphs to ONNX")
+    parser.add_argument('model_key', choices=sorted(models), help="Model key from config/models.json")
+    parser.add_argument('--output', help="Output directory (default: cache/onnx/<model_key>)")
+    args = parser.parse_args()
+
+    model_cfg = models[args.model_key]
+    output_dir = args.output or os.path.join(project_root, 'cache', 'onnx', args.model_key)
+    cache_dir = os.path.join(project_root, 'cache', 'models')
+
+    print(f"[1/2] Loading {model_cfg['name']}...")
+    tokenizer = KronosTokenizer.from_pretrained(model_cfg['tokenizer_id'], cache_dir=cache_dir)
+    model = Kronos.from_pretrained(model_cfg['model_id'], cache_dir=cache_dir)
+
+    print(f"[2/2] Exporting to {output_dir}...")
+    for name, path in export_onnx(tokenizer.eval(), model.eval(), output_dir, model_cfg['context_length']).items():
+        print(f"  {name}: {path}")
+    print()
+    print("Done")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Verify that the incremental encoder cache tracks a cold encode of each rolling window
+Covers one-bar rolls, a revised last bar and rebuilds when the window statistics shift
+Runs on randomly initialized models, no download required
+"""
+
+import os
+import sys
+
+# Add project path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import numpy as np
+import pandas as pd
+import torch
+
+from core.model import Kronos, KronosTokenizer
+from core.model.kronos import KronosPredictor
+
+# Smallest share of s1 / s2 ids that must match a cold encode of the same window
+MIN_TOKEN_AGREEMENT = 0.8
+# Largest relative gap between the greedy close forecasts with and without the cache
+FORECAST_TOLERANCE = 0.01
+LOOKBACK = 120
+PRED_LEN = 8
+ROLLS = 24
+KEY = ('verify', 'SYMBOL', '5m')
+
+print("=" * 60)
+print("Kronos Encoder Cache Verification")
+print("=" * 60)
+print()
+
+torch.manual_seed(0)
+tokenizer = KronosTokenizer(d_in=6, d_model=32, n_heads=4, ff_dim=64, n_enc_layers=2, n_dec_layers=2,
+                            ffn_dropout_p=0.0, attn_dropout_p=0.0, resid_dropout_p=0.0, s1_bits=4, s2_bits=4,
+                            beta=0.05, gamma0=1.0, gamma=1.1, zeta=0.05, group_size=4).eval()
+model = Kronos(s1_bits=4, s2_bits=4, n_layers=2, d_model=32, n_heads=4, ff_dim=64, ffn_dropout_p=0.0,
+               attn_dropout_p=0.0, resid_dropout_p=0.0, token_dropout_p=0.0, learn_te=True).eval()
+predictor = KronosPredictor(model, tokenizer, device='cpu', max_context=128, encode_cache_size=4, encode_cache_tolerance=0.05)
+cache = predictor.encode_cache
+
+rng = np.random.default_rng(0)
+close = 100 * np.exp(np.cumsum(rng.normal(0, 5e-4, LOOKBACK + ROLLS + PRED_LEN)))
+volume = rng.uniform(1e3, 2e3, len(close))
+data = np.stack([close, close * 1.001, close * 0.999, close, volume, volume * close], axis=1).astype(np.float32)
+timestamps = pd.date_range('2024-01-02', periods=len(data), freq='5min').values
+failed = False
+
+
+def check(name, ok, detail):
+    global failed
+    failed = failed or not ok
+    print(f"  [{'OK' if ok else 'X'}] {name}: {detail}")
+
+
+def cold_tokens(x):
+    """Tokens of `x` encoded from scratch, normalized with its own statistics."""
+    x_norm = np.clip((x - x.mean(axis=0)) / (x.std(axis=0) + 1e-5), -predictor.clip, predictor.clip)
+    return tokenizer.encode(torch.from_numpy(x_norm.astype(np.float32)).unsqueeze(0), half=True)
+
+
+def agreement(tokens, reference):
+    return min((t == r).float().mean().item() for t, r in zip(tokens, reference))
+
+
+def forecast(x, start, cache_key):
+    torch.manual_seed(1)
+    y_timestamp = timestamps[start + LOOKBACK:start + LOOKBACK + PRED_LEN]
+    return predictor.predict_arrays(x, timestamps[start:start + LOOKBACK], y_timestamp, PRED_LEN, T=1.0, top_k=1,
+                                    sample_count=1, verbose=False, cache_key=cache_key)[:, 3]
+
+
+with torch.no_grad():
+    print(f"[1/3] Rolling the window forward one bar at a time ({ROLLS} windows)...")
+    worst_tokens, worst_forecast = 1.0, 0.0
+    for start in range(ROLLS):
+        x = data[start:start + LOOKBACK]
+        _, _, tokens = cache.encode(KEY, x, timestamps[start:start + LOOKBACK])
+        worst_tokens = min(worst_tokens, agreement(tokens, cold_tokens(x)))
+        cold = forecast(x, start, None)
+        worst_forecast = max(worst_forecast, (np.abs(forecast(x, start, KEY) - cold) / np.abs(cold)).max())
+    check("incremental encodes", cache.stats['rebuilds'] < ROLLS // 2,
+          f"{cache.stats['rebuilds']} rebuilds, {cache.stats['encoded_bars']} bars encoded for {ROLLS} windows")
+    check("tokens match a cold encode", worst_tokens >= MIN_TOKEN_AGREEMENT,
+          f"lowest agreement {worst_tokens:.3f} (limit {MIN_TOKEN_AGREEMENT})")
+    check("forecasts match a cold encode", worst_forecast <= FORECAST_TOLERANCE,
+          f"max relative gap {worst_forecast:.4f} (limit {FORECAST_TOLERANCE})")
+
+    print("[2/3] Revising the still-open last bar...")
+    start = ROLLS - 1
+    x = data[start:start + LOOKBACK].copy()
+    x[-1, 3] *= 1.0005
+    hits = cache.stats['hits']
+    _, _, tokens = cache.encode(KEY, x, timestamps[start:start + LOOKBACK])
+    check("revised bar encoded incrementally", cache.stats['hits'] == hits + 1, "served from the cached entry")
+    score = agreement(tokens, cold_tokens(x))
+    check("tokens match a cold encode", score >= MIN_TOKEN_AGREEMENT, f"agreement {score:.3f} (limit {MIN_TOKEN_AGREEMENT})")
+
+    print("[3/3] Shifting the window statistics...")
+    x = x.copy()
+    x[-LOOKBACK // 4:, :4] *= 1.05
+    rebuilds = cache.stats['rebuilds']
+    mean, std, tokens = cache.encode(KEY, x, timestamps[start:start + LOOKBACK])
+    check("entry rebuilt", cache.stats['rebuilds'] == rebuilds + 1, f"{cache.stats['rebuilds'] - rebuilds} rebuild(s)")
+    check("statistics refreshed", np.allclose(mean, x.mean(axis=0)) and np.allclose(std, x.std(axis=0)),
+          "mean and std of the shifted window")
+    score = agreement(tokens, cold_tokens(x))
+    check("tokens equal a cold encode", score == 1.0, f"agreement {score:.3f}")
+
+print()
+print("=" * 60)
+print("Encoder cache verification FAILED" if failed else "Encoder cache verification passed")
+print("=" * 60)
+sys.exit(1 if failed else 0)
@@ -0,0 +1,54 @@
+"""
+Verify reduced-precision inference against the float32 model
+Runs on randomly initialized models, no download required
+"""
+
+import os
+import sys
+
+# Add project path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import torch
+
+from core.model import Kronos, KronosTokenizer, KronosPredictor
+
+MAX_KL = 0.05
+MIN_AGREEMENT = 0.8
+
+print("=" * 60)
+print("Kronos Precision Verification")
+print("=" * 60)
+print()
+
+torch.manual_seed(0)
+tokenizer = KronosTokenizer(d_in=6, d_model=64, n_heads=4, ff_dim=128, n_enc_layers=3, n_dec_layers=3,
+                            ffn_dropout_p=0.0, attn_dropout_p=0.0, resid_dropout_p=0.0, s1_bits=10, s2_bits=10,
+                            beta=0.05, gamma0=1.0, gamma=1.1, zeta=0.05, group_size=5).eval()
+model = Kronos(s1_bits=10, s2_bits=10, n_layers=2, d_model=64, n_heads=4, ff_dim=128, ffn_dropout_p=0.0,
+               attn_dropout_p=0.0, resid_dropout_p=0.0, token_dropout_p=0.0, learn_te=True).eval()
+failed = False
+
+
+def check(precision):
+    global failed
+    predictor = KronosPredictor(model, tokenizer, device="cpu", max_context=128, precision=precision)
+    for stage, stats in predictor.precision_report.items():
+        ok = stats['kl'] <= MAX_KL and stats['argmax_agreement'] >= MIN_AGREEMENT
+        failed = failed or not ok
+        print(f"  [{'OK' if ok else 'X'}] {stage}: KL {stats['kl']:.2e}, argmax agreement {stats['argmax_agreement']:.3f}, "
+              f"max abs logit diff {stats['max_abs_logit_diff']:.3e}")
+
+
+print("[1/2] bfloat16 autocast...")
+check("bfloat16")
+
+print("[2/2] INT8 dynamic quantization...")
+check("int8")
+
+print()
+print("=" * 60)
+print("Precision verification FAILED" if failed else "Precision verification passed")
+print("=" * 60)
+sys.exit(1 if failed else 0)
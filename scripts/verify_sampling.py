@@ -0,0 +1,109 @@
+"""
+Verify that the candidate-set samplers draw from the distribution of the reference filtering path
+Covers `sample_from_logits` and its NumPy port `sample_from_logits_np` used by the ONNX backend
+"""
+
+import os
+import sys
+
+# Add project path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from core.model.sampling import top_k_top_p_filtering, filtered_probs, sample_from_logits
+from core.model.onnx_backend import sample_from_logits_np
+
+# Largest allowed gap between a token's sampled frequency and its probability
+MAX_FREQUENCY_GAP = 0.02
+N_SAMPLES = 12000
+BATCH = 3000
+VOCAB = 512
+# (temperature, top_k, top_p); the flat row makes the nucleus exceed the initial candidate set
+CASES = ((1.0, 0, 1.0), (0.7, 0, 0.9), (1.3, 0, 0.5), (1.0, 10, 1.0), (0.8, 50, 1.0), (1.0, 20, 0.8))
+
+print("=" * 60)
+print("Kronos Sampling Verification")
+print("=" * 60)
+print()
+
+torch.manual_seed(0)
+# A peaked, a moderate and a nearly flat distribution
+logits = torch.randn(3, VOCAB) * torch.tensor([[4.0], [1.5], [0.1]])
+failed = False
+
+
+def check(name, ok, detail):
+    global failed
+    failed = failed or not ok
+    print(f"  [{'OK' if ok else 'X'}] {name}: {detail}")
+
+
+def top_k_nucleus_probs(T, top_k, top_p):
+    """
+    Top-k then nucleus distribution computed independently in NumPy: sort, keep the top-k, renormalize them,
+    then keep the tokens whose preceding mass in the renormalized top-k is at most top_p.
+    """
+    z = logits.numpy().astype(np.float64) / T
+    probs = np.exp(z - z.max(axis=-1, keepdims=True))
+    probs /= probs.sum(axis=-1, keepdims=True)
+    order = np.argsort(-probs, axis=-1, kind='stable')
+    kept = np.take_along_axis(probs, order, axis=-1)
+    kept[:, top_k:] = 0.0
+    kept /= kept.sum(axis=-1, keepdims=True)
+    kept[kept.cumsum(axis=-1) - kept > top_p] = 0.0
+    kept /= kept.sum(axis=-1, keepdims=True)
+    result = np.zeros_like(probs)
+    np.put_along_axis(result, order, kept, axis=-1)
+    return torch.from_numpy(result.astype(np.float32))
+
+
+def reference_probs(T, top_k, top_p):
+    """
+    Distribution of the filtering path kept from the original sampler. It applies either top-k or top-p,
+    so for both together `top_k_nucleus_probs` is the reference.
+    """
+    if top_k > 0 and top_p < 1.0:
+        return top_k_nucleus_probs(T, top_k, top_p)
+    if top_k <= 0 and top_p >= 1.0:
+        return F.softmax(logits / T, dim=-1)
+    return F.softmax(top_k_top_p_filtering(logits / T, top_k=top_k, top_p=top_p), dim=-1)
+
+
+def frequencies(draw):
+    counts = np.zeros((logits.size(0), VOCAB))
+    for _ in range(N_SAMPLES // BATCH):
+        ids = draw()
+        for row in range(logits.size(0)):
+            counts[row] += np.bincount(ids[row], minlength=VOCAB)
+    return counts / N_SAMPLES
+
+
+with torch.no_grad():
+    rng = np.random.default_rng(0)
+    repeated = logits.repeat_interleave(BATCH, dim=0)
+    for step, (T, top_k, top_p) in enumerate(CASES, start=1):
+        print(f"[{step}/{len(CASES)}] T={T}, top_k={top_k}, top_p={top_p}...")
+        expected = reference_probs(T, top_k, top_p).numpy()
+        gap = np.abs(filtered_probs(logits, T, top_k, top_p).numpy() - expected).max()
+        check("filtered_probs matches the reference", gap <= 1e-5, f"max abs diff {gap:.2e}")
+
+        samplers = (
+            ('sample_from_logits', lambda: sample_from_logits(repeated, T, top_k, top_p).view(logits.size(0), BATCH).numpy()),
+            ('sample_from_logits_np', lambda: sample_from_logits_np(repeated.numpy(), rng, T, top_k, top_p).reshape(logits.size(0), BATCH)),
+        )
+        for name, draw in samplers:
+            freq = frequencies(draw)
+            gap = np.abs(freq - expected).max()
+            outside = freq[expected == 0].sum()
+            check(name, gap <= MAX_FREQUENCY_GAP and outside == 0,
+                  f"max frequency gap {gap:.4f} (limit {MAX_FREQUENCY_GAP}), mass outside support {outside:.4f}")
+
+print()
+print("=" * 60)
+print("Sampling verification FAILED" if failed else "Sampling verification passed")
+print("=" * 60)
+sys.exit(1 if failed else 0)
@@ -0,0 +1,98 @@
+"""
+Verify that speculative decoding keeps the sampling distribution of the target model
+Runs on randomly initialized models, no download required
+"""
+
+import os
+import sys
+
+# Add project path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import numpy as np
+import torch
+
+from core.model import Kronos, KronosTokenizer
+from core.model.kronos import auto_regressive_inference
+from core.model.module import reserve_rotary_tables
+
+GREEDY_TOLERANCE = 1e-4
+# Largest allowed gap between token frequencies of plain and speculative sampling
+MAX_FREQUENCY_GAP = 0.04
+N_SAMPLES = 8000
+BITS = 2
+
+print("=" * 60)
+print("Kronos Speculative Decoding Verification")
+print("=" * 60)
+print()
+
+
+def make_model(seed):
+    torch.manual_seed(seed)
+    return Kronos(s1_bits=BITS, s2_bits=BITS, n_layers=2, d_model=32, n_heads=4, ff_dim=64, ffn_dropout_p=0.0,
+                  attn_dropout_p=0.0, resid_dropout_p=0.0, token_dropout_p=0.0, learn_te=True).eval()
+
+
+torch.manual_seed(0)
+tokenizer = KronosTokenizer(d_in=6, d_model=32, n_heads=4, ff_dim=64, n_enc_layers=2, n_dec_layers=2,
+                            ffn_dropout_p=0.0, attn_dropout_p=0.0, resid_dropout_p=0.0, s1_bits=BITS, s2_bits=BITS,
+                            beta=0.05, gamma0=1.0, gamma=1.1, zeta=0.05, group_size=4).eval()
+model, draft = make_model(1), make_model(2)
+for module in (tokenizer, model, draft):
+    reserve_rotary_tables(module, 64)
+failed = False
+
+
+def generated_tokens(x, x_stamp, y_stamp, max_context, pred_len, **kwargs):
+    """Runs generation and returns the sampled (s1, s2) ids instead of the decoded series."""
+    captured = {}
+    decode = tokenizer.decode
+
+    def capture(ids, half=False, **decode_kwargs):
+        captured['ids'] = [t.clone() for t in ids]
+        return decode(ids, half, **decode_kwargs)
+
+    tokenizer.decode = capture
+    try:
+        auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, max_context, pred_len, **kwargs)
+    finally:
+        tokenizer.decode = decode
+    return [ids[:, -pred_len:].numpy() for ids in captured['ids']]
+
+
+with torch.no_grad():
+    print("[1/2] Greedy decoding with a sliding window...")
+    x = torch.randn(2, 40, 6)
+    x_stamp = torch.randint(0, 5, (2, 40, 5)).float()
+    y_stamp = torch.randint(0, 5, (2, 24, 5)).float()
+    kwargs = dict(T=1.0, top_k=1, top_p=1.0, sample_count=2)
+    reference = auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, 48, 24, **kwargs)
+    speculative = auto_regressive_inference(tokenizer, model, x, x_stamp, y_stamp, 48, 24, draft_model=draft,
+                                            draft_tokens=3, **kwargs)
+    diff = np.abs(reference - speculative).max()
+    ok = diff <= GREEDY_TOLERANCE
+    failed = failed or not ok
+    print(f"  [{'OK' if ok else 'X'}] decoded series: max abs diff {diff:.3e}")
+
+    print("[2/2] Token frequencies under top-p sampling...")
+    x, x_stamp, y_stamp = x[:1, :30], x_stamp[:1, :30], y_stamp[:1, :6]
+    kwargs = dict(T=1.0, top_k=0, top_p=0.9, sample_count=N_SAMPLES)
+    torch.manual_seed(0)
+    reference = generated_tokens(x, x_stamp, y_stamp, 64, 6, **kwargs)
+    torch.manual_seed(1)
+    speculative = generated_tokens(x, x_stamp, y_stamp, 64, 6, draft_model=draft, draft_tokens=3, **kwargs)
+    vocab = 2 ** BITS
+    for name, ref_ids, spec_ids in zip(('s1', 's2'), reference, speculative):
+        gap = max(np.abs(np.bincount(ref_ids[:, t], minlength=vocab) - np.bincount(spec_ids[:, t], minlength=vocab)).max()
+                  for t in range(ref_ids.shape[1])) / N_SAMPLES
+        ok = gap <= MAX_FREQUENCY_GAP
+        failed = failed or not ok
+        print(f"  [{'OK' if ok else 'X'}] {name} frequencies: max gap {gap:.4f} (limit {MAX_FREQUENCY_GAP})")
+
+print()
+print("=" * 60)
+print("Speculative decoding verification FAILED" if failed else "Speculative decoding verification passed")
+print("=" * 60)
+sys.exit(1 if failed else 0)